@@ -17,7 +17,10 @@ Endpoints:
 import os
 from flask import Blueprint, jsonify, request
 from core import db as database
-from core.utils import get_equity_date, get_quotes_batch
+from core import execution
+from core import holdings
+from core import order_book
+from core.utils import get_equity_date, get_quotes_batch, apply_quote_fallback
 from core.auth import admin_required, login_required_api
 
 bp = Blueprint('account', __name__)
@@ -29,8 +32,8 @@ def _compute_market_value(account, positions, as_of_date=None):
     """
     Compute position value and total from quotes (ZuiLow). Sim/live same logic.
     as_of_date is not passed to zuilow; zuilow returns EOD in sim, current in live.
-    Fallback: watchlist last_price, then cost.
-    Returns (position_value, total_value, pnl, pnl_pct).
+    Fallback: watchlist last_price, then cost (DMS down / breaker open / budget exceeded).
+    Returns (position_value, total_value, pnl, pnl_pct, quote_fallback {symbol: 'watchlist' | 'cost'}).
     """
     cash = float(account['cash'])
     initial = float(account['initial_capital'])
@@ -39,15 +42,11 @@ def _compute_market_value(account, positions, as_of_date=None):
         position_value = 0.0
         pnl = total_value - initial
         pnl_pct = (pnl / initial) * 100 if initial > 0 else 0.0
-        return position_value, total_value, pnl, pnl_pct
+        return position_value, total_value, pnl, pnl_pct, {}
 
     symbols = list(positions.keys())
     quotes = get_quotes_batch(symbols)
-    watchlist = {w['symbol']: w for w in database.get_watchlist()}
-    for sym in symbols:
-        q = quotes.get(sym, {})
-        if (q.get('price', 0) <= 0 or not q.get('valid', True)) and watchlist.get(sym) and (watchlist[sym].get('last_price') or 0) > 0:
-            quotes[sym] = {'symbol': sym, 'price': watchlist[sym]['last_price'], 'valid': True}
+    quote_fallback = apply_quote_fallback(quotes, symbols, positions)
 
     position_value = 0.0
     for sym, pos in positions.items():
@@ -66,7 +65,7 @@ def _compute_market_value(account, positions, as_of_date=None):
     total_value = cash + position_value
     pnl = total_value - initial
     pnl_pct = (pnl / initial) * 100 if initial > 0 else 0.0
-    return position_value, total_value, pnl, pnl_pct
+    return position_value, total_value, pnl, pnl_pct, quote_fallback
 
 
 @bp.route('/api/accounts', methods=['GET'])
@@ -78,13 +77,14 @@ def list_accounts():
     accounts = []
     for acc in database.get_all_accounts():
         positions = database.get_positions(acc['name'])
-        _, total_value, pnl, pnl_pct = _compute_market_value(acc, positions, as_of_date)
+        _, total_value, pnl, pnl_pct, quote_fallback = _compute_market_value(acc, positions, as_of_date)
         accounts.append({
             'name': acc['name'],
             'total_value': round(total_value, 2),
             'pnl': round(pnl, 2),
             'pnl_pct': round(pnl_pct, 2),
-            'is_current': acc['name'] == current
+            'is_current': acc['name'] == current,
+            'quote_fallback': quote_fallback,
         })
     return jsonify({'accounts': accounts, 'current': current})
 
@@ -105,6 +105,7 @@ def create_new_account():
     as_of = get_equity_date()
     database.create_account(name, capital, as_of_date=as_of)
     database.set_current_account(name)
+    holdings.refresh_account(name)
 
     return jsonify({'status': 'ok', 'message': f'Account {name} created', 'current': name})
 
@@ -135,7 +136,12 @@ def delete_account_api(name):
     if len(all_accounts) <= 1:
         return jsonify({'error': 'At least one account required'}), 400
 
-    database.delete_account(name)
+    # 与成交同一把账户锁: 进行中的成交先完成, 之后的成交看到账户已删除
+    with execution.account_lock(name):
+        with database.transaction():
+            database.delete_account(name)
+        order_book.forget_account(name)
+        holdings.refresh_account(name)
 
     if database.get_current_account_name() == name:
         remaining = [a for a in all_accounts if a['name'] != name]
@@ -155,7 +161,7 @@ def get_account_api():
         return jsonify({'error': f'Account not found: {account_name}'}), 400
     positions = database.get_positions(account_name)
     as_of_date = get_equity_date()
-    position_value, total_value, pnl, pnl_pct = _compute_market_value(account, positions, as_of_date)
+    position_value, total_value, pnl, pnl_pct, quote_fallback = _compute_market_value(account, positions, as_of_date)
     cost_stats = database.get_account_cost_stats(account_name)
 
     return jsonify({
@@ -167,6 +173,7 @@ def get_account_api():
         'pnl': round(pnl, 2),
         'pnl_pct': round(pnl_pct, 2),
         'created_at': account['created_at'],
+        'quote_fallback': quote_fallback,
         'cost_stats': {
             'total_commission': round(cost_stats['total_commission'], 2),
             'total_slippage': round(cost_stats['total_slippage'], 2),
@@ -190,11 +197,15 @@ def deposit_cash():
     if amount <= 0:
         return jsonify({'error': 'Deposit amount must be > 0'}), 400
     account_name = database.get_current_account_name()
-    account = database.get_account(account_name)
-    if not account:
-        return jsonify({'error': 'Account not found'}), 400
-    new_cash = float(account['cash']) + amount
-    database.update_account_cash(account_name, new_cash)
+    # 读改写在账户锁 + 事务内, 与同账户的成交 (webhook / 延迟成交 / 挂单 / 净额) 不会互相覆盖
+    with execution.account_lock(account_name):
+        with database.transaction():
+            account = database.get_account(account_name)
+            if not account:
+                return jsonify({'error': 'Account not found'}), 400
+            new_cash = float(account['cash']) + amount
+            database.update_account_cash(account_name, new_cash)
+        holdings.refresh_account(account_name)
     return jsonify({
         'status': 'ok',
         'message': f'Deposited {amount:.2f}',
@@ -217,14 +228,17 @@ def withdraw_cash():
     if amount <= 0:
         return jsonify({'error': 'Withdraw amount must be > 0'}), 400
     account_name = database.get_current_account_name()
-    account = database.get_account(account_name)
-    if not account:
-        return jsonify({'error': 'Account not found'}), 400
-    cash = float(account['cash'])
-    if cash < amount:
-        return jsonify({'error': f'Insufficient cash: {cash:.2f}'}), 400
-    new_cash = cash - amount
-    database.update_account_cash(account_name, new_cash)
+    with execution.account_lock(account_name):
+        with database.transaction():
+            account = database.get_account(account_name)
+            if not account:
+                return jsonify({'error': 'Account not found'}), 400
+            cash = float(account['cash'])
+            if cash < amount:
+                return jsonify({'error': f'Insufficient cash: {cash:.2f}'}), 400
+            new_cash = cash - amount
+            database.update_account_cash(account_name, new_cash)
+        holdings.refresh_account(account_name)
     return jsonify({
         'status': 'ok',
         'message': f'Withdrew {amount:.2f}',
@@ -237,13 +251,18 @@ def withdraw_cash():
 def reset_account_api():
     """Reset current account: clear positions/orders/trades/equity history, set cash to initial (admin)."""
     account_name = database.get_current_account_name()
-    account = database.get_account(account_name)
-
     data = request.get_json(silent=True) or {}
-    capital = data.get('capital', account['initial_capital'])
-
     as_of = get_equity_date()
-    database.reset_account(account_name, capital, as_of_date=as_of)
+
+    with execution.account_lock(account_name):
+        with database.transaction():
+            account = database.get_account(account_name)
+            if not account:
+                return jsonify({'error': 'Account not found'}), 400
+            capital = data.get('capital', account['initial_capital'])
+            database.reset_account(account_name, capital, as_of_date=as_of)
+        order_book.forget_account(account_name)
+        holdings.refresh_account(account_name)
 
     return jsonify({'status': 'ok', 'message': f'Account {account_name} reset, initial capital: {capital}'})
 
@@ -16,7 +16,7 @@ from flask import Blueprint, jsonify, request
 from core import db as database
 from core import analytics
 from core import simulation
-from core.utils import get_quotes_batch
+from core.utils import get_quotes_batch, apply_quote_fallback
 from core.auth import admin_required, login_required_api
 
 bp = Blueprint('analytics_api', __name__)
@@ -55,6 +55,7 @@ def get_analytics():
     if request.args.get('realtime', 'false').lower() == 'true':
         if positions:
             quotes = get_quotes_batch(list(positions.keys()))
+            apply_quote_fallback(quotes, positions.keys())
     else:
         watchlist = {w['symbol']: w for w in database.get_watchlist()}
         for symbol in positions.keys():
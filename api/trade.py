@@ -1,17 +1,24 @@
 """
 Trading and quotes API: positions, quote(s), orders, place order, trades, equity history, export CSV.
 
-Used for: PPT web UI and clients; sim/live same logic; place order uses simulation.execute_order.
+Used for: PPT web UI and clients; sim/live same logic; place order uses execution.execute_order (one transaction).
 
 Endpoints:
     GET  /api/positions       Get positions (login)
     GET  /api/quote/<symbol>  Single quote (login)
     GET  /api/quotes          Batch quotes (login)
-    GET  /api/orders          Order history (login)
-    POST /api/orders          Place order (admin)
-    GET  /api/trades          Trades (login)
+    GET  /api/orders          Order history, keyset pages: before_id/after_id, symbol/side/source, start/end (login)
+    POST /api/orders          Place order (admin); 202 + pending order when latency simulation defers the fill;
+                              type limit/stop/stop_limit (limit_price, stop_price, tif GTC/DAY) -> 202 + working order
+    POST /api/orders/batch    Basket of market orders (admin): {orders: [{symbol, side, qty, price?}], all_or_none};
+                              one transaction, per-leg results (execution.execute_basket)
+    GET  /api/orders/<id>     One order with fill status (pending / filled / partial / rejected) (login)
+    GET  /api/orders/working  Resting limit/stop orders; status=working (default) | all | filled | cancelled ... (login)
+    GET  /api/orders/working/<id>     One resting order (login)
+    DELETE /api/orders/working/<id>   Cancel a resting order (admin)
+    GET  /api/trades          Trades, keyset pages: before_id/after_id, symbol/side, start/end (login)
     GET  /api/equity          Equity history (login)
-    POST /api/equity/update   Update equity (admin)
+    POST /api/equity/update   Update equity of all accounts in one valuation pass (admin); timings_ms per stage
     GET  /api/export/trades   Export trades CSV (login)
     GET  /api/export/equity   Export equity CSV (login)
 """
@@ -19,8 +26,10 @@ import os
 from datetime import datetime
 from flask import Blueprint, jsonify, request, Response
 from core import db as database
-from core import simulation
-from core.utils import get_quote, get_quotes_batch, normalize_symbol, get_equity_date, get_current_datetime_iso, is_sim_mode
+from core import execution
+from core import order_book
+from core.equity import value_all_accounts
+from core.utils import get_quote, get_quotes_batch, apply_quote_fallback, normalize_symbol, get_equity_date, get_current_datetime_iso, is_sim_mode
 from core.auth import admin_required, login_required_api
 
 bp = Blueprint('trade', __name__)
@@ -38,6 +47,12 @@ def get_positions_api():
 
     watchlist = {w['symbol']: w for w in database.get_watchlist()}
 
+    quotes, quote_fallback = {}, {}
+    if realtime and db_positions:
+        # one batch (one latency budget) for all positions; invalid -> watchlist last_price
+        quotes = get_quotes_batch(list(db_positions.keys()))
+        quote_fallback = apply_quote_fallback(quotes, db_positions.keys(), watchlist=watchlist)
+
     positions = []
     total_cost = 0
     total_market_value = 0
@@ -56,14 +71,14 @@ def get_positions_api():
 
         current_price = 0
         if realtime:
-            quote = get_quote(symbol)
+            quote = quotes.get(symbol) or {}
             current_price = quote.get('price', 0) if quote.get('valid', False) else 0
-            if current_price > 0:
+            if symbol in quote_fallback:
+                item['quote_fallback'] = quote_fallback[symbol]
+            elif current_price > 0:
                 if symbol not in watchlist:
                     database.add_to_watchlist(symbol, quote.get('name', symbol))
                 database.update_watchlist_quote(symbol, current_price, quote.get('name', symbol))
-            elif symbol in watchlist and (watchlist[symbol].get('last_price') or 0) > 0:
-                current_price = watchlist[symbol]['last_price']
         else:
             if symbol in watchlist and watchlist[symbol].get('last_price'):
                 current_price = watchlist[symbol]['last_price']
@@ -121,22 +136,88 @@ def get_multi_quotes():
     return jsonify({'quotes': quotes})
 
 
+def _history_page_args(default_limit: int, max_limit: int):
+    """
+    Parse keyset pagination query args shared by /api/orders and /api/trades.
+    Returns (kwargs for database.query_*, error or None).
+    """
+    args = request.args
+    try:
+        limit = min(max(int(args.get('limit', default_limit)), 1), max_limit)
+        before_id = int(args['before_id']) if args.get('before_id') else None
+        after_id = int(args['after_id']) if args.get('after_id') else None
+    except ValueError:
+        return None, 'limit/before_id/after_id must be integers'
+    if before_id is not None and after_id is not None:
+        return None, 'Use either before_id or after_id'
+    symbol = (args.get('symbol') or '').strip()
+    side = (args.get('side') or '').strip().lower()
+    return {
+        'limit': limit,
+        'before_id': before_id,
+        'after_id': after_id,
+        'symbol': normalize_symbol(symbol) if symbol else None,
+        'side': side or None,
+        'start_time': (args.get('start') or '').strip() or None,
+        'end_time': (args.get('end') or '').strip() or None,
+    }, None
+
+
+def _history_page_response(key: str, rows: list, page: dict):
+    """Rows plus the cursor for the next page (next_before_id when walking back, next_after_id when forward)."""
+    out = {key: rows}
+    if len(rows) == page['limit']:
+        if page['after_id'] is not None:
+            out['next_after_id'] = rows[-1]['id']
+        else:
+            out['next_before_id'] = rows[-1]['id']
+    return jsonify(out)
+
+
 @bp.route('/api/orders', methods=['GET'])
 @login_required_api
 def get_orders_api():
-    """Get order history. Optional query: account=<name>; else current account."""
+    """
+    Get order history (keyset pagination). Optional query: account=<name> (else current account),
+    limit, before_id | after_id, symbol, side, source, start, end (ISO time range).
+    """
     account_name = (request.args.get('account') or '').strip() or database.get_current_account_name()
     if not database.get_account(account_name):
         return jsonify({'error': f'Account not found: {account_name}'}), 400
-    limit = min(max(int(request.args.get('limit', 50)), 1), 200)
-    orders = database.get_orders(account_name, limit=limit)
-    return jsonify({'orders': orders})
+    page, error = _history_page_args(50, 200)
+    if error:
+        return jsonify({'error': error}), 400
+    source = (request.args.get('source') or '').strip() or None
+    orders = database.query_orders(account_name, source=source, **page)
+    return _history_page_response('orders', orders, page)
+
+
+def _request_order_time():
+    """Order time: X-Simulation-Time header, else sim clock in sim mode, else None (now)."""
+    order_time = None
+    sim_header = request.headers.get('X-Simulation-Time', '').strip()
+    if sim_header:
+        try:
+            s = sim_header.replace('Z', '+00:00') if sim_header.endswith('Z') else sim_header
+            order_time = datetime.fromisoformat(s)
+        except ValueError:
+            pass
+    if is_sim_mode() and order_time is None:
+        try:
+            s = get_current_datetime_iso().replace('Z', '+00:00')
+            order_time = datetime.fromisoformat(s)
+        except (ValueError, TypeError):
+            pass
+    return order_time
 
 
 @bp.route('/api/orders', methods=['POST'])
 @admin_required
 def place_order():
-    """Place order (admin; simulation: slippage, commission, partial fill)."""
+    """
+    Place order (admin; simulation: slippage, commission, partial fill).
+    type: market (default, fills at price) | limit | stop | stop_limit (rest in core.order_book until a quote crosses).
+    """
     data = request.json
     if not data:
         return jsonify({'error': 'Order data required'}), 400
@@ -144,120 +225,189 @@ def place_order():
     symbol = normalize_symbol(data.get('symbol', ''))
     side = data.get('side', '').lower()
     qty = int(data.get('qty', 0))
-    price = float(data.get('price', 0))
+    price = float(data.get('price') or 0)
+    order_type = (data.get('type') or data.get('order_type') or 'market').lower()
 
-    if not all([symbol, side in ['buy', 'sell'], qty > 0, price > 0]):
+    if order_type == 'market' and not all([symbol, side in ['buy', 'sell'], qty > 0, price > 0]):
         return jsonify({'error': 'Invalid: symbol, side(buy/sell), qty, price'}), 400
+    if order_type != 'market' and not all([symbol, side in ['buy', 'sell'], qty > 0]):
+        return jsonify({'error': 'Invalid: symbol, side(buy/sell), qty'}), 400
 
     account_name = database.get_current_account_name()
-    account = database.get_account(account_name)
+    order_time = _request_order_time()
 
-    order_time = None
-    sim_header = request.headers.get('X-Simulation-Time', '').strip()
-    if sim_header:
+    if order_type != 'market':
         try:
-            s = sim_header.replace('Z', '+00:00') if sim_header.endswith('Z') else sim_header
-            order_time = datetime.fromisoformat(s)
-        except ValueError:
-            pass
-    if is_sim_mode() and order_time is None:
+            working = order_book.place(account_name, symbol, side, qty, order_type,
+                                       limit_price=float(data.get('limit_price') or price or 0) or None,
+                                       stop_price=float(data.get('stop_price') or 0) or None,
+                                       tif=data.get('tif') or 'GTC', source='web', order_time=order_time)
+        except (execution.OrderError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'status': 'working', 'order': working}), 202
+
+    try:
+        result = execution.execute_order(account_name, symbol, side, qty, price, source='web', order_time=order_time)
+    except execution.OrderError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if result.get('pending'):
+        return jsonify({
+            'status': 'pending',
+            'order': result['order'],
+            'due_in_ms': result['due_in_ms'],
+            'cash': result['cash']
+        }), 202
+
+    return jsonify({
+        'status': 'ok',
+        'order': result['order'],
+        'simulation': result['simulation'],
+        'cash': result['cash']
+    })
+
+
+@bp.route('/api/orders/batch', methods=['POST'])
+@admin_required
+def place_order_batch():
+    """
+    Place a basket of market orders for the current account in one transaction.
+    Body: {"orders": [{"symbol", "side", "qty", "price"}], "all_or_none": false}; price omitted -> one batch quote.
+    Cash / positions are checked once over the whole basket (sells first); a leg that does not fit is rejected on
+    its own, or with all_or_none the whole basket is rejected (400, nothing written). Latency simulation is skipped.
+    """
+    data = request.json
+    legs_in = data.get('orders') if isinstance(data, dict) else data
+    if not isinstance(legs_in, list) or not legs_in:
+        return jsonify({'error': 'orders required'}), 400
+    all_or_none = bool(data.get('all_or_none')) if isinstance(data, dict) else False
+
+    results, legs, index = [None] * len(legs_in), [], []
+    for i, item in enumerate(legs_in):
+        item = item if isinstance(item, dict) else {}
         try:
-            s = get_current_datetime_iso().replace('Z', '+00:00')
-            order_time = datetime.fromisoformat(s)
-        except (ValueError, TypeError):
-            pass
+            leg = {'symbol': normalize_symbol(item.get('symbol', '')), 'side': (item.get('side') or '').lower(),
+                   'qty': int(item.get('qty', 0)), 'price': float(item.get('price') or 0)}
+        except (TypeError, ValueError):
+            leg = None
+        if not leg or not all([leg['symbol'], leg['side'] in ['buy', 'sell'], leg['qty'] > 0]):
+            results[i] = {'index': i, 'status': 'rejected', 'error': 'Invalid: symbol, side(buy/sell), qty'}
+            continue
+        legs.append(leg)
+        index.append(i)
+
+    missing = sorted({leg['symbol'] for leg in legs if leg['price'] <= 0})
+    quotes = get_quotes_batch(missing) if missing else {}
+    priced_legs, priced_index = [], []
+    for leg, i in zip(legs, index):
+        if leg['price'] <= 0:
+            quote = quotes.get(leg['symbol']) or {}
+            if not quote.get('valid', False) or (quote.get('price') or 0) <= 0:
+                results[i] = {'index': i, 'status': 'rejected', 'symbol': leg['symbol'], 'side': leg['side'],
+                              'error': f'No price: {quote.get("error", "quote unavailable")}'}
+                continue
+            leg['price'] = float(quote['price'])
+        priced_legs.append(leg)
+        priced_index.append(i)
 
-    sim_result = simulation.simulate_execution(symbol, side, qty, price)
-
-    filled_qty = sim_result['filled_qty']
-    exec_price = sim_result['exec_price']
-    commission = sim_result['commission']
-    filled_value = sim_result['filled_value']
-    total_cost = sim_result['total_cost']
-
-    if side == 'buy':
-        if total_cost > account['cash']:
-            return jsonify({
-                'error': f'Insufficient cash: need {total_cost:.2f} (incl commission {commission:.2f}), available {account["cash"]:.2f}'
-            }), 400
-
-        new_cash = account['cash'] - total_cost
-        database.update_account_cash(account_name, new_cash)
-
-        pos = database.get_position(account_name, symbol)
-        if pos:
-            old_qty = pos['qty']
-            old_value = old_qty * pos['avg_price']
-            new_qty = old_qty + filled_qty
-            new_avg_price = (old_value + filled_value) / new_qty
-            database.update_position(account_name, symbol, new_qty, new_avg_price)
-        else:
-            database.update_position(account_name, symbol, filled_qty, exec_price)
+    account_name = database.get_current_account_name()
+    if all_or_none and any(results):
+        for leg, i in zip(priced_legs, priced_index):
+            results[i] = {'index': i, 'status': 'cancelled', 'symbol': leg['symbol'], 'side': leg['side']}
+        return jsonify({'error': 'Basket rejected (all_or_none)', 'legs': results}), 400
+
+    cash = None
+    if priced_legs:
+        try:
+            basket = execution.execute_basket(account_name, priced_legs, source='web', order_time=_request_order_time(),
+                                              all_or_none=all_or_none)
+        except execution.BasketError as e:
+            for leg, i in zip(e.legs, priced_index):
+                results[i] = {**leg, 'index': i}
+            return jsonify({'error': str(e), 'legs': results}), 400
+        except execution.OrderError as e:
+            return jsonify({'error': str(e)}), 400
+        cash = basket['cash']
+        for leg, i in zip(basket['legs'], priced_index):
+            results[i] = {**leg, 'index': i}
+
+    if cash is None:
+        # 没有可成交的腿: 现金取自账户 (校验之后账户可能已被删除)
+        account = database.get_account(account_name)
+        if not account:
+            return jsonify({'error': f'Account not found: {account_name}'}), 400
+        cash = round(account['cash'], 2)
+
+    filled = sum(1 for r in results if r['status'] in ('filled', 'partial'))
+    return jsonify({
+        'status': 'ok' if filled == len(results) else ('partial' if filled else 'rejected'),
+        'legs': results,
+        'filled': filled,
+        'rejected': len(results) - filled,
+        'cash': cash,
+    })
 
-    elif side == 'sell':
-        pos = database.get_position(account_name, symbol)
-        if not pos or pos['qty'] < filled_qty:
-            return jsonify({'error': f'Insufficient position: {symbol}'}), 400
 
-        new_qty = pos['qty'] - filled_qty
-        database.update_position(account_name, symbol, new_qty, pos['avg_price'])
+@bp.route('/api/orders/<int:order_id>', methods=['GET'])
+@login_required_api
+def get_order_api(order_id):
+    """Get one order (poll deferred fills: status pending -> filled/partial/rejected)."""
+    order = database.get_order(order_id)
+    if not order:
+        return jsonify({'error': f'Order not found: {order_id}'}), 404
+    return jsonify({'order': order})
 
-        new_cash = account['cash'] + total_cost
-        database.update_account_cash(account_name, new_cash)
 
-    slippage_cost = (sim_result.get('slippage') or 0) * filled_qty
-    realized_pnl = 0.0
-    if side == 'sell' and pos is not None:
-        realized_pnl = (exec_price - pos['avg_price']) * filled_qty
+@bp.route('/api/orders/working', methods=['GET'])
+@login_required_api
+def get_working_orders_api():
+    """Resting orders. Optional query: account=<name> (else current account), status=working (default) | all | ..."""
+    account_name = (request.args.get('account') or '').strip() or database.get_current_account_name()
+    if not database.get_account(account_name):
+        return jsonify({'error': f'Account not found: {account_name}'}), 400
+    status = (request.args.get('status') or 'working').strip().lower()
+    orders = database.list_working_orders(account_name, status=None if status == 'all' else status)
+    return jsonify({'orders': orders})
 
-    status = 'partial' if sim_result['partial_fill'] else 'filled'
-    order_id = database.add_order(account_name, symbol, side, filled_qty, exec_price, status, 'web', order_time=order_time)
-    database.add_trade(account_name, symbol, side, filled_qty, exec_price, order_time=order_time,
-                      commission=commission, slippage=slippage_cost, realized_pnl=realized_pnl)
-    database.add_to_watchlist(symbol, symbol)
-    database.update_watchlist_quote(symbol, exec_price)
 
-    as_of = order_time.date() if order_time else None
-    if not is_sim_mode():
-        database.update_equity_history(account_name, as_of_date=as_of)
+@bp.route('/api/orders/working/<int:order_id>', methods=['GET'])
+@login_required_api
+def get_working_order_api(order_id):
+    """One resting order (status working / filled / cancelled / expired / rejected, remaining_qty)."""
+    order = database.get_working_order(order_id)
+    if not order:
+        return jsonify({'error': f'Order not found: {order_id}'}), 404
+    return jsonify({'order': order})
 
-    updated_account = database.get_account(account_name)
 
-    time_str = (order_time.isoformat() if order_time else get_current_datetime_iso())
-    return jsonify({
-        'status': 'ok',
-        'order': {
-            'id': order_id,
-            'symbol': symbol,
-            'side': side,
-            'requested_qty': qty,
-            'filled_qty': filled_qty,
-            'requested_price': price,
-            'exec_price': exec_price,
-            'value': filled_value,
-            'time': time_str,
-            'status': status
-        },
-        'simulation': {
-            'slippage': sim_result['slippage'],
-            'commission': commission,
-            'fill_rate': sim_result['fill_rate'],
-            'total_cost': total_cost
-        },
-        'cash': round(updated_account['cash'], 2)
-    })
+@bp.route('/api/orders/working/<int:order_id>', methods=['DELETE'])
+@admin_required
+def cancel_working_order_api(order_id):
+    """Cancel a resting order (admin)."""
+    try:
+        order = order_book.cancel(order_id)
+    except execution.OrderError as e:
+        return jsonify({'error': str(e)}), 400
+    if not order:
+        return jsonify({'error': f'Order not found: {order_id}'}), 404
+    return jsonify({'status': 'ok', 'order': order})
 
 
 @bp.route('/api/trades', methods=['GET'])
 @login_required_api
 def get_trades_api():
-    """Get trades. Optional query: account=<name>; else current account."""
+    """
+    Get trades (keyset pagination). Optional query: account=<name> (else current account),
+    limit, before_id | after_id, symbol, side, start, end (ISO time range).
+    """
     account_name = (request.args.get('account') or '').strip() or database.get_current_account_name()
     if not database.get_account(account_name):
         return jsonify({'error': f'Account not found: {account_name}'}), 400
-    limit = min(max(int(request.args.get('limit', 100)), 1), 500)
-    trades = database.get_trades(account_name, limit=limit)
-    return jsonify({'trades': trades})
+    page, error = _history_page_args(100, 500)
+    if error:
+        return jsonify({'error': error}), 400
+    trades = database.query_trades(account_name, **page)
+    return _history_page_response('trades', trades, page)
 
 
 @bp.route('/api/equity', methods=['GET'])
@@ -276,43 +426,22 @@ def get_equity_history_api():
 @bp.route('/api/equity/update', methods=['POST'])
 @admin_required
 def update_equity_with_market_price():
-    """Update today equity with market price (admin). In sim mode use stime date (get_equity_date() fetches if needed)."""
-    as_of_date = get_equity_date()
-    results = []
-    failed_symbols = []
-
-    for acc in database.get_all_accounts():
-        account_name = acc['name']
-        positions = database.get_positions(account_name)
-
-        if not positions:
-            database.update_equity_history(account_name, as_of_date=as_of_date)
-            results.append({'account': account_name, 'status': 'ok', 'positions': 0})
-            continue
-
-        symbols = list(positions.keys())
-        quotes = get_quotes_batch(symbols)
-        watchlist = {w['symbol']: w for w in database.get_watchlist()}
-        for symbol in symbols:
-            q = quotes.get(symbol, {})
-            if (q.get('price', 0) <= 0 or not q.get('valid', True)) and watchlist.get(symbol) and (watchlist[symbol].get('last_price') or 0) > 0:
-                quotes[symbol] = {'symbol': symbol, 'price': watchlist[symbol]['last_price'], 'valid': True}
-            if (quotes.get(symbol) or {}).get('price', 0) <= 0 or not (quotes.get(symbol) or {}).get('valid', True):
-                failed_symbols.append(symbol)
-
-        database.update_equity_history(account_name, quotes=quotes, as_of_date=as_of_date)
-
-        results.append({
-            'account': account_name,
-            'status': 'ok',
-            'positions': len(positions),
-            'quote_failed': [s for s in symbols if s in failed_symbols]
-        })
+    """Update today equity with market price (admin). In sim mode use stime date (get_equity_date() fetches if needed).
+    One valuation pass over all accounts (core.equity.value_all_accounts): one quote fetch, one write transaction."""
+    valuation = value_all_accounts(as_of_date=get_equity_date(), include_empty=True, skip_before_first_day=False)
+    results = [{
+        'account': acc['account'],
+        'status': 'ok',
+        'positions': acc['positions'],
+        'quote_failed': acc['quote_failed'],
+        'quote_fallback': acc['quote_fallback'],
+    } for acc in valuation['accounts']]
 
     return jsonify({
         'message': f'Updated {len(results)} accounts',
         'results': results,
-        'failed_symbols': list(set(failed_symbols)),
+        'failed_symbols': valuation['failed_symbols'],
+        'timings_ms': valuation['timings_ms'],
         'tip': 'Failed symbols use cost price'
     })
 
@@ -320,19 +449,16 @@ def update_equity_with_market_price():
 @bp.route('/api/export/trades', methods=['GET'])
 @login_required_api
 def export_trades_csv():
-    """Export trades CSV."""
+    """Export trades CSV (full history, newest first; streamed in keyset batches)."""
     account_name = database.get_current_account_name()
-    trades = database.get_trades(account_name, limit=10000)
 
-    lines = ['time,symbol,side,qty,price,value']
-
-    for t in trades:
-        lines.append(f"{t['time']},{t['symbol']},{t['side']},{t['qty']},{t['price']:.2f},{t['value']:.2f}")
-
-    csv_content = '\n'.join(lines)
+    def generate():
+        yield 'time,symbol,side,qty,price,value'
+        for t in database.iter_trades(account_name, descending=True):
+            yield f"\n{t['time']},{t['symbol']},{t['side']},{t['qty']},{t['price']:.2f},{t['value']:.2f}"
 
     return Response(
-        csv_content,
+        generate(),
         mimetype='text/csv',
         headers={'Content-Disposition': f'attachment;filename=trades_{account_name}_{get_equity_date().strftime("%Y%m%d")}.csv'}
     )
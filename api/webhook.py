@@ -2,13 +2,26 @@
 Webhook API: receive external trading signals; POST /api/webhook; optional X-Simulation-Time header for sim mode.
 
 Used for: zuilow (or other clients) forward orders; when X-Simulation-Time set, order/trade time uses that; optional WEBHOOK_TOKEN.
+A JSON array of signals (or {"orders": [...]}) is one basket: one transaction, per-leg results (execution.execute_basket).
+Async mode (WEBHOOK_ASYNC=1 or ?async=1): validate, queue (core.signal_queue) and answer 202 + signal id at once;
+GET /api/webhook/<id> returns the signal status and, when processed, the same result body as the synchronous call.
+Idempotency-Key header (or idempotency_key field): a retry with the same key gets the stored response back
+(header Idempotent-Replayed: true) instead of another fill (core.idempotency).
+Netting window (WEBHOOK_NETTING_MS > 0): synchronous market signals of one account within the window are netted
+per symbol and filled as one basket; each signal still gets its own response (core.netting).
+Socket.IO: 'trade' for every fill, 'pnl' for every account the holdings index revalues (core.holdings).
 """
 import os
 from datetime import datetime
 from flask import Blueprint, jsonify, request
 from core import db as database
-from core import simulation
-from core.utils import normalize_symbol, get_current_datetime_iso, is_sim_mode, get_quote
+from core import execution
+from core import holdings
+from core import idempotency
+from core import netting
+from core import order_book
+from core import signal_queue
+from core.utils import normalize_symbol, get_current_datetime_iso, is_sim_mode, get_quote, get_quotes_batch
 
 bp = Blueprint('webhook', __name__)
 
@@ -25,12 +38,58 @@ def _parse_sim_time(header_value: str):
     except ValueError:
         return None
 
+def _parse_signal(data: dict):
+    """Normalize one signal (standard / TradingView / minimal) -> (symbol, side, qty, price, order_type); ValueError."""
+    symbol = normalize_symbol(data.get('symbol') or data.get('ticker') or '')
+    side = (data.get('side') or data.get('action') or '').lower()
+    qty = int(data.get('qty') or data.get('contracts') or data.get('quantity') or 100)
+    price = float(data.get('price') or data.get('limit_price') or 0)
+    order_type = (data.get('type') or data.get('order_type') or 'market').lower()
+
+    if side in ['long', 'buy_to_open', 'buy']:
+        side = 'buy'
+    elif side in ['short', 'sell_to_close', 'sell', 'close']:
+        side = 'sell'
+
+    if not symbol:
+        raise ValueError('symbol required')
+    if side not in ['buy', 'sell']:
+        raise ValueError(f'Invalid side: {side}, need buy/sell')
+    return symbol, side, qty, price, order_type
+
+WEBHOOK_ASYNC = os.getenv('WEBHOOK_ASYNC', '0').strip().lower() in ('1', 'true', 'yes')
+# 取价失败 (DMS 未配置 / 不可用 / 熔断): 暂时性错误, 幂等键不保存该结果
+_QUOTE_ERROR = 'Market order requires quote'
+
 socketio = None
 
 def init_socketio(sio):
-    """Set SocketIO reference (called from app.py)."""
+    """Set SocketIO reference (called from app.py); deferred fills are pushed as 'trade' events too."""
     global socketio
     socketio = sio
+    execution.add_fill_listener(_emit_deferred_fill)
+    holdings.add_pnl_listener(_emit_pnl)
+    signal_queue.set_handler(process_signal)
+
+
+def _emit_deferred_fill(event):
+    """Fill executor callback: same 'trade' payload as an immediate fill (rejections carry status/error)."""
+    if socketio:
+        socketio.emit('trade', {**event['order'], 'simulation': event.get('simulation'), 'account': event['account']})
+
+
+def _emit_pnl(event):
+    """Holdings index callback: incremental P&L of one account after a quote or fill."""
+    if socketio:
+        socketio.emit('pnl', event)
+
+
+def _authorized(data) -> bool:
+    webhook_token = os.getenv('WEBHOOK_TOKEN')
+    if not webhook_token:
+        return True
+    token = request.headers.get('X-Webhook-Token') or (data.get('token') if isinstance(data, dict) else None)
+    return token == webhook_token
 
 
 @bp.route('/api/webhook', methods=['POST'])
@@ -42,139 +101,262 @@ def webhook():
     1. Standard: {"symbol": "AAPL", "side": "buy", "qty": 100, "price": 185}
     2. TradingView: {"ticker": "AAPL", "action": "buy", "contracts": 100, "price": 185}
     3. Minimal: {"symbol": "AAPL", "action": "buy"} (default qty/price)
+    4. Resting: {"symbol": "AAPL", "side": "buy", "qty": 100, "type": "limit", "limit_price": 180, "tif": "DAY"}
+       type limit | stop | stop_limit (stop_price); rests in the order book -> 202 + working order
+    5. Basket: [signal, ...] or {"orders": [signal, ...], "account": ..., "all_or_none": false}
+       market signals of one account filled in one transaction -> per-leg results (see _webhook_basket)
 
     Optional: account (target account), token (if WEBHOOK_TOKEN set).
+    Async (WEBHOOK_ASYNC=1, or query async=1 / async=0 per request): 202 {"status": "queued", "signal_id": ...}.
+    Idempotency-Key header or idempotency_key field: same key + same payload -> stored response (no new fill);
+    same key + different payload -> 422; same key while the first request still runs -> 409. Only final outcomes
+    are stored: 5xx and quote failures (nothing filled) release the key, so the retry runs again.
     """
-    webhook_token = os.getenv('WEBHOOK_TOKEN')
-    if webhook_token:
-        token = request.headers.get('X-Webhook-Token') or request.json.get('token')
-        if token != webhook_token:
-            return jsonify({'error': 'Unauthorized'}), 401
-
     data = request.json
+    if not _authorized(data):
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    key = request.headers.get('Idempotency-Key') or (data.get('idempotency_key') if isinstance(data, dict) else None)
+    if not key:
+        result, http_status = _accept(data)
+        return jsonify(result), http_status
+    key = str(key).strip()
+    if not key or len(key) > idempotency.MAX_KEY_LENGTH:
+        return jsonify({'error': f'Idempotency-Key must be 1-{idempotency.MAX_KEY_LENGTH} characters'}), 400
+
+    store = idempotency.get_store()
+    fp = idempotency.fingerprint(_strip_meta(data))
+    state, stored = store.begin(key, fp)
+    if state == idempotency.REPLAY:
+        response = jsonify(stored[0])
+        response.headers['Idempotent-Replayed'] = 'true'
+        return response, stored[1]
+    if state == idempotency.IN_PROGRESS:
+        return jsonify({'error': f'Request with Idempotency-Key {key} is still in progress'}), 409
+    if state == idempotency.MISMATCH:
+        return jsonify({'error': f'Idempotency-Key {key} was used with a different payload'}), 422
+    try:
+        result, http_status = _accept(data)
+    except Exception:
+        store.abandon(key)
+        raise
+    if _retryable(result, http_status):
+        store.abandon(key)  # 非最终结果: 不保存, 同一 key 的重试会重新执行
+    else:
+        store.finish(key, fp, result, http_status)
+    return jsonify(result), http_status
+
+
+def _retryable(result, http_status: int) -> bool:
+    """Outcome a retry may change: server errors (5xx, netting timeout) and quote failures with nothing filled."""
+    if http_status >= 500:
+        return True
+    if not isinstance(result, dict):
+        return False
+    legs = result.get('legs')
+    if legs:
+        return (not any(leg.get('status') in ('filled', 'partial') for leg in legs)
+                and any(str(leg.get('error', '')).startswith(_QUOTE_ERROR) for leg in legs))
+    return str(result.get('error', '')).startswith(_QUOTE_ERROR)
+
+
+def _strip_meta(data):
+    """Payload without transport fields (token, idempotency_key)."""
+    if isinstance(data, dict):
+        return {k: v for k, v in data.items() if k not in ('token', 'idempotency_key')}
+    return data
+
+
+def _accept(data):
+    """Validate, then execute (sync) or queue (async) one webhook payload -> (response body, http status)."""
     if not data:
-        return jsonify({'error': 'Data required'}), 400
+        return {'error': 'Data required'}, 400
+    basket = isinstance(data, list) or isinstance(data.get('orders'), list)
+    if not basket:
+        try:
+            _parse_signal(data)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+    elif not (data if isinstance(data, list) else data['orders']):
+        return {'error': 'orders required'}, 400
+
+    account_name = (data.get('account') if isinstance(data, dict) else None) or database.get_current_account_name()
+    if not database.get_account(account_name):
+        return {'error': f'Account not found: {account_name}'}, 400
 
-    symbol = normalize_symbol(data.get('symbol') or data.get('ticker') or '')
-    side = (data.get('side') or data.get('action') or '').lower()
-    qty = int(data.get('qty') or data.get('contracts') or data.get('quantity') or 100)
-    price = float(data.get('price') or data.get('limit_price') or 0)
+    order_time = _parse_sim_time(request.headers.get('X-Simulation-Time', ''))
+    if is_sim_mode() and order_time is None:
+        order_time = _parse_sim_time(get_current_datetime_iso())
 
-    if side in ['long', 'buy_to_open', 'buy']:
-        side = 'buy'
-    elif side in ['short', 'sell_to_close', 'sell', 'close']:
-        side = 'sell'
+    use_async = request.args.get('async')
+    use_async = WEBHOOK_ASYNC if use_async is None else use_async.strip().lower() in ('1', 'true', 'yes')
+    if use_async:
+        signal_id = signal_queue.enqueue(account_name, _strip_meta(data), order_time)
+        return {'status': 'queued', 'signal_id': signal_id, 'account': account_name,
+                'status_url': f'/api/webhook/{signal_id}'}, 202
 
-    if not symbol:
-        return jsonify({'error': 'symbol required'}), 400
-    if side not in ['buy', 'sell']:
-        return jsonify({'error': f'Invalid side: {side}, need buy/sell'}), 400
+    return process_signal(data, account_name, order_time, net=True)
+
+
+@bp.route('/api/webhook/<int:signal_id>', methods=['GET'])
+def webhook_status(signal_id):
+    """Queued signal status: queued / processing / done / rejected / failed; result = synchronous response body."""
+    if not _authorized(None):
+        return jsonify({'error': 'Unauthorized'}), 401
+    signal = signal_queue.get_signal(signal_id)
+    if not signal:
+        return jsonify({'error': f'Signal not found: {signal_id}'}), 404
+    return jsonify({
+        'id': signal['id'],
+        'status': signal['status'],
+        'account': signal['account_name'],
+        'order_time': signal['order_time'],
+        'created_at': signal['created_at'],
+        'started_at': signal['started_at'],
+        'completed_at': signal['completed_at'],
+        'http_status': signal['http_status'],
+        'result': signal['result'],
+        'error': signal['error'],
+    })
+
+
+def process_signal(data, account_name: str, order_time, net: bool = False):
+    """Execute one validated signal or basket for account_name -> (response body, http status). Request-free:
+    used by the synchronous webhook and by the signal_queue workers. net: market signals go through the netting
+    window when enabled (synchronous path; queue workers run one account serially, a window would only add delay)."""
+    if isinstance(data, list) or isinstance(data.get('orders'), list):
+        return _webhook_basket(data, account_name, order_time)
+
+    try:
+        symbol, side, qty, price, order_type = _parse_signal(data)
+    except ValueError as e:
+        return {'error': str(e)}, 400
     # price <= 0: treat as market order; resolve price from quote (ZuiLow)
-    if price <= 0:
-        quote = get_quote(symbol)
+    if price <= 0 and order_type == 'market':
+        quote = get_quote(symbol, allow_stale=False)
         if not quote.get('valid', False) or (quote.get('price') or 0) <= 0:
-            return jsonify({'error': f'Market order requires quote; {quote.get("error", "no price")}'}), 400
+            return {'error': f'{_QUOTE_ERROR}; {quote.get("error", "no price")}'}, 400
         price = float(quote['price'])
 
-    account_name = data.get('account') or database.get_current_account_name()
-    account = database.get_account(account_name)
-    if not account:
-        return jsonify({'error': f'Account not found: {account_name}'}), 400
+    if order_type != 'market':
+        try:
+            working = order_book.place(account_name, symbol, side, qty, order_type,
+                                       limit_price=float(data.get('limit_price') or price or 0) or None,
+                                       stop_price=float(data.get('stop_price') or 0) or None,
+                                       tif=data.get('tif') or 'GTC', source='webhook', order_time=order_time,
+                                       clamp_sell=True)
+        except (execution.OrderError, ValueError) as e:
+            return {'error': str(e)}, 400
+        return {'status': 'working', 'order': working, 'account': account_name}, 202
 
-    order_time = _parse_sim_time(request.headers.get('X-Simulation-Time', ''))
-    if is_sim_mode() and order_time is None:
-        order_time = _parse_sim_time(get_current_datetime_iso())
+    if net and netting.is_enabled():
+        return netting.submit(account_name, symbol, side, qty, price, order_time=order_time)
 
-    sim_result = simulation.simulate_execution(symbol, side, qty, price)
-
-    filled_qty = sim_result['filled_qty']
-    exec_price = sim_result['exec_price']
-    commission = sim_result['commission']
-    filled_value = sim_result['filled_value']
-    total_cost = sim_result['total_cost']
-
-    if side == 'buy':
-        if total_cost > account['cash']:
-            return jsonify({
-                'error': f'Insufficient cash: need {total_cost:.2f} (incl commission {commission:.2f}), available {account["cash"]:.2f}'
-            }), 400
-
-        new_cash = account['cash'] - total_cost
-        database.update_account_cash(account_name, new_cash)
-
-        pos = database.get_position(account_name, symbol)
-        if pos:
-            old_qty = pos['qty']
-            old_value = old_qty * pos['avg_price']
-            new_qty = old_qty + filled_qty
-            new_avg_price = (old_value + filled_value) / new_qty
-            database.update_position(account_name, symbol, new_qty, new_avg_price)
-        else:
-            database.update_position(account_name, symbol, filled_qty, exec_price)
-
-    elif side == 'sell':
-        pos = database.get_position(account_name, symbol)
-        if not pos:
-            return jsonify({'error': f'No position: {symbol}'}), 400
-
-        if pos['qty'] < filled_qty:
-            filled_qty = pos['qty']
-            filled_value = filled_qty * exec_price
-            total_cost = filled_value - commission
-
-        new_qty = pos['qty'] - filled_qty
-        database.update_position(account_name, symbol, new_qty, pos['avg_price'])
-
-        new_cash = account['cash'] + total_cost
-        database.update_account_cash(account_name, new_cash)
-
-    slippage_cost = (sim_result.get('slippage') or 0) * filled_qty
-    realized_pnl = 0.0
-    if side == 'sell' and pos is not None:
-        realized_pnl = (exec_price - pos['avg_price']) * filled_qty
-
-    status = 'partial' if sim_result['partial_fill'] else 'filled'
-    order_id = database.add_order(account_name, symbol, side, filled_qty, exec_price, status, 'webhook', order_time=order_time)
-    database.add_trade(account_name, symbol, side, filled_qty, exec_price, order_time=order_time,
-                      commission=commission, slippage=slippage_cost, realized_pnl=realized_pnl)
-    database.add_to_watchlist(symbol, symbol)
-    database.update_watchlist_quote(symbol, exec_price)
-
-    as_of = order_time.date() if order_time else None
-    if not is_sim_mode():
-        database.update_equity_history(account_name, as_of_date=as_of)
-
-    updated_account = database.get_account(account_name)
-
-    time_str = (order_time.isoformat() if order_time else get_current_datetime_iso())
-    order = {
-        'id': order_id,
-        'symbol': symbol,
-        'side': side,
-        'requested_qty': qty,
-        'filled_qty': filled_qty,
-        'requested_price': price,
-        'exec_price': exec_price,
-        'value': filled_value,
-        'time': time_str,
-        'status': status,
-        'source': 'webhook'
-    }
-
-    sim_info = {
-        'slippage': sim_result['slippage'],
-        'commission': commission,
-        'fill_rate': sim_result['fill_rate'],
-        'total_cost': total_cost
-    }
+    try:
+        result = execution.execute_order(account_name, symbol, side, qty, price, source='webhook',
+                                         order_time=order_time, clamp_sell=True)
+    except execution.OrderError as e:
+        return {'error': str(e)}, 400
+
+    if result.get('pending'):
+        return {
+            'status': 'pending',
+            'order': {**result['order'], 'source': 'webhook'},
+            'due_in_ms': result['due_in_ms'],
+            'account': account_name,
+        }, 202
+
+    order = {**result['order'], 'source': 'webhook'}
+    sim_info = result['simulation']
 
     if socketio:
         socketio.emit('trade', {**order, 'simulation': sim_info})
 
-    return jsonify({
+    return {
         'status': 'ok',
         'order': order,
         'simulation': sim_info,
         'account': account_name,
-        'cash': round(updated_account['cash'], 2)
-    })
+        'cash': result['cash']
+    }, 200
+
+
+def _webhook_basket(data, account_name: str, order_time):
+    """
+    Basket of market signals for one account: invalid legs and legs without a quote are rejected per leg, the rest
+    go to execution.execute_basket (clamp_sell, one transaction).
+    Missing prices are resolved with one get_quotes_batch call. all_or_none: any rejected leg -> 400, nothing filled.
+    """
+    signals = data if isinstance(data, list) else data['orders']
+    options = data if isinstance(data, dict) else {}
+    all_or_none = bool(options.get('all_or_none'))
+
+    results, legs, index = [None] * len(signals), [], []
+    for i, item in enumerate(signals):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError('signal must be an object')
+            symbol, side, qty, price, order_type = _parse_signal(item)
+            if order_type != 'market':
+                raise ValueError(f'Basket legs must be market orders, got {order_type}')
+        except ValueError as e:
+            results[i] = {'index': i, 'status': 'rejected', 'error': str(e)}
+            continue
+        legs.append({'symbol': symbol, 'side': side, 'qty': qty, 'price': price})
+        index.append(i)
+
+    # price <= 0: 一次批量取价 (同单笔信号的市价单)
+    missing = sorted({leg['symbol'] for leg in legs if leg['price'] <= 0})
+    quotes = get_quotes_batch(missing) if missing else {}
+    priced_legs, priced_index = [], []
+    for leg, i in zip(legs, index):
+        if leg['price'] <= 0:
+            quote = quotes.get(leg['symbol']) or {}
+            if not quote.get('valid', False) or (quote.get('price') or 0) <= 0:
+                results[i] = {'index': i, 'status': 'rejected', 'symbol': leg['symbol'], 'side': leg['side'],
+                              'error': f'{_QUOTE_ERROR}; {quote.get("error", "no price")}'}
+                continue
+            leg['price'] = float(quote['price'])
+        priced_legs.append(leg)
+        priced_index.append(i)
+
+    if all_or_none and any(results):
+        for leg, i in zip(priced_legs, priced_index):
+            results[i] = {'index': i, 'status': 'cancelled', 'symbol': leg['symbol'], 'side': leg['side']}
+        return {'error': 'Basket rejected (all_or_none)', 'legs': results, 'account': account_name}, 400
+
+    cash = None
+    if priced_legs:
+        try:
+            basket = execution.execute_basket(account_name, priced_legs, source='webhook', order_time=order_time,
+                                              clamp_sell=True, all_or_none=all_or_none)
+        except execution.BasketError as e:
+            for leg, i in zip(e.legs, priced_index):
+                results[i] = {**leg, 'index': i}
+            return {'error': str(e), 'legs': results, 'account': account_name}, 400
+        except execution.OrderError as e:
+            return {'error': str(e)}, 400
+        cash = basket['cash']
+        for leg, i in zip(basket['legs'], priced_index):
+            if 'order' in leg:
+                leg['order'] = {**leg['order'], 'source': 'webhook'}
+                if socketio:
+                    socketio.emit('trade', {**leg['order'], 'simulation': leg['simulation']})
+            results[i] = {**leg, 'index': i}
+
+    if cash is None:
+        # 没有可成交的腿: 现金取自账户 (异步队列里账户可能在校验之后被删除)
+        account = database.get_account(account_name)
+        if not account:
+            return {'error': f'Account not found: {account_name}', 'account': account_name}, 400
+        cash = round(account['cash'], 2)
+
+    filled = sum(1 for r in results if r['status'] in ('filled', 'partial'))
+    return {
+        'status': 'ok' if filled == len(results) else ('partial' if filled else 'rejected'),
+        'legs': results,
+        'filled': filled,
+        'rejected': len(results) - filled,
+        'account': account_name,
+        'cash': cash,
+    }, 200
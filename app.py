@@ -76,9 +76,22 @@ STATIC_DIR = Path(__file__).parent / 'static'
 # ============================================================
 
 from core import db as database
-from core.utils import get_quotes_batch
+from core import execution
+from core import simulation
+from core import quote_cache
+from core import dms_client
+from core import bar_cache
+from core import order_book
+from core import holdings
+from core import signal_queue
+from core import idempotency
+from core import netting
+from core.equity import update_all_accounts_equity
 from core.auth import init_login_manager, authenticate
 
+# Schema migrations + default account/watchlist (once per process)
+database.init_db()
+
 init_login_manager(app)
 
 # ============================================================
@@ -89,45 +102,24 @@ from api import all_blueprints
 from api import webhook
 
 webhook.init_socketio(socketio)
+# Deferred fills (latency simulation): re-queue fills left pending by a previous process
+execution.start_fill_executor()
+# Async webhook queue: re-queue signals accepted by a previous process
+signal_queue.start()
+# Idempotency keys: release claims of requests interrupted by the previous process
+idempotency.start()
+# Resting limit/stop orders: rebuild books from working_orders, evaluate on every quote
+order_book.start()
+# Live mark-to-market: symbol -> holders index, revalue holders on every quote (Socket.IO 'pnl')
+holdings.start()
+# Simulation config hot reload (mtime watcher); only the app watches, replay / sweep keep their config
+simulation.start_watcher()
 
 #
 for bp in all_blueprints:
     app.register_blueprint(bp)
 
 
-# ============================================================
-# Equity update (shared)
-# ============================================================
-
-def _update_all_accounts_equity():
-    """Update equity for all accounts. Uses get_equity_date() (sim or real). Skips dates before account first day."""
-    dms_base = (os.getenv('DMS_BASE_URL') or '').strip().rstrip('/')
-    date_for_db = core_utils.get_equity_date()
-    date_str = date_for_db.isoformat()
-    watchlist = {w['symbol']: w for w in database.get_watchlist()}
-    for acc in database.get_all_accounts():
-        min_date = database.get_min_equity_date(acc['name'])
-        if min_date and date_str < min_date:
-            logging.debug("[Tick] skip account=%s as_of=%s before first day %s", acc['name'], date_str, min_date)
-            continue
-        positions = database.get_positions(acc['name'])
-        symbols = list(positions.keys()) if positions else []
-        if not symbols:
-            continue
-        quotes = get_quotes_batch(symbols) if dms_base else {}
-        for sym in symbols:
-            q = quotes.get(sym, {})
-            if (q.get('price', 0) <= 0 or not q.get('valid', True)) and watchlist.get(sym) and (watchlist[sym].get('last_price') or 0) > 0:
-                quotes[sym] = {'symbol': sym, 'price': watchlist[sym]['last_price'], 'valid': True}
-            q2 = quotes.get(sym, {})
-            logging.info("[Tick] quote result: account=%s date=%s symbol=%s price=%s valid=%s error=%s",
-                         acc['name'], date_str, sym, q2.get('price'), q2.get('valid', True), q2.get('error'))
-        if quotes:
-            database.update_equity_history(acc['name'], quotes=quotes, as_of_date=date_for_db)
-        else:
-            database.update_equity_history(acc['name'], as_of_date=date_for_db)
-
-
 # ============================================================
 # Scheduler: only register jobs in real time; no jobs in sim mode
 # ============================================================
@@ -153,7 +145,7 @@ def setup_scheduler():
         def _job_equity():
             logging.info("[Scheduler] Starting equity update %s", core_utils.get_current_datetime_iso())
             try:
-                _update_all_accounts_equity()
+                update_all_accounts_equity()
                 logging.info("[Scheduler] Equity update done")
             except Exception as e:
                 logging.exception("[Scheduler] Equity update failed: %s", e)
@@ -311,7 +303,8 @@ def api_sim_now():
 @app.route('/api/scheduler/tick', methods=['POST'])
 def api_scheduler_tick():
     """
-    Sim tick: called by stime after advance; updates all account equity by sim time.
+    Sim tick: called by stime after advance; fills resting limit/stop orders the tick's quotes cross (core.order_book),
+    then updates all account equity by sim time.
     Header X-Simulation-Time: ISO time (same as webhook); if missing, try stime GET /now.
     When DMS_BASE_URL is set, quotes from DMS (last bar). Optional auth: WEBHOOK_TOKEN / X-Webhook-Token.
     """
@@ -331,6 +324,8 @@ def api_scheduler_tick():
         # else: get_current_datetime_iso() uses ctrl, which fetches stime when tick context is empty
 
         now_iso = core_utils.get_current_datetime_iso()
+        # resting orders: every tick (fills before the equity update)
+        orders = order_book.on_tick(now_iso)
         as_of_date = datetime.fromisoformat(now_iso.replace('Z', '+00:00')).date()
         date_str = as_of_date.isoformat()
         global _tick_equity_done_dates
@@ -338,13 +333,13 @@ def api_scheduler_tick():
             _tick_equity_done_dates = set(database.get_equity_history_dates())
         if date_str in _tick_equity_done_dates:
             logging.debug("[Tick] as_of_date=%s already updated, skip", date_str)
-            out = {'ok': True, 'as_of_date': date_str, 'skipped': True, 'as_of': now_iso}
+            out = {'ok': True, 'as_of_date': date_str, 'skipped': True, 'as_of': now_iso, 'orders': orders}
             return jsonify(out)
         logging.info("[Tick] POST /api/scheduler/tick as_of=%s", now_iso)
-        _update_all_accounts_equity()
+        update_all_accounts_equity()
         _tick_equity_done_dates.add(date_str)
         logging.info("[Tick] equity updated as_of=%s", now_iso)
-        out = {'ok': True, 'as_of_date': date_str, 'as_of': now_iso}
+        out = {'ok': True, 'as_of_date': date_str, 'as_of': now_iso, 'orders': orders}
         return jsonify(out)
     except Exception as e:
         logging.exception("scheduler/tick failed: %s", e)
@@ -353,11 +348,23 @@ def api_scheduler_tick():
 
 @app.route('/api/health')
 def health():
-    """Health check endpoint"""
+    """Health check endpoint (includes DB connection pool and account lock stats)."""
     return jsonify({
         'status': 'healthy',
         'service': 'paper-trade',
-        'version': '2.0.0'
+        'version': '2.0.0',
+        'db_pool': database.get_pool_stats(),
+        'account_locks': execution.get_lock_stats(),
+        'fill_queue': execution.get_fill_queue_stats(),
+        'quote_cache': quote_cache.get_cache_stats(),
+        'dms_client': dms_client.get_client_stats(),
+        'quote_single_flight': core_utils.get_single_flight_stats(),
+        'bar_cache': bar_cache.get_bar_cache_stats(),
+        'order_book': order_book.get_book_stats(),
+        'holdings': holdings.get_holdings_stats(),
+        'webhook_queue': signal_queue.get_queue_stats(),
+        'idempotency': idempotency.get_idempotency_stats(),
+        'netting': netting.get_netting_stats(),
     })
 
 
@@ -377,14 +384,16 @@ def info():
             '/api/account': 'GET - current account',
             '/api/account/reset': 'POST - reset current account',
             '/api/positions': 'GET - positions',
-            '/api/orders': 'GET - orders / POST - place order',
+            '/api/orders': 'GET - orders / POST - place order (market / limit / stop / stop_limit)',
+            '/api/orders/working': 'GET - resting orders / DELETE /<id> - cancel',
             '/api/trades': 'GET - trades',
             '/api/equity': 'GET - equity history',
             '/api/scheduler/tick': 'POST - sim tick (stime, X-Simulation-Time)',
             '/api/watchlist': 'Watchlist',
             '/api/analytics': 'Analytics',
             '/api/simulation': 'Simulation config',
-            '/api/webhook': 'POST - Webhook',
+            '/api/webhook': 'POST - Webhook (async: 202 + signal_id)',
+            '/api/webhook/<id>': 'GET - queued webhook signal status',
             '/api/ots/history': 'GET - OTS history',
             '/api/ots/detail/<date>': 'GET - OTS detail by date',
             '/api/ots/record/<date>': 'GET - OTS record file',
@@ -0,0 +1,74 @@
+"""
+Benchmark: N market orders of one account via execute_order (one transaction each) vs one execute_basket.
+
+Used for: sizing rebalance baskets (POST /api/orders/batch, webhook arrays) and checking that a basket of buys
+leaves the same cash / positions as the same orders placed one by one (same account seed stream).
+
+Usage:
+    python bench/bench_basket.py [--legs 500] [--symbols 50] [--rounds 5]
+
+Output: ms per round for each path, speedup, and identical=True/False (cash and positions after every round).
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+_tmp = tempfile.mkdtemp(prefix='ppt_bench_basket_')
+os.environ['DB_FILE'] = os.path.join(_tmp, 'bench.db')
+os.environ.pop('SIMULATION_MODE', None)
+os.environ.pop('SIMULATION_TIME_URL', None)
+
+import logging
+logging.disable(logging.INFO)
+
+from core import db as database
+from core import execution
+from core import simulation
+
+
+def _state(name):
+    return round(database.get_account(name)['cash'], 6), database.get_positions(name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--legs', type=int, default=500)
+    parser.add_argument('--symbols', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    config = dict(simulation.get_config())
+    config['latency'] = {'enabled': False}
+    simulation.set_config(config)
+    database.init_db()
+    database.create_account('single', 100_000_000)
+    database.create_account('basket', 100_000_000)
+    # 两个账户用同一种子流, 才能逐笔比较成交
+    database.set_account_rng('basket', simulation.account_seed('single'), 0)
+
+    legs = [{'symbol': f'US.S{i % args.symbols}', 'side': 'buy', 'qty': 10 + i % 7, 'price': 50 + i % 40}
+            for i in range(args.legs)]
+    t_single = t_basket = 0.0
+    identical = True
+    for _ in range(args.rounds):
+        start = time.perf_counter()
+        for leg in legs:
+            execution.execute_order('single', leg['symbol'], leg['side'], leg['qty'], leg['price'])
+        t_single += time.perf_counter() - start
+        start = time.perf_counter()
+        execution.execute_basket('basket', legs)
+        t_basket += time.perf_counter() - start
+        identical = identical and _state('single') == _state('basket')
+
+    print(f"db={os.environ['DB_FILE']} legs={args.legs} symbols={args.symbols} rounds={args.rounds}")
+    print(f"execute_order x{args.legs}: {t_single / args.rounds * 1e3:9.1f} ms/round")
+    print(f"execute_basket:      {t_basket / args.rounds * 1e3:9.1f} ms/round  speedup={t_single / t_basket:.1f}x")
+    print(f"identical={identical}")
+
+
+if __name__ == '__main__':
+    main()
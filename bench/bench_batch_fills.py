@@ -0,0 +1,82 @@
+"""
+Benchmark: core.simulation.simulate_execution (per order) vs simulate_execution_batch (NumPy, one pass).
+
+Used for: sizing basket fills (core.execution.execute_basket) and offline runs, and checking that both paths produce
+identical fills: with one shared rng, and with per-order seeds (order_rng(seed), as core.execution fills orders).
+
+Usage:
+    python bench/bench_batch_fills.py [--orders 200000] [--seed 42] [--slippage random] [--partial-fill]
+
+Output: seconds and orders/s for each path, speedup, and identical=True/False (every field of every fill, and the
+rng state afterwards; for the seeded paths every field of every fill).
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+from core import simulation
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=200_000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--slippage', default='random', choices=['percentage', 'fixed', 'random'])
+    parser.add_argument('--partial-fill', action='store_true')
+    args = parser.parse_args()
+
+    config = dict(simulation.get_config())
+    config['slippage'] = {'enabled': True, 'mode': args.slippage, 'value': 0.05}
+    config['partial_fill'] = {'enabled': args.partial_fill, 'threshold': 10000, 'min_fill_rate': 0.3, 'max_fill_rate': 1.0}
+    config['latency'] = {'enabled': False}
+    simulation.set_config(config)
+
+    gen = np.random.default_rng(args.seed)
+    n = args.orders
+    qtys = gen.integers(1, 5000, n)
+    prices = gen.uniform(1, 500, n).round(2)
+    sides = np.where(gen.random(n) < 0.5, 'buy', 'sell')
+    symbols = np.array([f'US.S{i % 50}' for i in range(n)], dtype=object)
+
+    rng_batch = random.Random(args.seed)
+    start = time.perf_counter()
+    batch = simulation.simulate_execution_batch(symbols, sides, qtys, prices, rng=rng_batch)
+    t_batch = time.perf_counter() - start
+
+    rng_scalar = random.Random(args.seed)
+    sym_l, side_l, qty_l, price_l = symbols.tolist(), sides.tolist(), qtys.tolist(), prices.tolist()
+    start = time.perf_counter()
+    scalar = [simulation.simulate_execution(sym_l[i], side_l[i], qty_l[i], price_l[i], rng=rng_scalar) for i in range(n)]
+    t_scalar = time.perf_counter() - start
+
+    # 每笔订单自己的种子 (core.execution 的成交方式)
+    seeds = [simulation.derive_seed(args.seed, i) for i in range(n)]
+    start = time.perf_counter()
+    seeded_batch = simulation.simulate_execution_batch(symbols, sides, qtys, prices, seeds=seeds, latency=False)
+    t_seeded_batch = time.perf_counter() - start
+
+    start = time.perf_counter()
+    seeded_scalar = [simulation.simulate_execution(sym_l[i], side_l[i], qty_l[i], price_l[i],
+                                                   rng=simulation.order_rng(seeds[i]), latency=False)
+                     for i in range(n)]
+    t_seeded_scalar = time.perf_counter() - start
+
+    identical = (simulation.batch_to_records(batch) == scalar and rng_batch.getstate() == rng_scalar.getstate()
+                 and simulation.batch_to_records(seeded_batch) == seeded_scalar)
+    print(f"orders={n} slippage={args.slippage} partial_fill={args.partial_fill}")
+    print(f"scalar:        {t_scalar:8.3f}s  {n / t_scalar:12.0f} orders/s")
+    print(f"batch:         {t_batch:8.3f}s  {n / t_batch:12.0f} orders/s  speedup={t_scalar / t_batch:.1f}x")
+    print(f"seeded scalar: {t_seeded_scalar:8.3f}s  {n / t_seeded_scalar:12.0f} orders/s")
+    print(f"seeded batch:  {t_seeded_batch:8.3f}s  {n / t_seeded_batch:12.0f} orders/s  "
+          f"speedup={t_seeded_scalar / t_seeded_batch:.1f}x")
+    print(f"identical={identical}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Benchmark: equity update as one valuation pass (core.equity.value_all_accounts) vs the per-account loop it replaced.
+
+Used for: sizing the equity Cron / POST /api/equity/update with hundreds of accounts holding overlapping symbols.
+The loop fetches quotes once per account (get_quotes_batch per account) and writes each equity row in its own
+transaction; the pass loads all positions in one query, fetches the union of symbols once and upserts every row
+in one transaction.
+
+Usage:
+    python bench/bench_equity_pass.py [--accounts 500] [--symbols 40] [--held 10] [--rounds 3]
+
+Output: ms per run for each path, quote batch calls / symbols requested per run, stage timings of the pass, and
+identical=True/False (equity rows written by both paths). Quotes come from the watchlist fallback (no DMS), so
+times are DB + valuation cost only; with DMS every saved batch call also saves a round trip.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+_tmp = tempfile.mkdtemp(prefix='ppt_bench_equity_')
+os.environ['DB_FILE'] = os.path.join(_tmp, 'bench.db')
+os.environ['DMS_BASE_URL'] = ''
+os.environ.pop('SIMULATION_MODE', None)
+os.environ.pop('SIMULATION_TIME_URL', None)
+
+import logging
+logging.disable(logging.INFO)
+
+from core import db as database
+from core import equity
+from core import utils as core_utils
+
+_calls = {'batches': 0, 'symbols': 0}
+_get_quotes_batch = core_utils.get_quotes_batch
+
+
+def _counting_quotes_batch(symbols, *args, **kwargs):
+    _calls['batches'] += 1
+    _calls['symbols'] += len(symbols)
+    return _get_quotes_batch(symbols, *args, **kwargs)
+
+
+def _loop(as_of):
+    """Per-account loop as before the valuation pass."""
+    watchlist = {w['symbol']: w for w in database.get_watchlist()}
+    for acc in database.get_all_accounts():
+        positions = database.get_positions(acc['name'])
+        if not positions:
+            continue
+        symbols = list(positions)
+        quotes = core_utils.get_quotes_batch(symbols)
+        core_utils.apply_quote_fallback(quotes, symbols, watchlist=watchlist)
+        database.update_equity_history(acc['name'], quotes=quotes, as_of_date=as_of)
+
+
+def _rows(as_of):
+    with database.get_connection() as conn:
+        return conn.execute("SELECT account_name, equity, pnl FROM equity_history WHERE date = ? ORDER BY account_name",
+                            (as_of,)).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--accounts', type=int, default=500)
+    parser.add_argument('--symbols', type=int, default=40)
+    parser.add_argument('--held', type=int, default=10, help='positions per account')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    database.init_db()
+    core_utils.get_quotes_batch = _counting_quotes_batch
+    rng = random.Random(args.seed)
+    universe = [f'US.S{i}' for i in range(args.symbols)]
+    with database.transaction():
+        for sym in universe:
+            database.add_to_watchlist(sym, sym)
+            database.update_watchlist_quote(sym, round(rng.uniform(10, 500), 2))
+        for i in range(args.accounts):
+            name = f'bench_{i}'
+            database.create_account(name, 1_000_000, as_of_date='2000-01-01')
+            for sym in rng.sample(universe, min(args.held, len(universe))):
+                database.update_position(name, sym, rng.randint(1, 500), round(rng.uniform(10, 500), 2))
+
+    as_of_loop, as_of_pass = '2000-01-02', '2000-01-03'
+    t_loop = t_pass = 0.0
+    for _ in range(args.rounds):
+        _calls.update(batches=0, symbols=0)
+        start = time.perf_counter()
+        _loop(as_of_loop)
+        t_loop += time.perf_counter() - start
+        loop_calls = dict(_calls)
+
+        _calls.update(batches=0, symbols=0)
+        start = time.perf_counter()
+        result = equity.value_all_accounts(as_of_date=as_of_pass)
+        t_pass += time.perf_counter() - start
+        pass_calls = dict(_calls)
+
+    a, b = _rows(as_of_loop), _rows(as_of_pass)
+    identical = [tuple(r) for r in a] == [tuple(r) for r in b]
+    print(f"db={os.environ['DB_FILE']} accounts={args.accounts} symbols={args.symbols} held={args.held}")
+    print(f"loop: {t_loop / args.rounds * 1e3:9.1f} ms/run  quote batches={loop_calls['batches']} "
+          f"symbols requested={loop_calls['symbols']}")
+    print(f"pass: {t_pass / args.rounds * 1e3:9.1f} ms/run  quote batches={pass_calls['batches']} "
+          f"symbols requested={pass_calls['symbols']}  speedup={t_loop / t_pass:.1f}x")
+    print(f"pass stages (last run, ms): {result['timings_ms']}")
+    print(f"identical={identical}")
+
+
+if __name__ == '__main__':
+    main()
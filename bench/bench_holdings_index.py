@@ -0,0 +1,97 @@
+"""
+Benchmark: revalue accounts on a one-symbol quote via the holdings index (core.holdings.on_quotes) vs a full scan
+(load every account's positions and value them all, as without the index).
+
+Used for: sizing live mark-to-market with many accounts; cost per quote should follow the holders of the quoted
+symbol, not accounts x positions. Also checks that the index equity equals db.value_positions at the same marks.
+
+Usage:
+    python bench/bench_holdings_index.py [--accounts 2000] [--symbols 200] [--held 10] [--quotes 500]
+
+Output: us per quote for each path, accounts revalued per quote, speedup, identical=True/False.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+_tmp = tempfile.mkdtemp(prefix='ppt_bench_holdings_')
+os.environ['DB_FILE'] = os.path.join(_tmp, 'bench.db')
+os.environ.pop('SIMULATION_MODE', None)
+os.environ.pop('SIMULATION_TIME_URL', None)
+
+import logging
+logging.disable(logging.INFO)
+
+from core import db as database
+from core import holdings
+
+
+def _scan(prices):
+    """Without the index: every account's positions, every account valued."""
+    positions = database.get_all_positions()
+    out = {}
+    for acc in database.get_all_accounts():
+        held = positions.get(acc['name'], {})
+        if any(sym in prices for sym in held):
+            quotes = {sym: {'price': prices.get(sym, holdings._marks.get(sym)), 'valid': True} for sym in held}
+            out[acc['name']] = database.value_positions(acc, held, quotes)['equity']
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--accounts', type=int, default=2000)
+    parser.add_argument('--symbols', type=int, default=200)
+    parser.add_argument('--held', type=int, default=10, help='positions per account')
+    parser.add_argument('--quotes', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    database.init_db()
+    rng = random.Random(args.seed)
+    universe = [f'US.S{i}' for i in range(args.symbols)]
+    with database.transaction():
+        for sym in universe:
+            database.add_to_watchlist(sym, sym)
+            database.update_watchlist_quote(sym, 100.0)
+        for i in range(args.accounts):
+            name = f'bench_{i}'
+            database.create_account(name, 1_000_000)
+            for sym in rng.sample(universe, min(args.held, len(universe))):
+                database.update_position(name, sym, rng.randint(1, 500), round(rng.uniform(50, 150), 2))
+    holdings.start()
+
+    ticks = [{rng.choice(universe): round(rng.uniform(80, 120), 2)} for _ in range(args.quotes)]
+    start = time.perf_counter()
+    revalued = sum(holdings.on_quotes(prices) for prices in ticks)
+    t_index = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for prices in ticks:
+        _scan(prices)
+    t_scan = time.perf_counter() - start
+
+    positions = database.get_all_positions()
+    accounts = database.get_all_accounts()
+    identical = True
+    for acc in accounts:
+        held = positions.get(acc['name'], {})
+        marks = {sym: {'price': holdings._marks[sym], 'valid': True} for sym in held}
+        equity = database.value_positions(acc, held, marks)['equity']
+        identical = identical and abs(holdings.get_account_value(acc['name'])['equity'] - equity) < 0.01
+
+    print(f"db={os.environ['DB_FILE']} accounts={args.accounts} symbols={args.symbols} held={args.held} "
+          f"quotes={args.quotes}")
+    print(f"index: {t_index / args.quotes * 1e6:10.1f} us/quote  accounts revalued/quote={revalued / args.quotes:.1f}")
+    print(f"scan:  {t_scan / args.quotes * 1e6:10.1f} us/quote  accounts read/quote={args.accounts}  "
+          f"speedup={t_scan / t_index:.0f}x")
+    print(f"identical={identical}")
+
+
+if __name__ == '__main__':
+    main()
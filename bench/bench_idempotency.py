@@ -0,0 +1,120 @@
+"""
+Benchmark / check: Idempotency-Key store (core.idempotency) - replay cost from memory vs SQLite, and the states a
+retry can hit.
+
+Used for: sizing webhook retry storms and checking the key life cycle: replay (memory hit and SQLite fallback after a
+restart / LRU eviction), payload mismatch, in progress (409), lease takeover of a hung claim, release of claims at
+startup (crash recovery), and which webhook outcomes are stored (final) vs released (5xx, quote failure).
+
+Usage:
+    python bench/bench_idempotency.py [--keys 2000]
+
+Output: us per begin() for new keys, memory replays and SQLite replays, one line per check, and ok=True/False.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+_tmp = tempfile.mkdtemp(prefix='ppt_bench_idempotency_')
+os.environ['DB_FILE'] = os.path.join(_tmp, 'bench.db')
+os.environ.pop('SIMULATION_MODE', None)
+os.environ.pop('SIMULATION_TIME_URL', None)
+
+import logging
+logging.disable(logging.INFO)
+
+from core import db as database
+from core import idempotency
+from core.idempotency import IdempotencyStore, NEW, REPLAY, IN_PROGRESS, MISMATCH
+
+
+def _checks():
+    fp, other = idempotency.fingerprint({'symbol': 'AAPL', 'qty': 1}), idempotency.fingerprint({'qty': 2})
+    body = {'status': 'ok', 'order': {'id': 1}}
+    out = {}
+
+    store = IdempotencyStore(lease=0.2)
+    out['new'] = store.begin('k1', fp)[0] == NEW
+    out['in_progress'] = store.begin('k1', fp)[0] == IN_PROGRESS
+    store.finish('k1', fp, body, 200)
+    state, stored = store.begin('k1', fp)
+    out['replay_memory'] = state == REPLAY and stored == (body, 200)
+    out['mismatch'] = store.begin('k1', other)[0] == MISMATCH
+    # 新进程 (空内存): 回落到 SQLite
+    state, stored = IdempotencyStore().begin('k1', fp)
+    out['replay_sqlite'] = state == REPLAY and stored == (body, 200)
+    out['mismatch_sqlite'] = IdempotencyStore().begin('k1', other)[0] == MISMATCH
+
+    store.begin('k0', fp)
+    store.abandon('k0')
+    out['abandon_reruns'] = IdempotencyStore().begin('k0', fp)[0] == NEW
+
+    # 请求卡住 / 崩溃: 租期内 409, 租期后由重试接管
+    store.begin('k2', fp)
+    out['lease_blocks'] = store.begin('k2', fp)[0] == IN_PROGRESS
+    time.sleep(0.25)
+    out['lease_takeover'] = store.begin('k2', fp)[0] == NEW
+
+    # 重启: 上个进程遗留的占用被释放, 已完成的响应保留
+    IdempotencyStore(lease=3600).begin('k3', fp)
+    released = idempotency.start()
+    out['restart_releases_claims'] = released >= 1 and IdempotencyStore(lease=3600).begin('k3', fp)[0] == NEW
+    out['restart_keeps_responses'] = IdempotencyStore().begin('k1', fp)[0] == REPLAY
+
+    try:
+        from api.webhook import _retryable
+    except ImportError as e:  # flask 未安装时跳过 webhook 分类检查
+        print(f"skip webhook checks: {e}")
+        return out
+    quote_err = {'error': 'Market order requires quote; DMS_BASE_URL not set'}
+    out['store_ok'] = not _retryable(body, 200)
+    out['store_queued'] = not _retryable({'status': 'queued', 'signal_id': 1}, 202)
+    out['store_validation_4xx'] = not _retryable({'error': 'Insufficient cash: need 1.00'}, 400)
+    out['release_5xx'] = _retryable({'error': 'Netting window 1 not flushed'}, 503)
+    out['release_quote_failure'] = _retryable(quote_err, 400)
+    out['release_basket_quote_failure'] = _retryable({'status': 'rejected', 'legs': [
+        {'status': 'rejected', **quote_err}, {'status': 'rejected', 'error': 'Insufficient cash'}]}, 200)
+    out['store_basket_partial_fill'] = not _retryable({'status': 'partial', 'legs': [
+        {'status': 'filled', 'order': {'id': 2}}, {'status': 'rejected', **quote_err}]}, 200)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--keys', type=int, default=2000)
+    args = parser.parse_args()
+    database.init_db()
+
+    store = IdempotencyStore()
+    fps = [idempotency.fingerprint({'symbol': 'AAPL', 'qty': i}) for i in range(args.keys)]
+    start = time.perf_counter()
+    for i, fp in enumerate(fps):
+        store.begin(f'bench-{i}', fp)
+        store.finish(f'bench-{i}', fp, {'status': 'ok', 'i': i}, 200)
+    t_new = time.perf_counter() - start
+    start = time.perf_counter()
+    for i, fp in enumerate(fps):
+        store.begin(f'bench-{i}', fp)
+    t_memory = time.perf_counter() - start
+    cold = IdempotencyStore()
+    start = time.perf_counter()
+    for i, fp in enumerate(fps):
+        cold.begin(f'bench-{i}', fp)
+    t_sqlite = time.perf_counter() - start
+
+    print(f"db={os.environ['DB_FILE']} keys={args.keys}")
+    print(f"new key (claim + finish): {t_new / args.keys * 1e6:9.1f} us")
+    print(f"replay from memory:       {t_memory / args.keys * 1e6:9.1f} us")
+    print(f"replay from SQLite:       {t_sqlite / args.keys * 1e6:9.1f} us")
+    checks = _checks()
+    for name, passed in checks.items():
+        print(f"  {name:30s} {'ok' if passed else 'FAIL'}")
+    print(f"ok={all(checks.values())}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark / check: signal storms filled through the netting window (core.netting) vs the same signals placed one by
+one with execute_order (webhook clamp semantics).
+
+Used for: checking that netting leaves every account with the same positions as sequential execution (sells beyond
+the running position clamp, sells with nothing held are rejected, e.g. sell 100 then buy 100 on a flat account ends
+long 100), and measuring the fills it saves. Windows are flushed directly (no WEBHOOK_NETTING_MS wait) so arrival
+order is exact.
+
+Usage:
+    python bench/bench_netting.py [--accounts 200] [--signals 20] [--symbols 3]
+
+Output: ms for each path, fills written by each, rejected signals, and identical=True/False (positions of every
+account; partial fills are disabled, cash differs by the commission of the saved fills).
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+_tmp = tempfile.mkdtemp(prefix='ppt_bench_netting_')
+os.environ['DB_FILE'] = os.path.join(_tmp, 'bench.db')
+os.environ.pop('SIMULATION_MODE', None)
+os.environ.pop('SIMULATION_TIME_URL', None)
+
+import logging
+logging.disable(logging.INFO)
+
+from core import db as database
+from core import execution
+from core import netting
+from core import simulation
+
+
+def _positions(name):
+    return {sym: pos['qty'] for sym, pos in database.get_positions(name).items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--accounts', type=int, default=200)
+    parser.add_argument('--signals', type=int, default=20, help='signals per account window')
+    parser.add_argument('--symbols', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    config = dict(simulation.get_config())
+    config['latency'] = {'enabled': False}
+    config['partial_fill'] = {'enabled': False}
+    simulation.set_config(config)
+    database.init_db()
+    rng = random.Random(args.seed)
+    symbols = [f'US.S{i}' for i in range(args.symbols)]
+
+    storms = {}
+    with database.transaction():
+        for i in range(args.accounts):
+            storm = [{'symbol': rng.choice(symbols), 'side': rng.choice(('buy', 'sell')),
+                      'qty': rng.choice((10, 50, 100, 150)), 'price': 100.0} for _ in range(args.signals)]
+            # 起始持仓: 空仓 / 部分持仓 / 满仓, 两条路径相同
+            start = {sym: rng.choice((0, 0, 30, 100, 300)) for sym in symbols}
+            for path in ('seq', 'net'):
+                name = f'{path}_{i}'
+                database.create_account(name, 100_000_000)
+                for sym, qty in start.items():
+                    if qty:
+                        database.update_position(name, sym, qty, 100.0)
+            storms[i] = storm
+
+    fills = {'seq': 0, 'net': 0}
+    rejected = {'seq': 0, 'net': 0}
+    start = time.perf_counter()
+    for i, storm in storms.items():
+        for s in storm:
+            try:
+                execution.execute_order(f'seq_{i}', s['symbol'], s['side'], s['qty'], s['price'], source='webhook',
+                                        clamp_sell=True)
+                fills['seq'] += 1
+            except execution.OrderError:
+                rejected['seq'] += 1
+    t_seq = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i, storm in storms.items():
+        window = netting._Window(f'net_{i}')
+        window.signals = [{**s, 'result': None} for s in storm]
+        netting._flush(window)
+        for s in window.signals:
+            if s['result'][1] >= 400:
+                rejected['net'] += 1
+        fills['net'] += len({s['result'][0]['order']['id'] for s in window.signals
+                             if s['result'][1] < 400 and s['result'][0]['order']['id'] is not None})
+    t_net = time.perf_counter() - start
+
+    identical = all(_positions(f'seq_{i}') == _positions(f'net_{i}') for i in storms)
+    print(f"db={os.environ['DB_FILE']} accounts={args.accounts} signals={args.signals} symbols={args.symbols}")
+    print(f"sequential: {t_seq * 1e3:9.1f} ms  fills={fills['seq']}  rejected={rejected['seq']}")
+    print(f"netting:    {t_net * 1e3:9.1f} ms  fills={fills['net']}  rejected={rejected['net']}  "
+          f"speedup={t_seq / t_net:.1f}x")
+    print(f"identical={identical}")
+
+
+if __name__ == '__main__':
+    main()
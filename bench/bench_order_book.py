@@ -0,0 +1,108 @@
+"""
+Benchmark: quote evaluation cost of core.order_book vs number of resting orders (heaps vs scanning every order).
+
+Used for: checking that ticks stay flat with tens of thousands of resting limit/stop orders across accounts.
+Orders rest away from the market, so each quote only peeks at the heap tops; the scan baseline checks every order
+of the quoted symbols, as a list-based book would.
+
+Usage:
+    python bench/bench_order_book.py [--orders 1000,10000,50000] [--symbols 50] [--accounts 100] [--quotes 2000]
+
+Output: per book size, us per quote (all symbols quoted once) for the heap book and the scan, then one crossing quote
+that fills --cross orders (fills go through core.execution against a throwaway DB).
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+_tmp = tempfile.mkdtemp(prefix='ppt_bench_book_')
+os.environ['DB_FILE'] = os.path.join(_tmp, 'bench.db')
+os.environ.pop('SIMULATION_MODE', None)
+os.environ.pop('SIMULATION_TIME_URL', None)
+
+import logging
+logging.disable(logging.INFO)
+
+from core import db as database
+from core import order_book
+
+
+def _scan(orders, prices):
+    """Baseline: check every resting order of each quoted symbol."""
+    hits = 0
+    for symbol, price in prices.items():
+        for side, order_type, key in orders.get(symbol, ()):
+            if order_type == 'limit':
+                hits += price <= key if side == 'buy' else price >= key
+            else:
+                hits += price >= key if side == 'buy' else price <= key
+    return hits
+
+
+def _place(n, n_symbols, accounts, rng, scan_orders):
+    with database.transaction():
+        for i in range(n):
+            symbol = f'US.S{i % n_symbols}'
+            side = rng.choice(('buy', 'sell'))
+            order_type = rng.choice(('limit', 'stop'))
+            # 远离市价 100: 买限价 / 卖止损在下方, 卖限价 / 买止损在上方
+            below = (side == 'buy') == (order_type == 'limit')
+            key = round(rng.uniform(50, 90) if below else rng.uniform(110, 150), 2)
+            order_book.place(accounts[i % len(accounts)], symbol, side, 1, order_type,
+                             limit_price=key if order_type == 'limit' else None,
+                             stop_price=key if order_type == 'stop' else None)
+            scan_orders.setdefault(symbol, []).append((side, order_type, key))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', default='1000,10000,50000')
+    parser.add_argument('--symbols', type=int, default=50)
+    parser.add_argument('--accounts', type=int, default=100)
+    parser.add_argument('--quotes', type=int, default=2000)
+    parser.add_argument('--cross', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    database.init_db()
+    accounts = [f'bench_{i}' for i in range(args.accounts)]
+    for name in accounts:
+        database.create_account(name, 10_000_000)
+    rng = random.Random(args.seed)
+    scan_orders = {}
+    placed = 0
+    print(f"db={os.environ['DB_FILE']} symbols={args.symbols} accounts={args.accounts} quotes={args.quotes}")
+    for target in [int(x) for x in args.orders.split(',') if x.strip()]:
+        _place(target - placed, args.symbols, accounts, rng, scan_orders)
+        placed = target
+        ticks = [{f'US.S{s}': round(rng.uniform(95, 105), 2) for s in range(args.symbols)} for _ in range(args.quotes)]
+
+        start = time.perf_counter()
+        queued = sum(order_book.on_quotes(prices, '2000-01-01T00:00:00+00:00') for prices in ticks)
+        t_book = (time.perf_counter() - start) / args.quotes
+        start = time.perf_counter()
+        hits = sum(_scan(scan_orders, prices) for prices in ticks)
+        t_scan = (time.perf_counter() - start) / args.quotes
+        print(f"resting={placed:>7}  book: {t_book * 1e6:9.1f} us/quote  scan: {t_scan * 1e6:9.1f} us/quote  "
+              f"speedup={t_scan / t_book:7.1f}x  fills={queued}/{hits}")
+
+    # 一次穿价: 把 S0 推到最低的买限价之下
+    lows = sorted(key for side, order_type, key in scan_orders['US.S0'] if side == 'buy' and order_type == 'limit')
+    if len(lows) >= args.cross:
+        price = lows[-args.cross]
+        start = time.perf_counter()
+        queued = order_book.on_quotes({'US.S0': price}, '2000-01-01T00:00:00+00:00')
+        t_eval = time.perf_counter() - start
+        order_book.drain()
+        t_fill = time.perf_counter() - start
+        print(f"crossing quote: queued={queued} evaluate={t_eval * 1e3:.2f} ms  evaluate+fill={t_fill * 1e3:.1f} ms")
+    print('book stats:', order_book.get_book_stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Benchmark: per-order cost of the compiled simulation model vs walking the config dict on every call.
+
+Used for: checking what core.simulation saves per order now that load_config compiles presets into immutable models
+(defaults resolved once, tiered commission as cumulative tables + bisect).
+
+Usage:
+    python bench/bench_sim_model.py [--orders 200000] [--preset futu_us] [--tiers 6] [--repeat 3]
+
+Output: best-of-repeat ns/order for slippage + partial fill + commission, dict walk vs compiled model, for the chosen preset and for
+a tiered-commission config; identical=True/False compares every result.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import yaml
+
+from core import simulation
+
+
+# 旧实现: 每次调用都 get_config() 并逐层 .get()
+_legacy_config = {}
+
+
+def _legacy_get_config():
+    return _legacy_config
+
+
+def _legacy_slippage(price, side, rng):
+    config = _legacy_get_config()
+    slip_config = config.get('slippage', {})
+    if not slip_config.get('enabled', False):
+        return price, 0.0
+    mode = slip_config.get('mode', 'percentage')
+    value = slip_config.get('value', 0.05)
+    if mode == 'percentage':
+        slip_amount = price * value / 100
+    elif mode == 'fixed':
+        slip_amount = value
+    elif mode == 'random':
+        slip_amount = price * value / 100 * rng.random()
+    else:
+        slip_amount = 0
+    exec_price = price + slip_amount if side == 'buy' else price - slip_amount
+    return round(exec_price, 4), round(slip_amount, 4)
+
+
+def _legacy_commission(order_value):
+    config = _legacy_get_config()
+    comm_config = config.get('commission', {})
+    if not comm_config.get('enabled', False):
+        return 0.0
+    mode = comm_config.get('mode', 'percentage')
+    if mode == 'percentage':
+        commission = max(comm_config.get('minimum', 1.0), order_value * comm_config.get('rate', 0.001))
+    elif mode == 'fixed':
+        commission = comm_config.get('per_trade', 5.0)
+    elif mode == 'tiered':
+        commission, remaining, prev_max = 0.0, order_value, 0
+        for tier in comm_config.get('tiers', []):
+            tier_max = tier.get('max_value') or float('inf')
+            tier_amount = min(remaining, tier_max - prev_max)
+            if tier_amount > 0:
+                commission += tier_amount * tier.get('rate', 0.001)
+                remaining -= tier_amount
+                prev_max = tier_max
+            if remaining <= 0:
+                break
+    else:
+        commission = 0.0
+    return round(commission, 2)
+
+
+def _legacy_partial_fill(order_value, qty, rng):
+    config = _legacy_get_config()
+    pf_config = config.get('partial_fill', {})
+    if not pf_config.get('enabled', False) or order_value < pf_config.get('threshold', 10000):
+        return qty, 1.0
+    fill_rate = rng.uniform(pf_config.get('min_fill_rate', 0.3), pf_config.get('max_fill_rate', 1.0))
+    return max(1, int(qty * fill_rate)), round(fill_rate, 2)
+
+
+def _run_legacy(orders, seed):
+    rng = random.Random(seed)
+    out = []
+    for side, qty, price in orders:
+        filled, _ = _legacy_partial_fill(qty * price, qty, rng)
+        exec_price, _ = _legacy_slippage(price, side, rng)
+        out.append((filled, exec_price, _legacy_commission(filled * exec_price)))
+    return out
+
+
+def _run_model(orders, seed):
+    rng = random.Random(seed)
+    out = []
+    for side, qty, price in orders:
+        filled, _ = simulation.calc_partial_fill(qty * price, qty, rng)
+        exec_price, _ = simulation.apply_slippage(price, side, rng)
+        out.append((filled, exec_price, simulation.calc_commission(filled, exec_price, filled * exec_price)))
+    return out
+
+
+def _bench(name, config, orders, seed, repeat):
+    _legacy_config.clear()
+    _legacy_config.update(config)
+    simulation.set_config(config)
+    t_legacy = t_model = float('inf')
+    for _ in range(repeat):  # interleaved, best of repeat
+        start = time.perf_counter()
+        legacy = _run_legacy(orders, seed)
+        t_legacy = min(t_legacy, time.perf_counter() - start)
+        start = time.perf_counter()
+        model = _run_model(orders, seed)
+        t_model = min(t_model, time.perf_counter() - start)
+    n = len(orders)
+    print(f"{name:<18} dict: {t_legacy / n * 1e9:7.0f} ns/order  model: {t_model / n * 1e9:7.0f} ns/order  "
+          f"speedup={t_legacy / t_model:.2f}x  identical={legacy == model}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=200_000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--preset', default='futu_us')
+    parser.add_argument('--tiers', type=int, default=6)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with open(simulation._config_path(), 'r', encoding='utf-8') as f:
+        presets = (yaml.safe_load(f) or {}).get('presets', {})
+    preset = presets.get(args.preset)
+    if preset is None:
+        parser.error(f"unknown preset {args.preset!r} (have: {', '.join(presets)})")
+    config = {k: preset.get(k, simulation.DEFAULT_CONFIG[k]) for k in ('slippage', 'commission', 'partial_fill', 'latency')}
+    config['partial_fill'] = {'enabled': True, 'threshold': 10000, 'min_fill_rate': 0.3, 'max_fill_rate': 1.0}
+
+    gen = random.Random(args.seed)
+    orders = [(gen.choice(('buy', 'sell')), gen.randint(1, 5000), round(gen.uniform(1, 500), 2))
+              for _ in range(args.orders)]
+
+    tiered = dict(config)
+    bounds = [10_000 * 4 ** i for i in range(args.tiers - 1)] + [None]
+    tiered['commission'] = {'enabled': True, 'mode': 'tiered',
+                            'tiers': [{'max_value': b, 'rate': 0.003 / (i + 1)} for i, b in enumerate(bounds)]}
+
+    print(f"orders={args.orders} preset={args.preset} tiers={args.tiers}")
+    _bench(args.preset, config, orders, args.seed, args.repeat)
+    _bench(f"tiered({args.tiers})", tiered, orders, args.seed, args.repeat)
+    simulation.load_config()
+
+
+if __name__ == '__main__':
+    main()
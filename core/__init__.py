@@ -4,14 +4,37 @@ Paper Trade 核心模块
 - db: 数据库操作
 - analytics: 绩效分析
 - simulation: 交易模拟
+- execution: 订单执行 (单事务成交)
+- order_book: 挂单簿 (限价 / 止损 / 止损限价, 按价格堆触发)
+- holdings: 持仓倒排索引 (标的 -> 持有账户, 行情只重估受影响账户并推送 pnl)
+- signal_queue: Webhook 异步接收队列 (SQLite 持久化, 按账户分片的 worker)
+- idempotency: 幂等键 (Webhook 重试返回原响应, 内存 TTL LRU + SQLite)
+- netting: Webhook 净额窗口 (同账户毫秒级信号按标的轧差后一次成交)
+- equity: 净值更新 (定时任务 / tick / 回放共用)
+- replay / sweep: 离线回放 / 多进程参数扫描 (python -m core.replay / core.sweep, 不在此导入)
 - utils: 工具函数 (行情获取、代码转换)
+- bar_cache: 仿真 K 线本地缓存 (按 as_of 二分查找)
+- dms_client: DMS HTTP 客户端 (连接池、分块并发)
+- dms_disk_cache: 仿真 DMS 响应磁盘缓存 (内容寻址)
+- quote_cache: 行情缓存 (TTL / LRU / stale-while-revalidate)
 - auth: 用户认证
 """
 
 from . import db
 from . import analytics
 from . import simulation
+from . import execution
+from . import order_book
+from . import holdings
+from . import signal_queue
+from . import idempotency
+from . import netting
+from . import equity
+from . import bar_cache
+from . import dms_client
+from . import dms_disk_cache
+from . import quote_cache
 from . import utils
 from . import auth
 
-__all__ = ['db', 'analytics', 'simulation', 'utils', 'auth']
+__all__ = ['db', 'analytics', 'simulation', 'execution', 'order_book', 'holdings', 'signal_queue', 'idempotency', 'netting', 'equity', 'bar_cache', 'dms_client', 'dms_disk_cache', 'quote_cache', 'utils', 'auth']
@@ -14,6 +14,7 @@ Features:
     - Equity history and trades from database; risk-free rate default 2%; returns dicts with standard keys
 """
 import math
+from collections import deque
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
 
@@ -197,103 +198,84 @@ def calc_trade_stats(account_name: str) -> Dict[str, Any]:
             'net_profit': float,       # 净盈亏
         }
     """
-    trades = database.get_trades(account_name, limit=10000)
-    
-    if not trades:
-        return {
-            'total_trades': 0,
-            'win_trades': 0,
-            'lose_trades': 0,
-            'win_rate': 0,
-            'profit_factor': 0,
-            'avg_win': 0,
-            'avg_loss': 0,
-            'largest_win': 0,
-            'largest_loss': 0,
-            'total_profit': 0,
-            'total_loss': 0,
-            'net_profit': 0,
-        }
-    
-    # 按 symbol 分组，计算每个交易对的盈亏
-    # 简化: 以 卖出 为准计算盈亏
-    # 真实计算需要 FIFO/LIFO 匹配买卖
-    
-    # 简化方法: 计算已平仓盈亏
-    # 使用 buy_value / sell_value 简单计算
+    empty = {
+        'total_trades': 0,
+        'win_trades': 0,
+        'lose_trades': 0,
+        'win_rate': 0,
+        'profit_factor': 0,
+        'avg_win': 0,
+        'avg_loss': 0,
+        'largest_win': 0,
+        'largest_loss': 0,
+        'total_profit': 0,
+        'total_loss': 0,
+        'net_profit': 0,
+    }
     
-    symbol_trades: Dict[str, List] = {}
-    for t in trades:
-        symbol = t['symbol']
-        if symbol not in symbol_trades:
-            symbol_trades[symbol] = []
-        symbol_trades[symbol].append(t)
+    # 简化: 以 卖出 为准计算盈亏，按 symbol FIFO 匹配买卖
+    # 全部成交按 (time, id) 流式遍历 (不截断)；内存只保留未平仓的买入批次和汇总量
+    
+    buy_queues: Dict[str, deque] = {}  # symbol -> deque of [qty, price]
+    trade_count = 0
+    n_closed = 0
+    n_wins = n_losses = 0
+    total_profit = 0.0
+    loss_sum = 0.0
+    largest_win = None
+    largest_loss = None
+    
+    for t in database.iter_trades(account_name, by_time=True):
+        trade_count += 1
+        buy_queue = buy_queues.setdefault(t['symbol'], deque())
+        if t['side'] == 'buy':
+            buy_queue.append([t['qty'], t['price']])
+        elif t['side'] == 'sell':
+            sell_qty = t['qty']
+            sell_price = t['price']
+            
+            # 匹配买入
+            while sell_qty > 0 and buy_queue:
+                buy = buy_queue[0]
+                match_qty = min(sell_qty, buy[0])
+                
+                # 计算盈亏
+                pnl = (sell_price - buy[1]) * match_qty
+                n_closed += 1
+                if pnl > 0:
+                    n_wins += 1
+                    total_profit += pnl
+                    largest_win = pnl if largest_win is None else max(largest_win, pnl)
+                elif pnl < 0:
+                    n_losses += 1
+                    loss_sum += pnl
+                    largest_loss = pnl if largest_loss is None else min(largest_loss, pnl)
+                
+                sell_qty -= match_qty
+                buy[0] -= match_qty
+                
+                if buy[0] <= 0:
+                    buy_queue.popleft()
     
-    profits = []  # 每笔交易的盈亏
+    if trade_count == 0:
+        return empty
     
-    for symbol, sym_trades in symbol_trades.items():
-        # 按时间排序
-        sym_trades.sort(key=lambda x: x['time'])
-        
-        # FIFO 匹配
-        buy_queue = []  # (qty, price)
-        
-        for t in sym_trades:
-            if t['side'] == 'buy':
-                buy_queue.append({'qty': t['qty'], 'price': t['price']})
-            elif t['side'] == 'sell':
-                sell_qty = t['qty']
-                sell_price = t['price']
-                
-                # 匹配买入
-                while sell_qty > 0 and buy_queue:
-                    buy = buy_queue[0]
-                    match_qty = min(sell_qty, buy['qty'])
-                    
-                    # 计算盈亏
-                    pnl = (sell_price - buy['price']) * match_qty
-                    profits.append(pnl)
-                    
-                    sell_qty -= match_qty
-                    buy['qty'] -= match_qty
-                    
-                    if buy['qty'] <= 0:
-                        buy_queue.pop(0)
-    
-    if not profits:
-        return {
-            'total_trades': len(trades),
-            'win_trades': 0,
-            'lose_trades': 0,
-            'win_rate': 0,
-            'profit_factor': 0,
-            'avg_win': 0,
-            'avg_loss': 0,
-            'largest_win': 0,
-            'largest_loss': 0,
-            'total_profit': 0,
-            'total_loss': 0,
-            'net_profit': 0,
-            'note': '无已平仓交易'
-        }
+    if n_closed == 0:
+        return {**empty, 'total_trades': trade_count, 'note': '无已平仓交易'}
     
     # 统计
-    wins = [p for p in profits if p > 0]
-    losses = [p for p in profits if p < 0]
-    
-    total_profit = sum(wins)
-    total_loss = abs(sum(losses))
+    total_loss = abs(loss_sum)
     
     return {
-        'total_trades': len(profits),
-        'win_trades': len(wins),
-        'lose_trades': len(losses),
-        'win_rate': round(len(wins) / len(profits) * 100, 1) if profits else 0,
+        'total_trades': n_closed,
+        'win_trades': n_wins,
+        'lose_trades': n_losses,
+        'win_rate': round(n_wins / n_closed * 100, 1),
         'profit_factor': round(total_profit / total_loss, 2) if total_loss > 0 else float('inf') if total_profit > 0 else 0,
-        'avg_win': round(sum(wins) / len(wins), 2) if wins else 0,
-        'avg_loss': round(sum(losses) / len(losses), 2) if losses else 0,
-        'largest_win': round(max(wins), 2) if wins else 0,
-        'largest_loss': round(min(losses), 2) if losses else 0,
+        'avg_win': round(total_profit / n_wins, 2) if n_wins else 0,
+        'avg_loss': round(loss_sum / n_losses, 2) if n_losses else 0,
+        'largest_win': round(largest_win, 2) if n_wins else 0,
+        'largest_loss': round(largest_loss, 2) if n_losses else 0,
         'total_profit': round(total_profit, 2),
         'total_loss': round(total_loss, 2),
         'net_profit': round(total_profit - total_loss, 2),
@@ -0,0 +1,291 @@
+"""
+PPT sim-mode OHLCV bar cache: local SQLite store of DMS bars + covered ranges; as_of quotes by binary search.
+
+Used for: core.utils quotes in simulation mode. A replay asks for the last close at each sim time; instead of one
+7-day DMS window per quote, the symbol's bars are prefetched once (BAR_CACHE_PREFETCH_DAYS ahead) and later
+as_of lookups are answered locally.
+
+Functions:
+    quotes_as_of(symbols, as_of_iso, fetch, interval='1d') -> {symbol: quote_dict}
+        Serve last Close at or before as_of (within the 7-day quote window); fetch(symbols, start_iso, end_iso,
+        budget_sec) -> (data, errors) is called only for ranges not yet covered (budget_sec None = the caller's
+        default latency budget). Symbols that cannot be served are omitted.
+    get_bar_cache_stats() -> dict      Lookups / hits / fetches / bars stored
+    close()                            Close the cache connection (tests / DB switch)
+
+Features:
+    - Storage: BAR_CACHE_FILE (default run/db/bar_cache.db), tables bars(symbol, interval, ts, OHLCV) and
+      bar_coverage(symbol, interval, start, end); survives restarts and throwaway trading DBs
+    - Per (symbol, interval) sorted timestamps + closes in memory; lookup is bisect over ts (no look-ahead: ts <= as_of)
+    - Only missing parts of [as_of - 7d, as_of + BAR_CACHE_PREFETCH_DAYS] are fetched; symbols with the same gap share
+      one (chunked) read/batch; coverage is never recorded past yesterday (real time), so partial bars are not frozen
+    - Prefetches run with their own deadline, BAR_CACHE_PREFETCH_BUDGET_SEC (default 30s), not the per-quote DMS
+      latency budget. A symbol whose prefetch fails only fetches its quote window [as_of - 7d, as_of] (default
+      budget) for BAR_CACHE_PREFETCH_RETRY_SEC (default 300s), so a slow DMS does not pay a year-long request (and a
+      breaker failure) on every quote
+    - BAR_CACHE_ENABLED=0 disables (quotes go straight to DMS as before)
+"""
+import bisect
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+_logger = logging.getLogger(__name__)
+
+BAR_CACHE_ENABLED = os.getenv('BAR_CACHE_ENABLED', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+BAR_CACHE_FILE = os.getenv('BAR_CACHE_FILE', 'run/db/bar_cache.db')
+BAR_CACHE_PREFETCH_DAYS = max(0, int(os.getenv('BAR_CACHE_PREFETCH_DAYS', '365')))
+BAR_CACHE_PREFETCH_BUDGET_SEC = float(os.getenv('BAR_CACHE_PREFETCH_BUDGET_SEC', '30'))
+BAR_CACHE_PREFETCH_RETRY_SEC = float(os.getenv('BAR_CACHE_PREFETCH_RETRY_SEC', '300'))
+
+QUOTE_WINDOW = timedelta(days=7)
+_TS_KEYS = ('Date', 'date', 'Datetime', 'datetime', 'time', 'timestamp', 'index')
+
+_lock = threading.RLock()
+_conn: Optional[sqlite3.Connection] = None
+_series: Dict[Tuple[str, str], Tuple[List[str], List[float]]] = {}
+_coverage: Dict[Tuple[str, str], List[Tuple[str, str]]] = {}
+_prefetch_failed: Dict[Tuple[str, str], float] = {}  # key -> monotonic time until which only the quote window is fetched
+_stats = {'lookups': 0, 'hits': 0, 'fetches': 0, 'fetch_errors': 0, 'bars_stored': 0, 'bypassed': 0,
+          'prefetch_failures': 0, 'narrowed': 0}
+
+
+def _iso(dt: datetime) -> str:
+    """Fixed-width UTC ISO string (sortable as text)."""
+    return dt.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S+00:00')
+
+
+def _parse_dt(value) -> Optional[datetime]:
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        secs = value / 1000 if value > 1e11 else value
+        return datetime.fromtimestamp(secs, tz=timezone.utc)
+    try:
+        dt = datetime.fromisoformat(str(value).strip().replace('Z', '+00:00').replace(' ', 'T', 1))
+    except ValueError:
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _bar_ts(record: dict) -> Optional[str]:
+    for key in _TS_KEYS:
+        if key in record:
+            dt = _parse_dt(record[key])
+            return _iso(dt) if dt else None
+    return None
+
+
+def _connection() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        path = BAR_CACHE_FILE
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS bars (
+                symbol TEXT NOT NULL, interval TEXT NOT NULL, ts TEXT NOT NULL,
+                open REAL, high REAL, low REAL, close REAL, volume REAL,
+                PRIMARY KEY (symbol, interval, ts)
+            );
+            CREATE TABLE IF NOT EXISTS bar_coverage (
+                symbol TEXT NOT NULL, interval TEXT NOT NULL, start TEXT NOT NULL, "end" TEXT NOT NULL,
+                PRIMARY KEY (symbol, interval, start)
+            );
+        ''')
+        _conn = conn
+    return _conn
+
+
+def close():
+    """Close the cache connection and drop in-memory series (next use reloads from BAR_CACHE_FILE)."""
+    global _conn
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
+        _series.clear()
+        _coverage.clear()
+        _prefetch_failed.clear()
+
+
+def _load(key: Tuple[str, str]):
+    if key in _series:
+        return
+    conn = _connection()
+    rows = conn.execute("SELECT ts, close FROM bars WHERE symbol = ? AND interval = ? ORDER BY ts", key).fetchall()
+    _series[key] = ([r[0] for r in rows], [r[1] for r in rows])
+    _coverage[key] = [tuple(r) for r in conn.execute(
+        'SELECT start, "end" FROM bar_coverage WHERE symbol = ? AND interval = ? ORDER BY start', key)]
+
+
+def _merge(ranges: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _gaps(covered: List[Tuple[str, str]], start: str, end: str) -> List[Tuple[str, str]]:
+    """Parts of [start, end] not inside covered (sorted, merged)."""
+    gaps, cursor = [], start
+    for c_start, c_end in covered:
+        if c_end < cursor:
+            continue
+        if c_start > end:
+            break
+        if c_start > cursor:
+            gaps.append((cursor, c_start))
+        cursor = max(cursor, c_end)
+        if cursor >= end:
+            break
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+def _store(key: Tuple[str, str], records: list, start: str, end: str):
+    """Insert bars and mark [start, end] covered (caller holds _lock)."""
+    _load(key)
+    rows = []
+    for rec in records or []:
+        if not isinstance(rec, dict):
+            continue
+        ts = _bar_ts(rec)
+        close_ = rec.get('Close', rec.get('close'))
+        if ts is None or close_ is None:
+            continue
+        rows.append((key[0], key[1], ts, rec.get('Open', rec.get('open')), rec.get('High', rec.get('high')),
+                     rec.get('Low', rec.get('low')), float(close_), rec.get('Volume', rec.get('volume'))))
+    conn = _connection()
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO bars VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        covered = _merge(_coverage[key] + [(start, end)])
+        conn.execute("DELETE FROM bar_coverage WHERE symbol = ? AND interval = ?", key)
+        conn.executemany('INSERT INTO bar_coverage (symbol, interval, start, "end") VALUES (?, ?, ?, ?)',
+                         [(key[0], key[1], s, e) for s, e in covered])
+    _coverage[key] = covered
+    _stats['bars_stored'] += len(rows)
+    _series.pop(key, None)
+    _load(key)
+
+
+def _lookup(key: Tuple[str, str], window_start: str, as_of: str) -> Optional[float]:
+    """Close of the last bar with window_start <= ts <= as_of, or None."""
+    ts_list, closes = _series[key]
+    i = bisect.bisect_right(ts_list, as_of) - 1
+    if i < 0 or ts_list[i] < window_start:
+        return None
+    return closes[i]
+
+
+def quotes_as_of(symbols: List[str], as_of_iso: str,
+                 fetch: Callable[[List[str], str, str], Tuple[Dict[str, dict], Dict[str, str]]],
+                 interval: str = '1d') -> Dict[str, dict]:
+    """
+    Quotes (last Close at or before as_of, within 7 days) for symbols whose window is cached or can be fetched now.
+    Symbols left out (fetch error, range not cacheable yet, bars without timestamps) should use the DMS path.
+    """
+    if not BAR_CACHE_ENABLED or not symbols:
+        return {}
+    as_of_dt = _parse_dt(as_of_iso)
+    if as_of_dt is None:
+        return {}
+    as_of = _iso(as_of_dt)
+    window_start = _iso(as_of_dt - QUOTE_WINDOW)
+    # never claim coverage for periods whose bars may still change
+    horizon = _iso(datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(seconds=1))
+    if as_of > horizon:
+        with _lock:
+            _stats['bypassed'] += len(symbols)
+        return {}
+    prefetch_end = min(_iso(as_of_dt + timedelta(days=BAR_CACHE_PREFETCH_DAYS)), horizon)
+
+    now = time.monotonic()
+    with _lock:
+        _stats['lookups'] += len(symbols)
+        by_gaps: Dict[Tuple[Tuple[Tuple[str, str], ...], bool], List[str]] = {}
+        for s in symbols:
+            key = (s, interval)
+            _load(key)
+            if not _gaps(_coverage[key], window_start, as_of):
+                continue
+            # prefetch failed recently: only the quote window, until the retry time
+            narrow = _prefetch_failed.get(key, 0.0) > now
+            gaps = tuple(_gaps(_coverage[key], window_start, as_of if narrow else prefetch_end))
+            by_gaps.setdefault((gaps, narrow), []).append(s)
+            _stats['narrowed'] += narrow
+
+    # fetch outside the lock (network); symbols with identical gaps share requests
+    fetched_ok = set()
+    for (gaps, narrow), syms in by_gaps.items():
+        budget = None if narrow else BAR_CACHE_PREFETCH_BUDGET_SEC
+        results = []
+        for start, end in gaps:
+            try:
+                data, errors = fetch(syms, start, end, budget)
+            except Exception as e:
+                data, errors = {}, {s: str(e) for s in syms}
+            results.append((start, end, data, errors))
+        with _lock:
+            _stats['fetches'] += len(gaps)
+            ok = set(syms)
+            failed = set()
+            for start, end, data, errors in results:
+                for s in syms:
+                    if s in errors:
+                        ok.discard(s)
+                        failed.add(s)
+                        continue
+                    raw = (data or {}).get(s) or {}
+                    records = raw.get('data') or []
+                    if records and _bar_ts(records[-1] if isinstance(records[-1], dict) else {}) is None:
+                        ok.discard(s)  # no timestamps -> cannot index
+                        continue
+                    _store((s, interval), records, start, end)
+            _stats['fetch_errors'] += len(set(syms) - ok)
+            if not narrow and failed:
+                retry_at = time.monotonic() + BAR_CACHE_PREFETCH_RETRY_SEC
+                for s in failed:
+                    _prefetch_failed[(s, interval)] = retry_at
+                _stats['prefetch_failures'] += len(failed)
+            fetched_ok |= ok
+        if len(ok) < len(syms):
+            _logger.info("bar cache: fetch failed for %s symbols (as_of=%s)", len(syms) - len(ok), as_of_iso)
+
+    result = {}
+    with _lock:
+        for s in symbols:
+            key = (s, interval)
+            if _gaps(_coverage[key], window_start, as_of):
+                continue
+            if s not in fetched_ok:
+                _stats['hits'] += 1
+            price = _lookup(key, window_start, as_of)
+            if price is None:
+                result[s] = {"symbol": s, "price": 0, "error": "no data", "valid": False}
+            elif price <= 0:
+                result[s] = {"symbol": s, "price": 0, "error": "invalid price", "valid": False}
+            else:
+                result[s] = {"symbol": s, "price": float(price), "change": 0, "change_pct": 0, "name": s,
+                             "currency": "USD", "valid": True}
+    return result
+
+
+def get_bar_cache_stats() -> dict:
+    """Counters for /api/health (public: no file paths)."""
+    with _lock:
+        stats = dict(_stats)
+        stats['series_loaded'] = len(_series)
+    stats.update(enabled=BAR_CACHE_ENABLED, prefetch_days=BAR_CACHE_PREFETCH_DAYS)
+    return stats
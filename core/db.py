@@ -5,20 +5,49 @@ Used for: all PPT API and simulation; DB_FILE env (default run/db/paper_trade.db
 
 Functions:
     get_db_path() -> str
-    get_connection()   Context manager; commit on exit
+    get_connection()   Context manager over the pooled per-thread connection; outermost block commits on exit
+    transaction()      Write transaction (BEGIN IMMEDIATE); nested db calls join it and commit once
+    get_pool_stats() -> dict   Connection pool counters (opened/reused/closed/active)
+    init_db()          Pending migrations + default account/watchlist; once per DB file per process (app startup)
+    run_migrations(conn) / get_schema_version()   Versioned schema steps recorded in schema_version
+    close_all_connections()    Close every pooled connection (shutdown / DB_FILE switch)
     get_current_account_name() / set_current_account(name) / list_accounts() / create_account(...) / delete_account(name)
     get_positions(account) / update_position(...) / get_orders(account) / add_order(...) / get_trades(account) / add_trade(...)
+    query_orders(account, before_id/after_id, filters) / query_trades(...)   Keyset-paginated history pages
+    iter_orders(account, ...) / iter_trades(account, by_time=False, ...)    Stream full history in constant memory
+    get_account_cost_stats(account) / get_symbol_cost_stats(account)        Running totals, O(1) read
+    set_account_rng(account, rng_seed, rng_seq)   Account's seeded simulation stream (orders.seed holds each draw)
+    rebuild_cost_stats(account=None) / verify_cost_stats(account=None)      Recompute / check totals from trades
+    get_order(id) / update_order_fill(...) / add_pending_fill(...) / list_pending_fills() / complete_pending_fill(...)
+        Deferred fill queue (latency simulation): accepted orders wait in pending_fills until core.execution fills them
+    add_webhook_signal(...) / get_webhook_signal(id) / update_webhook_signal(...) / list_webhook_signals(statuses)
+        Async webhook ingestion queue (core.signal_queue): payload / result are JSON text
+    reserve_idempotency_key(...) / complete_idempotency_key(...) / delete_idempotency_key(key) /
+    clear_idempotency_claims() / prune_idempotency_keys(before)   Stored responses per Idempotency-Key (core.idempotency)
+    add_working_order(...) / get_working_order(id) / list_working_orders(...) / update_working_order(...) /
+    fill_working_order(id, filled_qty, done)   Resting limit/stop orders (core.order_book); fills are orders rows
+        with working_order_id set
+    get_all_positions() / get_min_equity_dates() / value_positions(account, positions, quotes) /
+    upsert_equity_history(rows)   All-account valuation pass (core.equity): one read each, in-memory valuation,
+        one executemany upsert
     get_equity_history(account) / append_equity(...) / get_watchlist() / add_watchlist(...) / etc.
 
 Features:
+    - Schema changes are ordered, idempotent MIGRATIONS; pending ones run once when a DB file is first opened
+    - One persistent connection per thread (per greenlet under eventlet), configured once: WAL, synchronous=NORMAL,
+      busy_timeout (DB_BUSY_TIMEOUT_MS), page cache (DB_CACHE_SIZE_KB); nested get_connection() share one transaction
+    - account_cost_stats / symbol_cost_stats are running totals incremented in add_trade's transaction
+      (python -m core.dbadmin rebuild-cost-stats / verify-cost-stats)
     - Uses core.utils.get_current_datetime_iso / get_equity_date for sim time
     - DEFAULT_CAPITAL, DEFAULT_WATCHLIST from env or defaults
 """
 import os
 import sqlite3
-from datetime import datetime
+import threading
+import weakref
+from datetime import datetime, timezone
 from contextlib import contextmanager
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterator
 import logging
 
 get_logger = logging.getLogger(__name__)
@@ -40,6 +69,9 @@ def _equity_date_for_init():
 
 DB_FILE = os.getenv('DB_FILE', 'run/db/paper_trade.db')
 DEFAULT_CAPITAL = 1000000
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))
+DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', '16384'))
+DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL').strip().upper()  # OFF: throwaway DBs (core.replay)
 
 # Default watchlist (symbol, display name)
 DEFAULT_WATCHLIST = [
@@ -57,105 +89,425 @@ def get_db_path() -> str:
     return DB_FILE
 
 
+# ============================================================
+# 连接池: 每线程 (eventlet 下为每 greenlet) 一个持久连接
+# ============================================================
+
+_local = threading.local()
+_pool_lock = threading.Lock()
+_pool_conns: Dict[int, tuple] = {}  # id(conn) -> (conn, path)
+_pool_stats = {'opened': 0, 'reused': 0, 'closed': 0, 'commits': 0, 'rollbacks': 0}
+_pool_generation = 0  # bumped by close_all_connections(); threads holding an older connection reopen
+
+
+class _PooledConnection:
+    """Thread-local owner of one pooled connection; the connection is closed when the owner thread's local dies."""
+    __slots__ = ('conn', 'path', 'generation', 'depth', '__weakref__')
+
+    def __init__(self, conn: sqlite3.Connection, path: str, generation: int):
+        self.conn = conn
+        self.path = path
+        self.generation = generation
+        self.depth = 0
+
+
+def _configure_connection(conn: sqlite3.Connection):
+    """Per-connection PRAGMAs, applied once when the pooled connection is opened."""
+    conn.row_factory = sqlite3.Row  # 返回字典形式
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS if DB_SYNCHRONOUS in ('OFF', 'NORMAL', 'FULL') else 'NORMAL'}")
+    conn.execute(f"PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT_MS)}")
+    conn.execute(f"PRAGMA cache_size=-{int(DB_CACHE_SIZE_KB)}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+
+def _release_connection(key: int, conn: sqlite3.Connection):
+    with _pool_lock:
+        if _pool_conns.pop(key, None) is not None:
+            _pool_stats['closed'] += 1
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+def _thread_connection() -> _PooledConnection:
+    """Return this thread's pooled connection, (re)opening it when missing, DB_FILE changed or the pool was closed."""
+    pc = getattr(_local, 'pc', None)
+    if pc is not None and pc.path == DB_FILE and pc.generation == _pool_generation:
+        with _pool_lock:
+            _pool_stats['reused'] += 1
+        return pc
+    if pc is not None:
+        _release_connection(id(pc.conn), pc.conn)
+    os.makedirs(os.path.dirname(DB_FILE) or '.', exist_ok=True)
+    # check_same_thread=False only so close_all_connections() / finalizers may close it; each connection
+    # is still used by its owner thread alone.
+    conn = sqlite3.connect(DB_FILE, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    _configure_connection(conn)
+    _ensure_schema(conn)
+    pc = _PooledConnection(conn, DB_FILE, _pool_generation)
+    weakref.finalize(pc, _release_connection, id(conn), conn)
+    with _pool_lock:
+        _pool_conns[id(conn)] = (conn, DB_FILE)
+        _pool_stats['opened'] += 1
+    _local.pc = pc
+    get_logger.debug("db pool: opened connection path=%s thread=%s", DB_FILE, threading.get_ident())
+    return pc
+
+
 @contextmanager
 def get_connection():
-    """获取数据库连接"""
-    os.makedirs(os.path.dirname(DB_FILE) or '.', exist_ok=True)
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row  # 返回字典形式
+    """
+    获取数据库连接 (线程内复用的持久连接)。
+    嵌套调用共享同一事务：只有最外层在退出时 commit，异常时最外层 rollback。
+    """
+    pc = _thread_connection()
+    conn = pc.conn
+    pc.depth += 1
     try:
         yield conn
-        conn.commit()
+        if pc.depth == 1 and conn.in_transaction:
+            conn.commit()
+            with _pool_lock:
+                _pool_stats['commits'] += 1
     except Exception:
-        conn.rollback()
+        if pc.depth == 1 and conn.in_transaction:
+            conn.rollback()
+            with _pool_lock:
+                _pool_stats['rollbacks'] += 1
         raise
     finally:
-        conn.close()
+        pc.depth -= 1
+
+
+@contextmanager
+def transaction():
+    """
+    写事务: BEGIN IMMEDIATE (开始即持有写锁，事务内读取的余额/持仓不会被并发写覆盖)。
+    事务内调用的其他 db 函数共享同一连接与事务，最终只 commit 一次。
+    """
+    with get_connection() as conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        yield conn
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Connection pool counters for /api/health (public: no file paths)."""
+    with _pool_lock:
+        active = len(_pool_conns)
+        stats = dict(_pool_stats)
+    stats.update({
+        'active': active,
+        'journal_mode': 'wal',
+        'synchronous': DB_SYNCHRONOUS.lower(),
+        'busy_timeout_ms': DB_BUSY_TIMEOUT_MS,
+        'cache_size_kb': DB_CACHE_SIZE_KB,
+    })
+    return stats
+
+
+def close_all_connections():
+    """Close every pooled connection (shutdown, or before switching DB_FILE). Threads reopen lazily."""
+    global _pool_generation
+    with _pool_lock:
+        conns = list(_pool_conns.values())
+        _pool_conns.clear()
+        _pool_stats['closed'] += len(conns)
+        _pool_generation += 1
+    for conn, _path in conns:
+        try:
+            conn.close()
+        except Exception:
+            pass
+    _local.pc = None
+
+
+# ============================================================
+# Schema 迁移: schema_version 记录已应用版本，按序执行未应用的步骤 (每步幂等)
+# ============================================================
+
+_SCHEMA_BASELINE = [
+    # 账户表
+    '''CREATE TABLE IF NOT EXISTS accounts (
+        name TEXT PRIMARY KEY,
+        initial_capital REAL NOT NULL,
+        cash REAL NOT NULL,
+        created_at TEXT NOT NULL
+    )''',
+    # 持仓表
+    '''CREATE TABLE IF NOT EXISTS positions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        account_name TEXT NOT NULL,
+        symbol TEXT NOT NULL,
+        qty INTEGER NOT NULL,
+        avg_price REAL NOT NULL,
+        UNIQUE(account_name, symbol),
+        FOREIGN KEY (account_name) REFERENCES accounts(name)
+    )''',
+    # 订单表
+    '''CREATE TABLE IF NOT EXISTS orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        account_name TEXT NOT NULL,
+        symbol TEXT NOT NULL,
+        side TEXT NOT NULL,
+        qty INTEGER NOT NULL,
+        price REAL NOT NULL,
+        value REAL NOT NULL,
+        time TEXT NOT NULL,
+        status TEXT NOT NULL,
+        source TEXT DEFAULT 'web',
+        FOREIGN KEY (account_name) REFERENCES accounts(name)
+    )''',
+    # 成交表（commission/slippage/realized_pnl 用于统计累积亏损）
+    '''CREATE TABLE IF NOT EXISTS trades (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        account_name TEXT NOT NULL,
+        symbol TEXT NOT NULL,
+        side TEXT NOT NULL,
+        qty INTEGER NOT NULL,
+        price REAL NOT NULL,
+        value REAL NOT NULL,
+        time TEXT NOT NULL,
+        commission REAL DEFAULT 0,
+        slippage REAL DEFAULT 0,
+        realized_pnl REAL DEFAULT 0,
+        FOREIGN KEY (account_name) REFERENCES accounts(name)
+    )''',
+    # 净值历史表 (UNIQUE(account_name, date) 即 (account_name, date) 索引)
+    '''CREATE TABLE IF NOT EXISTS equity_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        account_name TEXT NOT NULL,
+        date TEXT NOT NULL,
+        equity REAL NOT NULL,
+        pnl REAL NOT NULL,
+        pnl_pct REAL NOT NULL,
+        UNIQUE(account_name, date),
+        FOREIGN KEY (account_name) REFERENCES accounts(name)
+    )''',
+    # 设置表
+    '''CREATE TABLE IF NOT EXISTS settings (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )''',
+    # 关注列表 (行情监控)
+    '''CREATE TABLE IF NOT EXISTS watchlist (
+        symbol TEXT PRIMARY KEY,
+        name TEXT,
+        last_price REAL,
+        last_update TEXT,
+        status TEXT DEFAULT 'unknown',
+        error TEXT
+    )''',
+]
+
+
+def _add_missing_columns(conn, table: str, columns: List[tuple]):
+    """ALTER TABLE ADD COLUMN for columns not yet present (older databases)."""
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, decl in columns:
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
+
+def _migrate_trade_cost_columns(conn):
+    _add_missing_columns(conn, 'trades', [
+        ('commission', 'REAL DEFAULT 0'),
+        ('slippage', 'REAL DEFAULT 0'),
+        ('realized_pnl', 'REAL DEFAULT 0'),
+    ])
+
+
+_COST_STATS_COLUMNS = '''
+    total_commission REAL NOT NULL DEFAULT 0,
+    total_slippage REAL NOT NULL DEFAULT 0,
+    total_realized_pnl REAL NOT NULL DEFAULT 0,
+    trade_count INTEGER NOT NULL DEFAULT 0
+'''
+
+
+def _migrate_cost_stats(conn):
+    conn.execute(f"CREATE TABLE IF NOT EXISTS account_cost_stats (account_name TEXT PRIMARY KEY, {_COST_STATS_COLUMNS})")
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS symbol_cost_stats (
+            account_name TEXT NOT NULL, symbol TEXT NOT NULL, {_COST_STATS_COLUMNS},
+            PRIMARY KEY (account_name, symbol)
+        )
+    ''')
+    _rebuild_cost_stats(conn)
+
+
+def _migrate_working_orders(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS working_orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            account_name TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            side TEXT NOT NULL,
+            order_type TEXT NOT NULL,
+            qty INTEGER NOT NULL,
+            remaining_qty INTEGER NOT NULL,
+            limit_price REAL,
+            stop_price REAL,
+            tif TEXT NOT NULL DEFAULT 'GTC',
+            session_date TEXT NOT NULL,
+            triggered INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'working',
+            source TEXT NOT NULL DEFAULT 'web',
+            clamp_sell INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_working_orders_status ON working_orders(status, symbol)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_working_orders_account ON working_orders(account_name, status, id)")
+    _add_missing_columns(conn, 'orders', [('working_order_id', 'INTEGER')])
+
+
+def _migrate_rng_streams(conn):
+    _add_missing_columns(conn, 'accounts', [('rng_seed', 'INTEGER'), ('rng_seq', 'INTEGER NOT NULL DEFAULT 0')])
+    _add_missing_columns(conn, 'orders', [('seed', 'INTEGER')])
+
+
+# (version, description, steps): steps is a list of SQL statements or a callable(conn); versions strictly increasing
+MIGRATIONS = [
+    (1, 'baseline schema', _SCHEMA_BASELINE),
+    (2, 'trades cost columns for databases created before commission/slippage/realized_pnl', _migrate_trade_cost_columns),
+    (3, 'account history indexes', [
+        "CREATE INDEX IF NOT EXISTS idx_orders_account_id ON orders(account_name, id)",
+        "CREATE INDEX IF NOT EXISTS idx_trades_account_id ON trades(account_name, id)",
+        "CREATE INDEX IF NOT EXISTS idx_trades_account_symbol_time ON trades(account_name, symbol, time)",
+    ]),
+    (4, 'history pagination indexes (symbol / time-ordered scans)', [
+        "CREATE INDEX IF NOT EXISTS idx_orders_account_symbol_time ON orders(account_name, symbol, time)",
+        "CREATE INDEX IF NOT EXISTS idx_trades_account_time ON trades(account_name, time, id)",
+    ]),
+    (5, 'running cost stats per account and per symbol (backfilled from trades)', _migrate_cost_stats),
+    (6, 'deferred fills (latency simulation queue)', [
+        '''CREATE TABLE IF NOT EXISTS pending_fills (
+            order_id INTEGER PRIMARY KEY,
+            account_name TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            side TEXT NOT NULL,
+            qty INTEGER NOT NULL,
+            price REAL NOT NULL,
+            source TEXT NOT NULL,
+            clamp_sell INTEGER NOT NULL DEFAULT 0,
+            fill_time TEXT,
+            due_at REAL NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            error TEXT,
+            created_at TEXT NOT NULL,
+            completed_at TEXT
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_pending_fills_status_due ON pending_fills(status, due_at)",
+    ]),
+    (7, 'working orders (resting limit / stop / stop-limit) and orders.working_order_id', _migrate_working_orders),
+    (8, 'seeded simulation streams: accounts.rng_seed / rng_seq, orders.seed', _migrate_rng_streams),
+    (9, 'webhook ingestion queue (async webhook signals)', [
+        '''CREATE TABLE IF NOT EXISTS webhook_signals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            account_name TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            order_time TEXT,
+            status TEXT NOT NULL DEFAULT 'queued',
+            http_status INTEGER,
+            result TEXT,
+            error TEXT,
+            created_at TEXT NOT NULL,
+            started_at TEXT,
+            completed_at TEXT
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_webhook_signals_status ON webhook_signals(status, id)",
+    ]),
+    (10, 'idempotency keys (webhook retry suppression)', [
+        '''CREATE TABLE IF NOT EXISTS idempotency_keys (
+            key TEXT PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'processing',
+            http_status INTEGER,
+            response TEXT,
+            created_at REAL NOT NULL
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON idempotency_keys(created_at)",
+    ]),
+]
+
+_migrated_paths: set = set()
+_init_lock = threading.Lock()
+
+
+def get_schema_version(conn=None) -> int:
+    """当前已应用的 schema 版本 (0 = 全新数据库)"""
+    if conn is None:
+        with get_connection() as c:
+            return get_schema_version(c)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+    ''')
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def run_migrations(conn) -> List[int]:
+    """
+    执行未应用的迁移 (每个版本一个事务，BEGIN IMMEDIATE 防止多进程同时迁移)。
+    Returns: 本次应用的版本列表
+    """
+    applied = []
+    if get_schema_version(conn) >= MIGRATIONS[-1][0]:
+        return applied
+    for version, description, steps in MIGRATIONS:
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            if callable(steps):
+                steps(conn)
+            else:
+                for sql in steps:
+                    conn.execute(sql)
+            conn.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, datetime.now(timezone.utc).isoformat())
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+        get_logger.info("db migrate: applied version=%s (%s) path=%s", version, description, DB_FILE)
+    return applied
+
+
+def _ensure_schema(conn):
+    """Run pending migrations once per database file per process (called when a pooled connection is opened)."""
+    if DB_FILE in _migrated_paths:
+        return
+    with _init_lock:
+        if DB_FILE in _migrated_paths:
+            return
+        run_migrations(conn)
+        _migrated_paths.add(DB_FILE)
+
+
+_seeded_paths: set = set()
 
 
 def init_db():
-    """初始化数据库表"""
-    with get_connection() as conn:
-        conn.executescript('''
-            -- 账户表
-            CREATE TABLE IF NOT EXISTS accounts (
-                name TEXT PRIMARY KEY,
-                initial_capital REAL NOT NULL,
-                cash REAL NOT NULL,
-                created_at TEXT NOT NULL
-            );
-            
-            -- 持仓表
-            CREATE TABLE IF NOT EXISTS positions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                account_name TEXT NOT NULL,
-                symbol TEXT NOT NULL,
-                qty INTEGER NOT NULL,
-                avg_price REAL NOT NULL,
-                UNIQUE(account_name, symbol),
-                FOREIGN KEY (account_name) REFERENCES accounts(name)
-            );
-            
-            -- 订单表
-            CREATE TABLE IF NOT EXISTS orders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                account_name TEXT NOT NULL,
-                symbol TEXT NOT NULL,
-                side TEXT NOT NULL,
-                qty INTEGER NOT NULL,
-                price REAL NOT NULL,
-                value REAL NOT NULL,
-                time TEXT NOT NULL,
-                status TEXT NOT NULL,
-                source TEXT DEFAULT 'web',
-                FOREIGN KEY (account_name) REFERENCES accounts(name)
-            );
-            
-            -- 成交表（commission/slippage/realized_pnl 用于统计累积亏损）
-            CREATE TABLE IF NOT EXISTS trades (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                account_name TEXT NOT NULL,
-                symbol TEXT NOT NULL,
-                side TEXT NOT NULL,
-                qty INTEGER NOT NULL,
-                price REAL NOT NULL,
-                value REAL NOT NULL,
-                time TEXT NOT NULL,
-                commission REAL DEFAULT 0,
-                slippage REAL DEFAULT 0,
-                realized_pnl REAL DEFAULT 0,
-                FOREIGN KEY (account_name) REFERENCES accounts(name)
-            );
-            
-            -- 净值历史表
-            CREATE TABLE IF NOT EXISTS equity_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                account_name TEXT NOT NULL,
-                date TEXT NOT NULL,
-                equity REAL NOT NULL,
-                pnl REAL NOT NULL,
-                pnl_pct REAL NOT NULL,
-                UNIQUE(account_name, date),
-                FOREIGN KEY (account_name) REFERENCES accounts(name)
-            );
-            
-            -- 设置表
-            CREATE TABLE IF NOT EXISTS settings (
-                key TEXT PRIMARY KEY,
-                value TEXT NOT NULL
-            );
-            
-            -- 关注列表 (行情监控)
-            CREATE TABLE IF NOT EXISTS watchlist (
-                symbol TEXT PRIMARY KEY,
-                name TEXT,
-                last_price REAL,
-                last_update TEXT,
-                status TEXT DEFAULT 'unknown',
-                error TEXT
-            );
-        ''')
-        
+    """初始化数据库: 执行迁移 + 默认账户/关注列表 (每个数据库文件每进程只执行一次)"""
+    if DB_FILE in _seeded_paths:
+        return
+    with get_connection() as conn:
         # 初始化默认账户（如果不存在）；模拟时用 stime 当前日期，否则用服务器当天
         cursor = conn.execute("SELECT COUNT(*) FROM accounts")
         if cursor.fetchone()[0] == 0:
@@ -172,6 +524,7 @@ def init_db():
                     (symbol, name)
                 )
             get_logger.info("db write init_db: default watchlist initialized symbols=%s", [s for s, _ in DEFAULT_WATCHLIST])
+    _seeded_paths.add(DB_FILE)
 
 
 # ============================================================
@@ -207,6 +560,10 @@ def delete_account(name: str) -> bool:
         conn.execute("DELETE FROM positions WHERE account_name = ?", (name,))
         conn.execute("DELETE FROM orders WHERE account_name = ?", (name,))
         conn.execute("DELETE FROM trades WHERE account_name = ?", (name,))
+        conn.execute("DELETE FROM account_cost_stats WHERE account_name = ?", (name,))
+        conn.execute("DELETE FROM symbol_cost_stats WHERE account_name = ?", (name,))
+        conn.execute("DELETE FROM pending_fills WHERE account_name = ?", (name,))
+        conn.execute("DELETE FROM working_orders WHERE account_name = ?", (name,))
         conn.execute("DELETE FROM equity_history WHERE account_name = ?", (name,))
         cursor = conn.execute("DELETE FROM accounts WHERE name = ?", (name,))
         n = cursor.rowcount
@@ -238,6 +595,12 @@ def update_account_cash(name: str, cash: float):
         get_logger.info("db write update_account_cash: name=%s cash=%s", name, cash)
 
 
+def set_account_rng(name: str, rng_seed: int, rng_seq: int):
+    """Account's simulation stream: base seed and number of orders drawn (core.execution, in the fill transaction)"""
+    with get_connection() as conn:
+        conn.execute("UPDATE accounts SET rng_seed = ?, rng_seq = ? WHERE name = ?", (rng_seed, rng_seq, name))
+
+
 def reset_account(name: str, capital: float = None, as_of_date=None):
     """重置账户。as_of_date 为仿真日期时传入，否则用服务器当天，避免仿真时混入 2026/1/31 等系统日期。"""
     with get_connection() as conn:
@@ -253,10 +616,14 @@ def reset_account(name: str, capital: float = None, as_of_date=None):
         conn.execute("DELETE FROM positions WHERE account_name = ?", (name,))
         conn.execute("DELETE FROM orders WHERE account_name = ?", (name,))
         conn.execute("DELETE FROM trades WHERE account_name = ?", (name,))
+        conn.execute("DELETE FROM account_cost_stats WHERE account_name = ?", (name,))
+        conn.execute("DELETE FROM symbol_cost_stats WHERE account_name = ?", (name,))
+        conn.execute("DELETE FROM pending_fills WHERE account_name = ?", (name,))
+        conn.execute("DELETE FROM working_orders WHERE account_name = ?", (name,))
         conn.execute("DELETE FROM equity_history WHERE account_name = ?", (name,))
         
         conn.execute(
-            "UPDATE accounts SET initial_capital = ?, cash = ?, created_at = ? WHERE name = ?",
+            "UPDATE accounts SET initial_capital = ?, cash = ?, created_at = ?, rng_seq = 0 WHERE name = ?",
             (new_capital, new_capital, now_str, name)
         )
         
@@ -295,6 +662,17 @@ def set_current_account(name: str):
 # 持仓操作
 # ============================================================
 
+def get_all_positions() -> Dict[str, Dict[str, Dict]]:
+    """所有账户的持仓 (一次查询): {account: {symbol: {'qty', 'avg_price'}}}；无持仓的账户不出现。"""
+    out: Dict[str, Dict[str, Dict]] = {}
+    with get_connection() as conn:
+        # 与 get_positions 同序 (UNIQUE(account_name, symbol) 索引), 估值求和结果逐位一致
+        rows = conn.execute("SELECT account_name, symbol, qty, avg_price FROM positions ORDER BY account_name, symbol")
+        for row in rows:
+            out.setdefault(row['account_name'], {})[row['symbol']] = {'qty': row['qty'], 'avg_price': row['avg_price']}
+    return out
+
+
 def get_positions(account_name: str) -> Dict[str, Dict]:
     """获取持仓"""
     with get_connection() as conn:
@@ -342,38 +720,347 @@ def get_position(account_name: str, symbol: str) -> Optional[Dict]:
 # ============================================================
 
 def add_order(account_name: str, symbol: str, side: str, qty: int, 
-              price: float, status: str = 'filled', source: str = 'web', order_time=None) -> int:
-    """Add order. order_time: optional datetime for sim mode (X-Simulation-Time)."""
+              price: float, status: str = 'filled', source: str = 'web', order_time=None,
+              working_order_id: int = None, seed: int = None) -> int:
+    """
+    Add order. order_time: optional datetime for sim mode (X-Simulation-Time); working_order_id: resting order filled;
+    seed: simulation seed the fill was (or will be) drawn with.
+    """
     now = (order_time.isoformat() if order_time is not None else _now_iso())
     value = qty * price
     with get_connection() as conn:
         cursor = conn.execute('''
-            INSERT INTO orders (account_name, symbol, side, qty, price, value, time, status, source)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (account_name, symbol, side, qty, price, value, now, status, source))
+            INSERT INTO orders (account_name, symbol, side, qty, price, value, time, status, source, working_order_id,
+                                seed)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (account_name, symbol, side, qty, price, value, now, status, source, working_order_id, seed))
         order_id = cursor.lastrowid
         get_logger.info("db write add_order: order_id=%s account=%s symbol=%s side=%s qty=%s price=%s",
                         order_id, account_name, symbol, side, qty, price)
         return order_id
 
 
+def update_order_fill(order_id: int, qty: int, price: float, status: str, order_time=None):
+    """Fill a previously accepted (pending) order row: final qty/price/value/status, time = fill time."""
+    now = (order_time.isoformat() if order_time is not None else _now_iso())
+    with get_connection() as conn:
+        conn.execute(
+            "UPDATE orders SET qty = ?, price = ?, value = ?, time = ?, status = ? WHERE id = ?",
+            (qty, price, qty * price, now, status, order_id),
+        )
+        get_logger.info("db write update_order_fill: order_id=%s qty=%s price=%s status=%s", order_id, qty, price, status)
+
+
+def get_order(order_id: int) -> Optional[Dict]:
+    """One order by id; deferred orders also carry 'pending' (status/due_at/error of the fill queue entry)."""
+    with get_connection() as conn:
+        row = conn.execute("SELECT * FROM orders WHERE id = ?", (order_id,)).fetchone()
+        if not row:
+            return None
+        order = dict(row)
+        pending = conn.execute(
+            "SELECT status, due_at, fill_time, error, created_at, completed_at FROM pending_fills WHERE order_id = ?",
+            (order_id,)
+        ).fetchone()
+        if pending:
+            order['pending'] = dict(pending)
+        return order
+
+
+def add_pending_fill(order_id: int, account_name: str, symbol: str, side: str, qty: int, price: float,
+                     source: str, clamp_sell: bool, fill_time: Optional[str], due_at: float):
+    """Queue an accepted order for a deferred fill. due_at: wall-clock epoch seconds; fill_time: ISO (sim) or None."""
+    with get_connection() as conn:
+        conn.execute('''
+            INSERT INTO pending_fills (order_id, account_name, symbol, side, qty, price, source, clamp_sell,
+                                       fill_time, due_at, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (order_id, account_name, symbol, side, qty, price, source, int(clamp_sell), fill_time, due_at,
+              datetime.now(timezone.utc).isoformat()))
+
+
+def get_pending_fill(order_id: int) -> Optional[Dict]:
+    with get_connection() as conn:
+        row = conn.execute("SELECT * FROM pending_fills WHERE order_id = ?", (order_id,)).fetchone()
+        return dict(row) if row else None
+
+
+def list_pending_fills() -> List[Dict]:
+    """Fill queue entries still waiting (status='pending'), earliest due first (restart recovery)."""
+    with get_connection() as conn:
+        cursor = conn.execute("SELECT * FROM pending_fills WHERE status = 'pending' ORDER BY due_at, order_id")
+        return [dict(row) for row in cursor.fetchall()]
+
+
+def complete_pending_fill(order_id: int, status: str, error: str = None):
+    """Mark a queue entry done ('filled' / 'rejected'); rejected also sets the order row status."""
+    with get_connection() as conn:
+        conn.execute(
+            "UPDATE pending_fills SET status = ?, error = ?, completed_at = ? WHERE order_id = ?",
+            (status, error, datetime.now(timezone.utc).isoformat(), order_id),
+        )
+        if status == 'rejected':
+            conn.execute("UPDATE orders SET status = 'rejected' WHERE id = ?", (order_id,))
+        get_logger.info("db write complete_pending_fill: order_id=%s status=%s error=%s", order_id, status, error)
+
+
+# ============================================================
+# Webhook 异步接收队列
+# ============================================================
+
+def add_webhook_signal(account_name: str, payload: str, order_time: Optional[str]) -> int:
+    """Store an accepted webhook signal (status 'queued'); payload: JSON text, order_time: ISO or None."""
+    with get_connection() as conn:
+        cursor = conn.execute(
+            "INSERT INTO webhook_signals (account_name, payload, order_time, created_at) VALUES (?, ?, ?, ?)",
+            (account_name, payload, order_time, datetime.now(timezone.utc).isoformat()),
+        )
+        return cursor.lastrowid
+
+
+def get_webhook_signal(signal_id: int) -> Optional[Dict]:
+    with get_connection() as conn:
+        row = conn.execute("SELECT * FROM webhook_signals WHERE id = ?", (signal_id,)).fetchone()
+        return dict(row) if row else None
+
+
+def update_webhook_signal(signal_id: int, status: str, http_status: int = None, result: str = None,
+                          error: str = None):
+    """'processing' sets started_at; any other status completes the signal (completed_at, http_status, result)."""
+    now = datetime.now(timezone.utc).isoformat()
+    with get_connection() as conn:
+        if status == 'processing':
+            conn.execute("UPDATE webhook_signals SET status = ?, started_at = ? WHERE id = ?", (status, now, signal_id))
+        else:
+            conn.execute(
+                "UPDATE webhook_signals SET status = ?, http_status = ?, result = ?, error = ?, completed_at = ? "
+                "WHERE id = ?",
+                (status, http_status, result, error, now, signal_id),
+            )
+
+
+def list_webhook_signals(statuses: List[str]) -> List[Dict]:
+    """Signals in the given statuses, oldest first (restart recovery)."""
+    marks = ','.join('?' * len(statuses))
+    with get_connection() as conn:
+        cursor = conn.execute(f"SELECT * FROM webhook_signals WHERE status IN ({marks}) ORDER BY id", statuses)
+        return [dict(row) for row in cursor.fetchall()]
+
+
+# ============================================================
+# 幂等键 (Webhook 重试去重)
+# ============================================================
+
+def reserve_idempotency_key(key: str, fingerprint: str, now: float, ttl: float, lease: float) -> Optional[Dict]:
+    """
+    Claim key (status 'processing') unless a row younger than ttl exists. Returns None if claimed, else the existing
+    row (status 'processing' = still running, 'done' = http_status / response JSON stored). now: epoch seconds.
+    A 'processing' claim older than lease (its request crashed or hung) is taken over.
+    """
+    with transaction() as conn:
+        conn.execute("DELETE FROM idempotency_keys WHERE key = ? AND (created_at < ? OR "
+                     "(status = 'processing' AND created_at < ?))", (key, now - ttl, now - lease))
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO idempotency_keys (key, fingerprint, created_at) VALUES (?, ?, ?)",
+            (key, fingerprint, now),
+        )
+        if cursor.rowcount == 1:
+            return None
+        row = conn.execute("SELECT * FROM idempotency_keys WHERE key = ?", (key,)).fetchone()
+        return dict(row) if row else None
+
+
+def complete_idempotency_key(key: str, http_status: int, response: str):
+    with get_connection() as conn:
+        conn.execute("UPDATE idempotency_keys SET status = 'done', http_status = ?, response = ? WHERE key = ?",
+                     (http_status, response, key))
+
+
+def delete_idempotency_key(key: str):
+    with get_connection() as conn:
+        conn.execute("DELETE FROM idempotency_keys WHERE key = ?", (key,))
+
+
+def clear_idempotency_claims() -> int:
+    """Delete 'processing' claims (requests of a previous process that never stored a response); returns count."""
+    with get_connection() as conn:
+        n = conn.execute("DELETE FROM idempotency_keys WHERE status = 'processing'").rowcount
+        if n:
+            get_logger.info("db write clear_idempotency_claims: rows_deleted=%s", n)
+        return n
+
+
+def prune_idempotency_keys(before: float) -> int:
+    """Delete keys created before epoch seconds `before`; returns count."""
+    with get_connection() as conn:
+        return conn.execute("DELETE FROM idempotency_keys WHERE created_at < ?", (before,)).rowcount
+
+
+# ============================================================
+# 挂单 (限价 / 止损 / 止损限价)
+# ============================================================
+
+def add_working_order(account_name: str, symbol: str, side: str, order_type: str, qty: int,
+                      limit_price: Optional[float], stop_price: Optional[float], tif: str, session_date: str,
+                      source: str = 'web', clamp_sell: bool = False, order_time=None) -> int:
+    """Insert a resting order (status 'working'); session_date: YYYY-MM-DD the order was placed (DAY expiry)."""
+    now = (order_time.isoformat() if order_time is not None else _now_iso())
+    with get_connection() as conn:
+        cursor = conn.execute('''
+            INSERT INTO working_orders (account_name, symbol, side, order_type, qty, remaining_qty, limit_price,
+                                        stop_price, tif, session_date, source, clamp_sell, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (account_name, symbol, side, order_type, qty, qty, limit_price, stop_price, tif, session_date, source,
+              int(clamp_sell), now, now))
+        get_logger.info("db write add_working_order: id=%s account=%s symbol=%s side=%s type=%s qty=%s limit=%s stop=%s tif=%s",
+                        cursor.lastrowid, account_name, symbol, side, order_type, qty, limit_price, stop_price, tif)
+        return cursor.lastrowid
+
+
+def get_working_order(order_id: int) -> Optional[Dict]:
+    with get_connection() as conn:
+        row = conn.execute("SELECT * FROM working_orders WHERE id = ?", (order_id,)).fetchone()
+        return dict(row) if row else None
+
+
+def list_working_orders(account_name: str = None, status: Optional[str] = 'working') -> List[Dict]:
+    """Resting orders, oldest first; account_name None = all accounts; status None = any status."""
+    query, params = "SELECT * FROM working_orders WHERE 1 = 1", []
+    if account_name is not None:
+        query += " AND account_name = ?"
+        params.append(account_name)
+    if status is not None:
+        query += " AND status = ?"
+        params.append(status)
+    with get_connection() as conn:
+        return [dict(row) for row in conn.execute(query + " ORDER BY id", params).fetchall()]
+
+
+def update_working_order(order_id: int, status: str = None, triggered: bool = None, error: str = None):
+    """Set status ('cancelled' / 'expired' / 'rejected' ...), stop-limit triggered flag and/or error."""
+    sets, params = ["updated_at = ?"], [_now_iso()]
+    if status is not None:
+        sets.append("status = ?")
+        params.append(status)
+    if triggered is not None:
+        sets.append("triggered = ?")
+        params.append(int(triggered))
+    if error is not None:
+        sets.append("error = ?")
+        params.append(error)
+    with get_connection() as conn:
+        conn.execute(f"UPDATE working_orders SET {', '.join(sets)} WHERE id = ?", params + [order_id])
+        get_logger.info("db write update_working_order: id=%s status=%s triggered=%s error=%s",
+                        order_id, status, triggered, error)
+
+
+def fill_working_order(order_id: int, filled_qty: int, done: bool = False):
+    """Record a fill against a resting order (same transaction as the fill); 'filled' when nothing remains or done."""
+    with get_connection() as conn:
+        conn.execute('''
+            UPDATE working_orders
+            SET remaining_qty = CASE WHEN ? THEN 0 ELSE MAX(0, remaining_qty - ?) END,
+                status = CASE WHEN ? OR remaining_qty - ? <= 0 THEN 'filled' ELSE status END,
+                updated_at = ?
+            WHERE id = ?
+        ''', (int(done), filled_qty, int(done), filled_qty, _now_iso(), order_id))
+        get_logger.info("db write fill_working_order: id=%s filled_qty=%s done=%s", order_id, filled_qty, done)
+
+
 def get_orders(account_name: str, limit: int = 100) -> List[Dict]:
-    """获取订单历史"""
+    """获取订单历史 (最新在前)"""
+    return query_orders(account_name, limit=limit)
+
+
+def query_orders(account_name: str, limit: int = 100, before_id: int = None, after_id: int = None,
+                 symbol: str = None, side: str = None, source: str = None,
+                 start_time: str = None, end_time: str = None) -> List[Dict]:
+    """
+    订单历史 keyset 分页。before_id (或无游标): id < before_id，最新在前；after_id: id > after_id，最旧在前。
+    start_time/end_time: ISO 字符串，time >= start_time / time <= end_time。
+    """
+    return _query_history('orders', account_name, limit, before_id, after_id,
+                          {'symbol': symbol, 'side': side, 'source': source}, start_time, end_time)
+
+
+def iter_orders(account_name: str, batch_size: int = 1000, descending: bool = False, **filters) -> Iterator[Dict]:
+    """遍历全部订单 (keyset 分批，常量内存)。filters 同 query_orders。"""
+    return _iter_history(query_orders, account_name, batch_size, descending, filters)
+
+
+# ============================================================
+# 历史记录 keyset 分页 (orders / trades 共用)
+# ============================================================
+
+_HISTORY_FILTERS = {
+    'orders': ('symbol', 'side', 'source'),
+    'trades': ('symbol', 'side'),
+}
+
+
+def _query_history(table: str, account_name: str, limit: int, before_id: Optional[int], after_id: Optional[int],
+                   filters: Dict[str, Any], start_time: Optional[str], end_time: Optional[str],
+                   order_by_time: bool = False, after_time: Optional[str] = None) -> List[Dict]:
+    """
+    One keyset page of orders/trades for an account. Walks (account_name, id) (or (account_name, symbol, time)
+    when filtered by symbol); never uses OFFSET. order_by_time: ascending (time, id), cursor (after_time, after_id).
+    """
+    where = ["account_name = ?"]
+    params: List[Any] = [account_name]
+    for column in _HISTORY_FILTERS[table]:
+        value = filters.get(column)
+        if value:
+            where.append(f"{column} = ?")
+            params.append(value)
+    if start_time:
+        where.append("time >= ?")
+        params.append(start_time)
+    if end_time:
+        where.append("time <= ?")
+        params.append(end_time)
+    if order_by_time:
+        if after_time is not None:
+            where.append("(time > ? OR (time = ? AND id > ?))")
+            params.extend([after_time, after_time, after_id or 0])
+        order = "time ASC, id ASC"
+    elif after_id is not None:
+        where.append("id > ?")
+        params.append(int(after_id))
+        order = "id ASC"
+    else:
+        if before_id is not None:
+            where.append("id < ?")
+            params.append(int(before_id))
+        order = "id DESC"
+    params.append(int(limit))
     with get_connection() as conn:
         cursor = conn.execute(
-            "SELECT * FROM orders WHERE account_name = ? ORDER BY id DESC LIMIT ?",
-            (account_name, limit)
+            f"SELECT * FROM {table} WHERE {' AND '.join(where)} ORDER BY {order} LIMIT ?",
+            params
         )
         return [dict(row) for row in cursor.fetchall()]
 
 
+def _iter_history(query, account_name: str, batch_size: int, descending: bool, filters: Dict[str, Any]) -> Iterator[Dict]:
+    cursor_id = None
+    while True:
+        if descending:
+            rows = query(account_name, limit=batch_size, before_id=cursor_id, **filters)
+        else:
+            rows = query(account_name, limit=batch_size, after_id=cursor_id if cursor_id is not None else 0, **filters)
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        cursor_id = rows[-1]['id']
+
+
 # ============================================================
 # 成交操作
 # ============================================================
 
 def add_trade(account_name: str, symbol: str, side: str, qty: int, price: float, order_time=None,
               commission: float = 0, slippage: float = 0, realized_pnl: float = 0) -> int:
-    """Add trade. order_time: optional datetime for sim mode."""
+    """Add trade (and increment cost stats in the same transaction). order_time: optional datetime for sim mode."""
     now = (order_time.isoformat() if order_time is not None else _now_iso())
     value = qty * price
     with get_connection() as conn:
@@ -382,65 +1069,175 @@ def add_trade(account_name: str, symbol: str, side: str, qty: int, price: float,
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (account_name, symbol, side, qty, price, value, now, commission, slippage, realized_pnl))
         trade_id = cursor.lastrowid
+        _add_cost_stats(conn, account_name, symbol, commission, slippage, realized_pnl)
         get_logger.info("db write add_trade: trade_id=%s account=%s symbol=%s side=%s qty=%s price=%s commission=%s slippage=%s realized_pnl=%s",
                         trade_id, account_name, symbol, side, qty, price, commission, slippage, realized_pnl)
         return trade_id
 
 
 def get_trades(account_name: str, limit: int = 100) -> List[Dict]:
-    """获取成交记录"""
+    """获取成交记录 (最新在前)"""
+    return query_trades(account_name, limit=limit)
+
+
+def query_trades(account_name: str, limit: int = 100, before_id: int = None, after_id: int = None,
+                 symbol: str = None, side: str = None, start_time: str = None, end_time: str = None) -> List[Dict]:
+    """成交记录 keyset 分页，参数语义同 query_orders (成交无 source)。"""
+    return _query_history('trades', account_name, limit, before_id, after_id,
+                          {'symbol': symbol, 'side': side}, start_time, end_time)
+
+
+def iter_trades(account_name: str, batch_size: int = 1000, descending: bool = False,
+                by_time: bool = False, **filters) -> Iterator[Dict]:
+    """
+    遍历全部成交 (keyset 分批，常量内存)。
+    by_time=True: 按 (time, id) 升序 (FIFO 配对用)；否则按 id (descending=True 时最新在前)。
+    """
+    if not by_time:
+        return _iter_history(query_trades, account_name, batch_size, descending, filters)
+    return _iter_trades_by_time(account_name, batch_size, filters)
+
+
+def _iter_trades_by_time(account_name: str, batch_size: int, filters: Dict[str, Any]) -> Iterator[Dict]:
+    after_time, after_id = None, None
+    while True:
+        rows = _query_history('trades', account_name, batch_size, None, after_id, filters,
+                              filters.get('start_time'), filters.get('end_time'),
+                              order_by_time=True, after_time=after_time)
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        after_time, after_id = rows[-1]['time'], rows[-1]['id']
+
+
+_COST_STATS_ZERO = {'total_commission': 0.0, 'total_slippage': 0.0, 'total_realized_pnl': 0.0, 'trade_count': 0}
+
+
+def _add_cost_stats(conn, account_name: str, symbol: str, commission: float, slippage: float, realized_pnl: float):
+    """Increment running cost totals (account and account+symbol) in the caller's transaction."""
+    params = (commission or 0, slippage or 0, realized_pnl or 0)
+    conn.execute('''
+        INSERT INTO account_cost_stats (account_name, total_commission, total_slippage, total_realized_pnl, trade_count)
+        VALUES (?, ?, ?, ?, 1)
+        ON CONFLICT(account_name) DO UPDATE SET
+            total_commission = total_commission + excluded.total_commission,
+            total_slippage = total_slippage + excluded.total_slippage,
+            total_realized_pnl = total_realized_pnl + excluded.total_realized_pnl,
+            trade_count = trade_count + 1
+    ''', (account_name,) + params)
+    conn.execute('''
+        INSERT INTO symbol_cost_stats (account_name, symbol, total_commission, total_slippage, total_realized_pnl, trade_count)
+        VALUES (?, ?, ?, ?, ?, 1)
+        ON CONFLICT(account_name, symbol) DO UPDATE SET
+            total_commission = total_commission + excluded.total_commission,
+            total_slippage = total_slippage + excluded.total_slippage,
+            total_realized_pnl = total_realized_pnl + excluded.total_realized_pnl,
+            trade_count = trade_count + 1
+    ''', (account_name, symbol) + params)
+
+
+def _stats_row(row) -> Dict[str, Any]:
+    return {
+        'total_commission': float(row['total_commission']),
+        'total_slippage': float(row['total_slippage']),
+        'total_realized_pnl': float(row['total_realized_pnl']),
+        'trade_count': int(row['trade_count']),
+    }
+
+
+def get_account_cost_stats(account_name: str) -> Dict[str, float]:
+    """
+    账户累积亏损统计：手续费、滑点、市场(已实现盈亏)。
+    读 account_cost_stats 的累计值 (与 add_trade 同事务递增)，O(1)；无成交时为 0。
+    """
+    with get_connection() as conn:
+        row = conn.execute(
+            "SELECT * FROM account_cost_stats WHERE account_name = ?", (account_name,)
+        ).fetchone()
+        return _stats_row(row) if row else dict(_COST_STATS_ZERO)
+
+
+def get_symbol_cost_stats(account_name: str) -> Dict[str, Dict[str, float]]:
+    """按 symbol 的累积手续费/滑点/已实现盈亏: {symbol: stats}"""
     with get_connection() as conn:
         cursor = conn.execute(
-            "SELECT * FROM trades WHERE account_name = ? ORDER BY id DESC LIMIT ?",
-            (account_name, limit)
+            "SELECT * FROM symbol_cost_stats WHERE account_name = ? ORDER BY symbol", (account_name,)
         )
-        return [dict(row) for row in cursor.fetchall()]
+        return {row['symbol']: _stats_row(row) for row in cursor.fetchall()}
 
 
-def get_account_cost_stats(account_name: str) -> Dict[str, float]:
+_COST_STATS_AGGREGATE = '''
+    COALESCE(SUM(commission), 0) AS total_commission, COALESCE(SUM(slippage), 0) AS total_slippage,
+    COALESCE(SUM(realized_pnl), 0) AS total_realized_pnl, COUNT(*) AS trade_count
+'''
+
+
+def _rebuild_cost_stats(conn, account_name: Optional[str] = None):
+    where, params = ("WHERE account_name = ?", (account_name,)) if account_name else ("", ())
+    conn.execute(f"DELETE FROM account_cost_stats {where}", params)
+    conn.execute(f"DELETE FROM symbol_cost_stats {where}", params)
+    conn.execute(f'''
+        INSERT INTO account_cost_stats (account_name, total_commission, total_slippage, total_realized_pnl, trade_count)
+        SELECT account_name, {_COST_STATS_AGGREGATE} FROM trades {where} GROUP BY account_name
+    ''', params)
+    conn.execute(f'''
+        INSERT INTO symbol_cost_stats (account_name, symbol, total_commission, total_slippage, total_realized_pnl, trade_count)
+        SELECT account_name, symbol, {_COST_STATS_AGGREGATE} FROM trades {where} GROUP BY account_name, symbol
+    ''', params)
+
+
+def rebuild_cost_stats(account_name: str = None) -> int:
+    """从 trades 全量重算累计统计 (account_name=None: 全部账户)。Returns: 重建后的账户行数"""
+    with transaction() as conn:
+        _rebuild_cost_stats(conn, account_name)
+        where, params = ("WHERE account_name = ?", (account_name,)) if account_name else ("", ())
+        n = conn.execute(f"SELECT COUNT(*) FROM account_cost_stats {where}", params).fetchone()[0]
+    get_logger.info("db write rebuild_cost_stats: account=%s rows=%s", account_name or '*', n)
+    return n
+
+
+def verify_cost_stats(account_name: str = None, tolerance: float = 1e-6) -> List[Dict[str, Any]]:
     """
-    账户累积亏损统计：手续费、滑点、市场(已实现盈亏)。
-    从 trades 表 SUM(commission), SUM(slippage), SUM(realized_pnl)；旧数据无列时按 0 计。
+    对比累计统计与 trades 全量 SUM，返回不一致项列表 (空列表 = 一致)。
+    每项: {'account', 'symbol' (None=账户合计), 'field', 'stored', 'expected'}
     """
+    where, params = ("WHERE account_name = ?", (account_name,)) if account_name else ("", ())
+    mismatches = []
     with get_connection() as conn:
-        try:
-            cursor = conn.execute('''
-                SELECT COALESCE(SUM(commission), 0), COALESCE(SUM(slippage), 0), COALESCE(SUM(realized_pnl), 0)
-                FROM trades WHERE account_name = ?
-            ''', (account_name,))
-            row = cursor.fetchone()
-            if row is not None:
-                return {
-                    'total_commission': float(row[0]),
-                    'total_slippage': float(row[1]),
-                    'total_realized_pnl': float(row[2]),
-                }
-        except Exception:
-            pass
-    return {'total_commission': 0.0, 'total_slippage': 0.0, 'total_realized_pnl': 0.0}
+        expected = {
+            (row['account_name'], None): _stats_row(row) for row in conn.execute(
+                f"SELECT account_name, {_COST_STATS_AGGREGATE} FROM trades {where} GROUP BY account_name", params)
+        }
+        expected.update({
+            (row['account_name'], row['symbol']): _stats_row(row) for row in conn.execute(
+                f"SELECT account_name, symbol, {_COST_STATS_AGGREGATE} FROM trades {where} GROUP BY account_name, symbol",
+                params)
+        })
+        stored = {(row['account_name'], None): _stats_row(row)
+                  for row in conn.execute(f"SELECT * FROM account_cost_stats {where}", params)}
+        stored.update({(row['account_name'], row['symbol']): _stats_row(row)
+                       for row in conn.execute(f"SELECT * FROM symbol_cost_stats {where}", params)})
+    for key in sorted(set(expected) | set(stored), key=lambda k: (k[0], k[1] or '')):
+        exp = expected.get(key, _COST_STATS_ZERO)
+        got = stored.get(key, _COST_STATS_ZERO)
+        for field in _COST_STATS_ZERO:
+            if abs(got[field] - exp[field]) > tolerance:
+                mismatches.append({'account': key[0], 'symbol': key[1], 'field': field,
+                                   'stored': got[field], 'expected': exp[field]})
+    return mismatches
 
 
 # ============================================================
 # 净值历史
 # ============================================================
 
-def update_equity_history(account_name: str, quotes: dict = None, as_of_date=None):
+def value_positions(account: Dict, positions: Dict[str, Dict], quotes: dict = None) -> Dict[str, Any]:
     """
-    更新净值历史
-    
-    Args:
-        account_name: 账户名
-        quotes: 实时行情 {symbol: {'price': float}}
-                如果提供则用市价，否则用成本价
-        as_of_date: 净值日期 (datetime/date 或 'YYYY-MM-DD')；仿真时传 X-Simulation-Time 的日期，否则用服务器当天
-    """
-    account = get_account(account_name)
-    if not account:
-        return
-
-    positions = get_positions(account_name)
+    账户估值 (纯计算, 不读写数据库)。
+    持仓市值优先用行情价；行情失败（503/超时/无数据）或 price<=0 时用买入成本价。
 
-    # 计算持仓市值：优先行情价；行情失败（503/超时/无数据）或 price<=0 时用买入成本价
+    Returns: {'position_value', 'equity', 'pnl', 'pnl_pct', 'details': [(symbol, qty, avg_price, price_used, mv, source)]}
+    """
     position_value = 0
     position_details = []
     for symbol, pos in positions.items():
@@ -466,29 +1263,56 @@ def update_equity_history(account_name: str, quotes: dict = None, as_of_date=Non
     equity = account['cash'] + position_value
     pnl = equity - account['initial_capital']
     pnl_pct = (pnl / account['initial_capital']) * 100 if account['initial_capital'] > 0 else 0
+    return {'position_value': position_value, 'equity': equity, 'pnl': pnl, 'pnl_pct': pnl_pct,
+            'details': position_details}
 
+
+def equity_date_str(as_of_date=None) -> str:
+    """净值日期 'YYYY-MM-DD': as_of_date (datetime/date 或字符串) 或当天 (仿真日期)。"""
     if as_of_date is not None:
         if hasattr(as_of_date, 'strftime'):
-            date_str = as_of_date.strftime('%Y-%m-%d')
-        else:
-            date_str = str(as_of_date)[:10]
-    else:
-        date_str = _today_date().strftime('%Y-%m-%d')
-
-    for sym, q, avg, pused, mv, src in position_details:
-        get_logger.info("equity position: account=%s date=%s symbol=%s qty=%s avg_price=%s price_used=%s source=%s mv=%s",
-                        account_name, date_str, sym, q, avg, pused, src, mv)
-    get_logger.info("update equity history: account=%s date=%s cash=%s position_value=%s equity=%s pnl=%s pnl_pct=%s",
-                    account_name, date_str, account['cash'], position_value, equity, pnl, pnl_pct)
+            return as_of_date.strftime('%Y-%m-%d')
+        return str(as_of_date)[:10]
+    return _today_date().strftime('%Y-%m-%d')
 
 
+def upsert_equity_history(rows: List[tuple]) -> int:
+    """Upsert (account_name, date, equity, pnl, pnl_pct) rows with one executemany (joins the caller's transaction)."""
     with get_connection() as conn:
-        conn.execute('''
+        conn.executemany('''
             INSERT INTO equity_history (account_name, date, equity, pnl, pnl_pct)
             VALUES (?, ?, ?, ?, ?)
             ON CONFLICT(account_name, date)
-            DO UPDATE SET equity = ?, pnl = ?, pnl_pct = ?
-        ''', (account_name, date_str, equity, pnl, pnl_pct, equity, pnl, pnl_pct))
+            DO UPDATE SET equity = excluded.equity, pnl = excluded.pnl, pnl_pct = excluded.pnl_pct
+        ''', rows)
+    return len(rows)
+
+
+def update_equity_history(account_name: str, quotes: dict = None, as_of_date=None):
+    """
+    更新净值历史
+    
+    Args:
+        account_name: 账户名
+        quotes: 实时行情 {symbol: {'price': float}}
+                如果提供则用市价，否则用成本价
+        as_of_date: 净值日期 (datetime/date 或 'YYYY-MM-DD')；仿真时传 X-Simulation-Time 的日期，否则用服务器当天
+    """
+    account = get_account(account_name)
+    if not account:
+        return
+
+    value = value_positions(account, get_positions(account_name), quotes)
+    date_str = equity_date_str(as_of_date)
+
+    for sym, q, avg, pused, mv, src in value['details']:
+        get_logger.info("equity position: account=%s date=%s symbol=%s qty=%s avg_price=%s price_used=%s source=%s mv=%s",
+                        account_name, date_str, sym, q, avg, pused, src, mv)
+    get_logger.info("update equity history: account=%s date=%s cash=%s position_value=%s equity=%s pnl=%s pnl_pct=%s",
+                    account_name, date_str, account['cash'], value['position_value'], value['equity'], value['pnl'],
+                    value['pnl_pct'])
+
+    upsert_equity_history([(account_name, date_str, value['equity'], value['pnl'], value['pnl_pct'])])
 
 
 def get_equity_history(account_name: str) -> List[Dict]:
@@ -508,6 +1332,13 @@ def get_equity_history_dates() -> set:
         return {row[0] for row in cursor.fetchall() if row[0]}
 
 
+def get_min_equity_dates() -> Dict[str, str]:
+    """每个账户 equity_history 的最早日期 (一次 GROUP BY 查询): {account: 'YYYY-MM-DD'}。"""
+    with get_connection() as conn:
+        cursor = conn.execute("SELECT account_name, MIN(date) FROM equity_history GROUP BY account_name")
+        return {row[0]: row[1] for row in cursor.fetchall() if row[1]}
+
+
 def get_min_equity_date(account_name: str) -> Optional[str]:
     """返回该账户在 equity_history 中的最早日期（YYYY-MM-DD），用于仿真时跳过「早于账户首日」的 tick。"""
     with get_connection() as conn:
@@ -603,6 +1434,8 @@ def migrate_from_json(json_file: str):
                 ''', (name, trade['symbol'], trade['side'], trade['qty'], trade['price'],
                       trade['value'], trade['time']))
         
+        rebuild_cost_stats(name)
+        
         # 导入净值历史
         with get_connection() as conn:
             for eq in acc.get('equity_history', []):
@@ -688,6 +1521,3 @@ def init_default_watchlist() -> dict:
     get_logger.info("db write init_default_watchlist: added=%s skipped=%s", added, skipped)
     return {'added': added, 'skipped': skipped}
 
-
-# 初始化数据库
-init_db()
@@ -0,0 +1,62 @@
+"""
+PPT database admin CLI (runs against DB_FILE).
+
+Used for: checking the schema version and maintaining derived tables (running cost stats) outside the web app.
+
+Usage:
+    python -m core.dbadmin schema                                 Schema version and applied migrations
+    python -m core.dbadmin rebuild-cost-stats [--account NAME]    Recompute account/symbol cost stats from trades
+    python -m core.dbadmin verify-cost-stats [--account NAME]     Compare stored stats with SUM over trades; exit 1 on mismatch
+
+Functions:
+    main(argv=None) -> int   CLI entry; returns process exit code
+"""
+import argparse
+import sys
+
+from . import db as database
+
+
+def _cmd_schema(args) -> int:
+    with database.get_connection() as conn:
+        version = database.get_schema_version(conn)
+        rows = conn.execute("SELECT version, description, applied_at FROM schema_version ORDER BY version").fetchall()
+    print(f"db={database.DB_FILE} schema_version={version}")
+    for row in rows:
+        print(f"  v{row['version']:<3} {row['applied_at']}  {row['description']}")
+    return 0
+
+
+def _cmd_rebuild_cost_stats(args) -> int:
+    n = database.rebuild_cost_stats(args.account)
+    print(f"rebuilt cost stats: accounts={n}")
+    return 0
+
+
+def _cmd_verify_cost_stats(args) -> int:
+    mismatches = database.verify_cost_stats(args.account, tolerance=args.tolerance)
+    for m in mismatches:
+        print(f"MISMATCH account={m['account']} symbol={m['symbol'] or '*'} field={m['field']} "
+              f"stored={m['stored']} expected={m['expected']}")
+    print("cost stats OK" if not mismatches else f"{len(mismatches)} mismatches (run rebuild-cost-stats)")
+    return 0 if not mismatches else 1
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m core.dbadmin', description='PPT database admin')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('schema', help='show schema version').set_defaults(func=_cmd_schema)
+    p = sub.add_parser('rebuild-cost-stats', help='recompute cost stats from trades')
+    p.add_argument('--account', default=None)
+    p.set_defaults(func=_cmd_rebuild_cost_stats)
+    p = sub.add_parser('verify-cost-stats', help='check cost stats against trades')
+    p.add_argument('--account', default=None)
+    p.add_argument('--tolerance', type=float, default=1e-6)
+    p.set_defaults(func=_cmd_verify_cost_stats)
+    args = parser.parse_args(argv)
+    database.init_db()
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
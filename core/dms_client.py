@@ -0,0 +1,272 @@
+"""
+PPT DMS HTTP client: pooled keep-alive requests.Session, retry/backoff, circuit breaker, latency budget; chunked batches.
+
+Used for: core.utils quote fetches (POST {DMS_BASE_URL}/api/dms/read/batch).
+
+Functions:
+    get_session() -> requests.Session     Process-wide keep-alive session (HTTPAdapter pool)
+    read_batch(dms_base, headers, symbols, start_date, end_date, interval='1d', as_of=None, timeout=None, deadline=None)
+        -> dict: one POST read/batch; returns DMS JSON ({symbol: {'data': [...]}}); raises DmsError on HTTP/network error,
+        open breaker or exhausted budget
+    read_batch_chunked(dms_base, headers, symbols, ..., max_workers=None, chunk_size=None, deadline=None)
+        -> (data, errors): split symbols into chunks, fetch concurrently (bounded); errors = {symbol: error str}
+    get_client_stats() -> dict            Requests / chunks / errors / breaker state (for /api/health)
+    get_breaker() -> CircuitBreaker       Process-wide breaker (state(), allow(), record_success/failure())
+
+Features:
+    - Keep-alive pool (DMS_POOL_SIZE connections) so quotes reuse TCP/TLS connections
+    - Retries on connect errors and 429/502/503/504 with exponential backoff (DMS_RETRIES, DMS_BACKOFF_SEC);
+      read/batch is a read, so POST is retried
+    - Latency budget (DMS_LATENCY_BUDGET_SEC) per call: every attempt's timeout and backoff fit in what is left,
+      chunks of one call share it; when it runs out the call fails fast instead of waiting the full timeout
+    - Circuit breaker: DMS_BREAKER_FAILURES consecutive failures open it (calls fail immediately with
+      'DMS circuit open'); after DMS_BREAKER_OPEN_SEC one half-open probe is let through, success closes it
+    - Sim: responses with a past as_of are read from / written to core.dms_disk_cache before any network call,
+      so reruns are offline and repeatable (symbols are sorted before chunking to keep keys stable)
+    - Large symbol lists go out in DMS_BATCH_CHUNK_SIZE chunks, at most DMS_MAX_WORKERS in flight;
+      a failed chunk only fails its own symbols
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from . import dms_disk_cache
+
+_logger = logging.getLogger(__name__)
+
+DMS_POOL_SIZE = max(1, int(os.getenv('DMS_POOL_SIZE', '16')))
+DMS_RETRIES = max(0, int(os.getenv('DMS_RETRIES', '2')))
+DMS_BACKOFF_SEC = float(os.getenv('DMS_BACKOFF_SEC', '0.2'))
+DMS_TIMEOUT_SEC = float(os.getenv('DMS_TIMEOUT_SEC', '10'))
+DMS_BATCH_CHUNK_SIZE = max(1, int(os.getenv('DMS_BATCH_CHUNK_SIZE', '100')))
+DMS_MAX_WORKERS = max(1, int(os.getenv('DMS_MAX_WORKERS', '5')))
+DMS_LATENCY_BUDGET_SEC = float(os.getenv('DMS_LATENCY_BUDGET_SEC', '3'))
+DMS_BREAKER_FAILURES = max(1, int(os.getenv('DMS_BREAKER_FAILURES', '5')))
+DMS_BREAKER_OPEN_SEC = float(os.getenv('DMS_BREAKER_OPEN_SEC', '30'))
+
+_RETRY_STATUS = (429, 502, 503, 504)
+
+
+class DmsError(Exception):
+    """DMS request failed (HTTP status or network); str(e) is the per-symbol quote error text."""
+
+
+class CircuitBreaker:
+    """
+    closed -> (failure_threshold consecutive failures) -> open -> (open_sec elapsed) -> half_open: one probe call;
+    probe success -> closed, probe failure -> open again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold: int = DMS_BREAKER_FAILURES, open_sec: float = DMS_BREAKER_OPEN_SEC):
+        self.failure_threshold = failure_threshold
+        self.open_sec = open_sec
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._stats = {'opened': 0, 'rejected': 0, 'probes': 0}
+
+    def allow(self) -> bool:
+        """True if a call may go to DMS now (half-open: only the single probe)."""
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_sec:
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                self._stats['probes'] += 1
+                return True
+            self._stats['rejected'] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                _logger.info("dms breaker: closed (probe ok)")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or (self._state == self.CLOSED and self._failures >= self.failure_threshold):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+                self._stats['opened'] += 1
+                _logger.warning("dms breaker: open after %s consecutive failures (retry in %ss)",
+                                self._failures, self.open_sec)
+
+    def state(self) -> dict:
+        with self._lock:
+            state = self._state
+            if state == self.OPEN and time.monotonic() - self._opened_at >= self.open_sec:
+                state = self.HALF_OPEN
+            out = {'state': state, 'consecutive_failures': self._failures, **self._stats}
+            if self._state == self.OPEN:
+                out['retry_in_sec'] = round(max(0.0, self.open_sec - (time.monotonic() - self._opened_at)), 1)
+        return out
+
+
+_breaker = CircuitBreaker()
+
+
+def get_breaker() -> CircuitBreaker:
+    return _breaker
+
+
+_session = None
+_session_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {'requests': 0, 'chunked_calls': 0, 'chunks': 0, 'errors': 0, 'retries': 0, 'budget_exceeded': 0}
+
+
+def _count(**kw):
+    with _stats_lock:
+        for k, v in kw.items():
+            _stats[k] += v
+
+
+def get_session():
+    """Shared requests.Session with a keep-alive pool (DMS_POOL_SIZE connections)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                # retries are done in read_batch so they stay inside the latency budget
+                adapter = HTTPAdapter(pool_connections=DMS_POOL_SIZE, pool_maxsize=DMS_POOL_SIZE, max_retries=0)
+                session = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def read_batch(dms_base: str, headers: dict, symbols: List[str], start_date: str, end_date: str,
+               interval: str = '1d', as_of: Optional[str] = None, timeout: Optional[float] = None,
+               deadline: Optional[float] = None) -> dict:
+    """
+    One POST read/batch with retries. deadline: time.monotonic() value the call must finish by
+    (default now + DMS_LATENCY_BUDGET_SEC). Raises DmsError('HTTP <code>', 'DMS circuit open', budget or network text).
+    """
+    payload = {
+        "symbols": symbols,
+        "start_date": start_date,
+        "end_date": end_date,
+        "interval": interval,
+    }
+    if as_of:
+        payload["as_of"] = as_of
+    disk_key = None
+    if dms_disk_cache.cacheable(as_of):
+        disk_key = dms_disk_cache.make_key(symbols, interval, start_date, end_date, as_of)
+        cached = dms_disk_cache.get(disk_key)
+        if cached is not None:
+            return cached
+    if deadline is None:
+        deadline = time.monotonic() + DMS_LATENCY_BUDGET_SEC
+    timeout = timeout or DMS_TIMEOUT_SEC
+    error = None
+    for attempt in range(DMS_RETRIES + 1):
+        if attempt:
+            backoff = DMS_BACKOFF_SEC * (2 ** (attempt - 1))
+            if time.monotonic() + backoff >= deadline:
+                break
+            _count(retries=1)
+            time.sleep(backoff)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        if not _breaker.allow():
+            raise DmsError("DMS circuit open")
+        _count(requests=1)
+        try:
+            r = get_session().post(f"{dms_base}/api/dms/read/batch", json=payload, timeout=min(timeout, remaining),
+                                   headers={**headers, "Content-Type": "application/json"})
+        except Exception as e:
+            _breaker.record_failure()
+            error = str(e)
+            continue
+        if r.status_code in _RETRY_STATUS or r.status_code >= 500:
+            _breaker.record_failure()
+            error = f"HTTP {r.status_code}"
+            if r.status_code in _RETRY_STATUS:
+                continue
+            break
+        _breaker.record_success()
+        if r.status_code != 200:
+            error = f"HTTP {r.status_code}"
+            break
+        try:
+            data = r.json() or {}
+        except ValueError as e:
+            error = f"invalid JSON: {e}"
+            break
+        if disk_key:
+            dms_disk_cache.put(disk_key, data)
+        return data
+    _count(errors=1)
+    if error is None or time.monotonic() >= deadline:
+        _count(budget_exceeded=1)
+        error = f"DMS latency budget exceeded ({error})" if error else "DMS latency budget exceeded"
+    raise DmsError(error)
+
+
+def read_batch_chunked(dms_base: str, headers: dict, symbols: List[str], start_date: str, end_date: str,
+                       interval: str = '1d', as_of: Optional[str] = None, timeout: Optional[float] = None,
+                       max_workers: Optional[int] = None, chunk_size: Optional[int] = None,
+                       deadline: Optional[float] = None) -> Tuple[Dict[str, dict], Dict[str, str]]:
+    """
+    Fetch symbols in chunks of chunk_size with at most max_workers concurrent requests; all chunks share one deadline.
+    Returns (data, errors): data merges the DMS JSON of successful chunks; errors maps each symbol of a failed chunk
+    to its error text.
+    """
+    chunk_size = chunk_size or DMS_BATCH_CHUNK_SIZE
+    symbols = sorted(symbols)  # stable chunks -> stable disk cache keys across runs
+    if deadline is None:
+        deadline = time.monotonic() + DMS_LATENCY_BUDGET_SEC
+    chunks = [symbols[i:i + chunk_size] for i in range(0, len(symbols), chunk_size)]
+    _count(chunked_calls=1, chunks=len(chunks))
+
+    def _one(chunk):
+        try:
+            return chunk, read_batch(dms_base, headers, chunk, start_date, end_date, interval, as_of, timeout,
+                                     deadline), None
+        except DmsError as e:
+            _logger.info("dms read/batch: chunk of %s symbols failed: %s", len(chunk), e)
+            return chunk, None, str(e)
+
+    if len(chunks) <= 1:
+        results = [_one(c) for c in chunks]
+    else:
+        workers = max(1, min(max_workers or DMS_MAX_WORKERS, len(chunks)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dms') as pool:
+            results = list(pool.map(_one, chunks))
+
+    data, errors = {}, {}
+    for chunk, chunk_data, error in results:
+        if error is not None:
+            errors.update({s: error for s in chunk})
+        else:
+            data.update(chunk_data)
+    return data, errors
+
+
+def get_client_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats.update(pool_size=DMS_POOL_SIZE, chunk_size=DMS_BATCH_CHUNK_SIZE, max_workers=DMS_MAX_WORKERS,
+                 latency_budget_sec=DMS_LATENCY_BUDGET_SEC, breaker=_breaker.state(),
+                 disk_cache=dms_disk_cache.get_disk_cache_stats())
+    return stats
@@ -0,0 +1,152 @@
+"""
+PPT on-disk DMS response cache: content-addressed files for read/batch responses with a fixed past as_of.
+
+Used for: core.dms_client.read_batch in simulation mode. A response for a past as_of never changes, so reruns of a
+backtest are served from disk (offline, byte-for-byte repeatable) instead of DMS.
+
+Functions:
+    make_key(symbols, interval, start_date, end_date, as_of) -> str   sha256 of the canonical request (symbols sorted)
+    cacheable(as_of) -> bool          True when enabled and as_of is before today (UTC); live data is never cached
+    get(key) -> Optional[dict]        Cached JSON or None (hit refreshes mtime for LRU)
+    put(key, data) -> None            Atomic write; evicts least recently used files above DMS_DISK_CACHE_MAX_MB
+    get_disk_cache_stats() -> dict    Hits / misses / writes / evictions / bytes
+
+Features:
+    - Layout: DMS_DISK_CACHE_DIR/<key[:2]>/<key>.json (default run/cache/dms)
+    - Size bound DMS_DISK_CACHE_MAX_MB (default 512); eviction removes oldest-mtime files down to 90% of the limit
+    - DMS_DISK_CACHE_ENABLED=0 disables
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from datetime import datetime, timezone
+from typing import List, Optional
+
+_logger = logging.getLogger(__name__)
+
+DMS_DISK_CACHE_ENABLED = os.getenv('DMS_DISK_CACHE_ENABLED', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+DMS_DISK_CACHE_DIR = os.getenv('DMS_DISK_CACHE_DIR', 'run/cache/dms')
+DMS_DISK_CACHE_MAX_MB = float(os.getenv('DMS_DISK_CACHE_MAX_MB', '512'))
+
+_lock = threading.Lock()
+_total_bytes: Optional[int] = None
+_stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0, 'errors': 0}
+
+
+def make_key(symbols: List[str], interval: str, start_date: str, end_date: str, as_of: Optional[str]) -> str:
+    canonical = json.dumps({
+        'symbols': sorted(symbols),
+        'interval': interval,
+        'start_date': start_date,
+        'end_date': end_date,
+        'as_of': as_of,
+    }, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def cacheable(as_of: Optional[str]) -> bool:
+    """Only responses capped at a past date are immutable."""
+    if not DMS_DISK_CACHE_ENABLED or not as_of:
+        return False
+    try:
+        dt = datetime.fromisoformat(as_of.replace('Z', '+00:00'))
+    except ValueError:
+        return False
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).date() < datetime.now(timezone.utc).date()
+
+
+def _path(key: str) -> str:
+    return os.path.join(DMS_DISK_CACHE_DIR, key[:2], key + '.json')
+
+
+def get(key: str) -> Optional[dict]:
+    path = _path(key)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        os.utime(path)
+    except FileNotFoundError:
+        with _lock:
+            _stats['misses'] += 1
+        return None
+    except (OSError, ValueError) as e:
+        _logger.info("dms disk cache: unreadable %s: %s", path, e)
+        with _lock:
+            _stats['misses'] += 1
+            _stats['errors'] += 1
+        return None
+    with _lock:
+        _stats['hits'] += 1
+    return data
+
+
+def _scan() -> List[tuple]:
+    files = []
+    for root, _, names in os.walk(DMS_DISK_CACHE_DIR):
+        for name in names:
+            if name.endswith('.json'):
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+    return files
+
+
+def _evict_locked():
+    global _total_bytes
+    limit = DMS_DISK_CACHE_MAX_MB * 1024 * 1024
+    files = _scan()
+    _total_bytes = sum(size for _, size, _ in files)
+    if _total_bytes <= limit:
+        return
+    target = limit * 0.9
+    for _, size, path in sorted(files):
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        _total_bytes -= size
+        _stats['evictions'] += 1
+        if _total_bytes <= target:
+            break
+
+
+def put(key: str, data: dict):
+    global _total_bytes
+    path = _path(key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp, path)
+    except OSError as e:
+        _logger.info("dms disk cache: write %s failed: %s", path, e)
+        with _lock:
+            _stats['errors'] += 1
+        return
+    with _lock:
+        _stats['writes'] += 1
+        if _total_bytes is None:
+            _evict_locked()
+        else:
+            _total_bytes += len(payload)
+            if _total_bytes > DMS_DISK_CACHE_MAX_MB * 1024 * 1024:
+                _evict_locked()
+
+
+def get_disk_cache_stats() -> dict:
+    """Counters for /api/health via dms_client.get_client_stats (public: no directory paths)."""
+    with _lock:
+        stats = dict(_stats)
+        stats['bytes'] = _total_bytes
+    stats.update(enabled=DMS_DISK_CACHE_ENABLED, max_mb=DMS_DISK_CACHE_MAX_MB)
+    return stats
@@ -0,0 +1,114 @@
+"""
+PPT equity update: mark every account's positions at the current (sim or real) date and write equity_history.
+
+Used for: app scheduler equity Cron, POST /api/scheduler/tick, POST /api/equity/update and core.replay day
+boundaries (same code path).
+
+Functions:
+    value_all_accounts(as_of_date=None, include_empty=False, skip_before_first_day=True) -> Dict
+        One valuation pass over all accounts; per-account results, failed / fallback symbols and stage timings
+    update_all_accounts_equity() -> int    Pass over accounts with positions; returns number of accounts updated
+
+Features:
+    - One pass instead of one loop iteration per account: all positions in one query, one quote fetch for the union
+      of symbols (accounts holding the same symbols share it), every account valued in memory and every
+      equity_history row upserted with one executemany in one transaction
+    - Cash and positions are re-read inside the write transaction, so a fill that lands while quotes are fetched is
+      valued too (symbols it added without a quote use cost price)
+    - Date from core.utils.get_equity_date() (sim tick context or real today); accounts are skipped for dates before
+      their first equity day (skip_before_first_day)
+    - Quotes via core.utils.get_quotes_batch (quote cache / bar cache in sim; invalid without DMS_BASE_URL); invalid
+      or missing quotes fall back to watchlist last_price (apply_quote_fallback), then cost price
+    - timings_ms: load (accounts / positions / first days), quotes (fetch + fallback), value (re-read + in-memory
+      valuation), write (upsert + commit), total
+"""
+import logging
+import time
+from typing import Any, Dict
+
+from . import db as database
+from . import utils as core_utils
+
+_logger = logging.getLogger(__name__)
+
+
+def value_all_accounts(as_of_date=None, include_empty: bool = False,
+                       skip_before_first_day: bool = True) -> Dict[str, Any]:
+    """
+    Value every account at as_of_date (default get_equity_date()) and upsert equity_history in one transaction.
+    include_empty: also write cash-only equity for accounts without positions.
+
+    Returns:
+        {'date', 'accounts': [{'account', 'equity', 'pnl', 'pnl_pct', 'positions', 'quote_failed',
+         'quote_fallback'}], 'skipped': [account], 'symbols': int, 'failed_symbols': [...], 'timings_ms': {...}}
+    """
+    t_start = time.perf_counter()
+    date_for_db = as_of_date if as_of_date is not None else core_utils.get_equity_date()
+    date_str = database.equity_date_str(date_for_db)
+
+    positions = database.get_all_positions()
+    first_days = database.get_min_equity_dates() if skip_before_first_day else {}
+    targets, skipped = [], []
+    for acc in database.get_all_accounts():
+        name = acc['name']
+        if first_days.get(name) and date_str < first_days[name]:
+            _logger.debug("[Tick] skip account=%s as_of=%s before first day %s", name, date_str, first_days[name])
+            skipped.append(name)
+        elif positions.get(name) or include_empty:
+            targets.append(name)
+    symbols = sorted({sym for name in targets for sym in positions.get(name, {})})
+    t_load = time.perf_counter()
+
+    quotes = core_utils.get_quotes_batch(symbols) if symbols else {}
+    fallback = core_utils.apply_quote_fallback(quotes, symbols,
+                                               watchlist={w['symbol']: w for w in database.get_watchlist()}
+                                               if symbols else {})
+    failed = [sym for sym in symbols
+              if not (quotes.get(sym) or {}).get('valid', True) or ((quotes.get(sym) or {}).get('price') or 0) <= 0]
+    for sym in symbols:
+        q = quotes.get(sym, {})
+        _logger.info("[Tick] quote result: date=%s symbol=%s price=%s valid=%s fallback=%s error=%s",
+                     date_str, sym, q.get('price'), q.get('valid', True), q.get('fallback'), q.get('error'))
+    t_quotes = time.perf_counter()
+
+    results, rows = [], []
+    with database.transaction():
+        accounts = {acc['name']: acc for acc in database.get_all_accounts()}
+        positions = database.get_all_positions()
+        for name in targets:
+            if name not in accounts:
+                continue  # 估值期间被删除
+            held = positions.get(name, {})
+            value = database.value_positions(accounts[name], held, quotes)
+            rows.append((name, date_str, value['equity'], value['pnl'], value['pnl_pct']))
+            results.append({
+                'account': name,
+                'equity': round(value['equity'], 2),
+                'pnl': round(value['pnl'], 2),
+                'pnl_pct': round(value['pnl_pct'], 4),
+                'positions': len(held),
+                'quote_failed': [sym for sym in held if sym in failed],
+                'quote_fallback': {sym: fallback[sym] for sym in held if sym in fallback},
+            })
+        t_value = time.perf_counter()
+        database.upsert_equity_history(rows)
+    t_write = time.perf_counter()
+
+    timings = {
+        'load': (t_load - t_start) * 1000,
+        'quotes': (t_quotes - t_load) * 1000,
+        'value': (t_value - t_quotes) * 1000,
+        'write': (t_write - t_value) * 1000,
+        'total': (t_write - t_start) * 1000,
+    }
+    timings = {k: round(v, 3) for k, v in timings.items()}
+    _logger.info("[Equity] pass date=%s accounts=%s skipped=%s symbols=%s failed=%s timings_ms=%s",
+                 date_str, len(results), len(skipped), len(symbols), len(failed), timings)
+    return {'date': date_str, 'accounts': results, 'skipped': skipped, 'symbols': len(symbols),
+            'failed_symbols': failed, 'timings_ms': timings}
+
+
+def update_all_accounts_equity() -> int:
+    """Update equity for all accounts with positions. Uses get_equity_date() (sim or real); skips dates before the
+    account's first day."""
+    return len(value_all_accounts()['accounts'])
@@ -0,0 +1,623 @@
+"""
+PPT order execution: simulate a fill and apply it (cash, position, order, trade, watchlist, equity) in one SQLite transaction.
+
+Used for: POST /api/orders, POST /api/orders/batch (api/trade.py) and POST /api/webhook (api/webhook.py); all share
+the same fill logic.
+
+Classes:
+    OrderError   Order rejected (account missing, insufficient cash/position); str(e) is the API error text
+    BasketError  OrderError of an all_or_none basket; .legs has the per-leg results
+
+Functions:
+    execute_order(account_name, symbol, side, qty, price, source='web', order_time=None, clamp_sell=False) -> Dict
+        Simulate execution (core.simulation), then apply the fill with one commit; returns order/simulation/cash.
+        With latency simulation on (ORDER_LATENCY_MODE=deferred): accept now, return {'pending': True, ...}
+    execute_basket(account_name, legs, source='web', order_time=None, clamp_sell=False, all_or_none=False) -> Dict
+        Fill a basket of market legs in one transaction (one cash / positions read, one cash write); per-leg results
+    execute_working_fill(...) -> Dict   Fill (part of) a triggered resting order; caller holds the account lock
+    start_fill_executor()        Start the deferred fill executor and re-queue pending fills from the DB (app startup)
+    add_fill_listener(fn)        fn(event) after each background fill / rejection: deferred and resting orders
+                                 (app: Socket.IO 'trade'); notify_fill(event) delivers one
+    get_fill_queue_stats() -> Dict   Queued / filled / rejected / max lag ms
+    account_lock(account_name)   Context manager: FIFO per-account lock (striped); reentrant within a thread
+    get_lock_stats() -> Dict     Lock acquisitions / contended waits / max wait ms
+
+Features:
+    - Account and position are read inside the write transaction (BEGIN IMMEDIATE), so cash and position never tear
+    - Resulting cash is computed from the in-transaction state; no follow-up get_account read
+    - After the commit (still under the account lock) the fill is applied to core.holdings (live mark-to-market)
+    - Fill draws (partial fill, random slippage, latency) come from the account's seeded stream: each order takes the
+      next seed (accounts.rng_seed / rng_seq, core.simulation.derive_seed) and stores it in orders.seed, so a run
+      with the same SIMULATION_SEED (or a reset account) reproduces every fill, independent of other accounts
+    - Baskets: legs are validated against the running in-memory cash / positions (sells first, so sale proceeds
+      fund the buys) and written in one commit; all_or_none rolls back everything if any leg is rejected.
+      Leg draws come from one core.simulation.simulate_execution_batch pass with per-leg seeds (same fills as one
+      by one); a rejected leg takes no seed, so the legs after it are re-simulated with the shifted seeds (the batch
+      halves after a rejection and doubles again as batches are used up, so rejection-heavy baskets stay cheap)
+      Latency simulation does not apply to baskets (filled immediately)
+    - clamp_sell=True (webhook): sell more than held -> sell the held qty; False (web): reject
+    - Orders of one account run strictly in arrival order; different accounts run in parallel
+      (ACCOUNT_LOCK_STRIPES fair locks, default 64, account -> stripe by crc32)
+    - Latency simulation without blocking the request: the order row is written as 'pending' with a due time
+      (wall clock; the recorded fill time is order time + latency on the sim clock in sim mode), and one background
+      thread applies fills when due. Due times are non-decreasing per account, so fills keep arrival order.
+      Status: GET /api/orders/<id> or the Socket.IO 'trade' event. ORDER_LATENCY_MODE=sleep keeps the old blocking sleep.
+"""
+import heapq
+import logging
+import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Any, List, Optional
+
+from . import db as database
+from . import ctrl
+from . import holdings
+from . import simulation
+from .utils import get_current_datetime_iso, is_sim_mode
+
+_logger = logging.getLogger(__name__)
+
+
+ACCOUNT_LOCK_STRIPES = max(1, int(os.getenv('ACCOUNT_LOCK_STRIPES', '64')))
+ORDER_LATENCY_MODE = os.getenv('ORDER_LATENCY_MODE', 'deferred').strip().lower()
+_BASKET_SIM_CHUNK = 256  # 篮子每次批量模拟的腿数上限; 有腿被拒绝时减半 (之后的腿要按新种子重算), 用完一批时加倍
+_BASKET_SIM_MIN = 8  # 少于这么多腿时逐笔抽取 (NumPy 固定开销大于逐笔)
+
+
+class OrderError(Exception):
+    """Order rejected; message is returned to the API client (HTTP 400)."""
+
+
+# ============================================================
+# Per-account order serialization
+# ============================================================
+
+class _FairLock:
+    """Ticket lock: waiters are served in arrival order (threading.Lock gives no ordering). Reentrant per thread."""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._next_ticket = 0
+        self._serving = 0
+        self._owner = None
+        self._depth = 0
+
+    def acquire(self) -> float:
+        """Block until it is this caller's turn; returns seconds waited."""
+        me = threading.get_ident()
+        with self._cond:
+            if self._owner == me:
+                self._depth += 1
+                return 0.0
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            start = time.perf_counter()
+            while ticket != self._serving:
+                self._cond.wait()
+            self._owner = me
+            self._depth = 1
+            return time.perf_counter() - start
+
+    def release(self):
+        with self._cond:
+            self._depth -= 1
+            if self._depth == 0:
+                self._owner = None
+                self._serving += 1
+                self._cond.notify_all()
+
+
+_stripes = [_FairLock() for _ in range(ACCOUNT_LOCK_STRIPES)]
+_lock_stats_lock = threading.Lock()
+_lock_stats = {'acquired': 0, 'contended': 0, 'wait_ms_total': 0.0, 'wait_ms_max': 0.0}
+
+
+@contextmanager
+def account_lock(account_name: str):
+    """Serialize order processing for one account (FIFO); other accounts proceed in parallel."""
+    lock = _stripes[zlib.crc32((account_name or '').encode('utf-8')) % len(_stripes)]
+    waited = lock.acquire()
+    wait_ms = waited * 1000
+    with _lock_stats_lock:
+        _lock_stats['acquired'] += 1
+        if wait_ms > 0.1:
+            _lock_stats['contended'] += 1
+        _lock_stats['wait_ms_total'] += wait_ms
+        _lock_stats['wait_ms_max'] = max(_lock_stats['wait_ms_max'], wait_ms)
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+def get_lock_stats() -> Dict[str, Any]:
+    """Account lock counters (for /api/health and benchmarks)."""
+    with _lock_stats_lock:
+        stats = dict(_lock_stats)
+    stats['stripes'] = len(_stripes)
+    stats['wait_ms_total'] = round(stats['wait_ms_total'], 3)
+    stats['wait_ms_max'] = round(stats['wait_ms_max'], 3)
+    return stats
+
+
+# ============================================================
+# Order execution
+# ============================================================
+
+
+def execute_order(
+    account_name: str,
+    symbol: str,
+    side: str,
+    qty: int,
+    price: float,
+    source: str = 'web',
+    order_time: Optional[datetime] = None,
+    clamp_sell: bool = False,
+) -> Dict[str, Any]:
+    """
+    Simulate and apply one order under the account lock. Raises OrderError when rejected (nothing is written).
+
+    Returns:
+        {'order': {...}, 'simulation': {...}, 'account': str, 'cash': float}
+    """
+    if ORDER_LATENCY_MODE == 'deferred' and simulation.latency_enabled():
+        return _accept_deferred(account_name, symbol, side, qty, price, source, order_time, clamp_sell)
+    with account_lock(account_name):
+        return _execute_order_locked(account_name, symbol, side, qty, price, source, order_time, clamp_sell)
+
+
+def execute_working_fill(account_name: str, symbol: str, side: str, qty: int, price: float, source: str,
+                         order_time: Optional[datetime], clamp_sell: bool, limit_price: Optional[float],
+                         working_order_id: int) -> Dict[str, Any]:
+    """
+    Fill a triggered resting order (core.order_book) at the quote price; caller holds account_lock(account_name).
+    limit_price: exec price is capped at the limit (after slippage). The working order's remaining qty is updated in the
+    same transaction. Raises OrderError when rejected.
+    """
+    return _execute_order_locked(account_name, symbol, side, qty, price, source, order_time, clamp_sell,
+                                 limit_price=limit_price, working_order_id=working_order_id)
+
+
+def _next_order_seed(account: Dict[str, Any]) -> int:
+    """Next seed of the account's stream; advances rng_seq in the caller's transaction."""
+    base = account.get('rng_seed')
+    if base is None:
+        base = simulation.account_seed(account['name'])
+    seq = account.get('rng_seq') or 0
+    database.set_account_rng(account['name'], base, seq + 1)
+    return simulation.derive_seed(base, seq)
+
+
+def _simulate_fill(symbol: str, side: str, qty: int, price: float, seed: int, cash: float, pos: Optional[Dict],
+                   clamp_sell: bool, limit_price: Optional[float] = None,
+                   sim_result: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Simulate one fill against the given cash / position (nothing is written). Raises OrderError when it does not fit.
+    sim_result: the order's simulate_execution result when already drawn from seed (basket batch), else drawn here.
+    Returns the fill: filled_qty, exec_price, commission, filled_value, total_cost, new_cash, new_qty, new_avg_price,
+    realized_pnl, slippage_cost, status, clamped, sim (simulate_execution result).
+    """
+    if sim_result is None:
+        sim_result = simulation.simulate_execution(symbol, side, qty, price, rng=simulation.order_rng(seed),
+                                                   latency=False)
+
+    filled_qty = sim_result['filled_qty']
+    exec_price = sim_result['exec_price']
+    commission = sim_result['commission']
+    filled_value = sim_result['filled_value']
+    total_cost = sim_result['total_cost']
+
+    if limit_price is not None:
+        capped = min(exec_price, limit_price) if side == 'buy' else max(exec_price, limit_price)
+        if capped != exec_price:
+            # 限价单成交价不劣于限价: 滑点截断到限价, 重新计算金额与手续费
+            exec_price = capped
+            commission = simulation.calc_commission(filled_qty, exec_price, filled_qty * exec_price)
+            filled_value = round(filled_qty * exec_price, 2)
+            total_cost = round(filled_qty * exec_price + commission if side == 'buy'
+                               else filled_qty * exec_price - commission, 2)
+            sim_result = {**sim_result, 'exec_price': exec_price, 'slippage': round(abs(exec_price - price), 4),
+                          'commission': commission, 'filled_value': filled_value, 'total_cost': total_cost}
+    clamped = False
+
+    if side == 'buy':
+        if total_cost > cash:
+            raise OrderError(
+                f'Insufficient cash: need {total_cost:.2f} (incl commission {commission:.2f}), '
+                f'available {cash:.2f}'
+            )
+        new_cash = cash - total_cost
+        if pos:
+            new_qty = pos['qty'] + filled_qty
+            new_avg_price = (pos['qty'] * pos['avg_price'] + filled_value) / new_qty
+        else:
+            new_qty, new_avg_price = filled_qty, exec_price
+    else:
+        if not pos:
+            raise OrderError(f'No position: {symbol}' if clamp_sell else f'Insufficient position: {symbol}')
+        if pos['qty'] < filled_qty:
+            if not clamp_sell:
+                raise OrderError(f'Insufficient position: {symbol}')
+            filled_qty = pos['qty']
+            clamped = True
+            filled_value = filled_qty * exec_price
+            total_cost = filled_value - commission
+        new_qty, new_avg_price = pos['qty'] - filled_qty, pos['avg_price']
+        new_cash = cash + total_cost
+
+    return {
+        'filled_qty': filled_qty,
+        'exec_price': exec_price,
+        'commission': commission,
+        'filled_value': filled_value,
+        'total_cost': total_cost,
+        'new_cash': new_cash,
+        'new_qty': new_qty,
+        'new_avg_price': new_avg_price,
+        'realized_pnl': (exec_price - pos['avg_price']) * filled_qty if side == 'sell' else 0.0,
+        'slippage_cost': (sim_result.get('slippage') or 0) * filled_qty,
+        'status': 'partial' if sim_result['partial_fill'] else 'filled',
+        'clamped': clamped,
+        'sim': sim_result,
+    }
+
+
+def _write_fill(account_name: str, symbol: str, side: str, fill: Dict[str, Any], source: str,
+                order_time: Optional[datetime], seed: int, order_id: Optional[int] = None,
+                working_order_id: Optional[int] = None) -> int:
+    """Position, order, trade and watchlist rows of one fill (caller's transaction; cash is written by the caller)."""
+    filled_qty, exec_price = fill['filled_qty'], fill['exec_price']
+    database.update_position(account_name, symbol, fill['new_qty'], fill['new_avg_price'])
+    if order_id is None:
+        order_id = database.add_order(account_name, symbol, side, filled_qty, exec_price, fill['status'], source,
+                                      order_time=order_time, working_order_id=working_order_id, seed=seed)
+        if working_order_id is not None:
+            # 部分成交的剩余数量继续挂单; clamp 卖出 (持仓不足) 后不再保留
+            database.fill_working_order(working_order_id, filled_qty, done=fill['clamped'])
+    else:
+        database.update_order_fill(order_id, filled_qty, exec_price, fill['status'], order_time=order_time)
+        database.complete_pending_fill(order_id, 'filled')
+    database.add_trade(account_name, symbol, side, filled_qty, exec_price, order_time=order_time,
+                       commission=fill['commission'], slippage=fill['slippage_cost'], realized_pnl=fill['realized_pnl'])
+    database.add_to_watchlist(symbol, symbol)
+    database.update_watchlist_quote(symbol, exec_price)
+    _logger.info("execute_order: account=%s symbol=%s side=%s filled_qty=%s exec_price=%s source=%s order_id=%s",
+                 account_name, symbol, side, filled_qty, exec_price, source, order_id)
+    return order_id
+
+
+def _order_view(order_id: int, symbol: str, side: str, qty: int, price: float, fill: Dict[str, Any],
+                order_time: Optional[datetime], seed: int) -> Dict[str, Any]:
+    return {
+        'id': order_id,
+        'symbol': symbol,
+        'side': side,
+        'requested_qty': qty,
+        'filled_qty': fill['filled_qty'],
+        'requested_price': price,
+        'exec_price': fill['exec_price'],
+        'value': fill['filled_value'],
+        'time': order_time.isoformat() if order_time else get_current_datetime_iso(),
+        'status': fill['status'],
+        'seed': seed,
+    }
+
+
+def _simulation_view(fill: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'slippage': fill['sim']['slippage'],
+        'commission': fill['commission'],
+        'fill_rate': fill['sim']['fill_rate'],
+        'total_cost': fill['total_cost'],
+    }
+
+
+def _execute_order_locked(account_name: str, symbol: str, side: str, qty: int, price: float,
+                          source: str, order_time: Optional[datetime], clamp_sell: bool,
+                          order_id: Optional[int] = None, limit_price: Optional[float] = None,
+                          working_order_id: Optional[int] = None) -> Dict[str, Any]:
+    """Simulate and apply one fill (caller holds the account lock). order_id: fill that accepted (pending) order row."""
+    if order_id is None and working_order_id is None:
+        simulation.apply_latency()  # ORDER_LATENCY_MODE=sleep: 阻塞在写事务之外
+    with database.transaction():
+        account = database.get_account(account_name)
+        if not account:
+            raise OrderError(f'Account not found: {account_name}')
+        # 本单种子: 延迟成交沿用受理时写入的种子, 否则取账户流的下一个 (拒单回滚后种子回到流中)
+        seed = (database.get_order(order_id) or {}).get('seed') if order_id is not None else None
+        if seed is None:
+            seed = _next_order_seed(account)
+        fill = _simulate_fill(symbol, side, qty, price, seed, account['cash'],
+                              database.get_position(account_name, symbol), clamp_sell, limit_price)
+        database.update_account_cash(account_name, fill['new_cash'])
+        order_id = _write_fill(account_name, symbol, side, fill, source, order_time, seed, order_id, working_order_id)
+
+        if not is_sim_mode():
+            as_of = order_time.date() if order_time else None
+            database.update_equity_history(account_name, as_of_date=as_of)
+    holdings.apply_fill(account_name, fill['new_cash'],
+                        {symbol: {'qty': fill['new_qty'], 'avg_price': fill['new_avg_price']}},
+                        {symbol: fill['exec_price']})
+
+    result = {
+        'order': _order_view(order_id, symbol, side, qty, price, fill, order_time, seed),
+        'simulation': _simulation_view(fill),
+        'account': account_name,
+        'cash': round(fill['new_cash'], 2),
+    }
+    if working_order_id is not None:
+        result['order']['working_order_id'] = working_order_id
+        result['order']['remaining_qty'] = 0 if fill['clamped'] else qty - fill['filled_qty']
+    return result
+
+
+# ============================================================
+# Baskets (POST /api/orders/batch, webhook arrays)
+# ============================================================
+
+class BasketError(OrderError):
+    """all_or_none basket rejected; .legs holds the per-leg results (nothing was written)."""
+
+    def __init__(self, message: str, legs: List[Dict[str, Any]]):
+        super().__init__(message)
+        self.legs = legs
+
+
+def _simulate_legs(legs: List[Dict[str, Any]], indexes: List[int], rng_seed: int,
+                   rng_seq: int) -> Dict[int, Dict[str, Any]]:
+    """
+    Draw legs[indexes] in one batch, assuming none is rejected (seeds rng_seq, rng_seq + 1, ...).
+    Fewer than _BASKET_SIM_MIN legs map to None: _simulate_fill draws them one by one.
+    """
+    if len(indexes) < _BASKET_SIM_MIN:
+        return dict.fromkeys(indexes)
+    batch = simulation.simulate_execution_batch(
+        [legs[i]['symbol'] for i in indexes], [legs[i]['side'] for i in indexes],
+        [legs[i]['qty'] for i in indexes], [legs[i]['price'] for i in indexes],
+        seeds=[simulation.derive_seed(rng_seed, rng_seq + n) for n in range(len(indexes))], latency=False)
+    return dict(zip(indexes, simulation.batch_to_records(batch)))
+
+
+def execute_basket(account_name: str, legs: List[Dict[str, Any]], source: str = 'web',
+                   order_time: Optional[datetime] = None, clamp_sell: bool = False,
+                   all_or_none: bool = False) -> Dict[str, Any]:
+    """
+    Fill market legs [{'symbol', 'side', 'qty', 'price'}, ...] of one account in one transaction.
+    Cash and positions are read once and tracked in memory; sells are filled before buys (cash from sells funds buys),
+    results keep the request order. A leg that does not fit is rejected (status 'rejected', error); with all_or_none
+    any rejection rolls back the whole basket (BasketError). Raises OrderError if the account does not exist.
+
+    Returns:
+        {'legs': [{'index', 'status', 'order', 'simulation'} | {'index', 'status': 'rejected', 'error', ...}],
+         'filled': int, 'rejected': int, 'account': str, 'cash': float}
+    """
+    order = sorted(range(len(legs)), key=lambda i: legs[i]['side'] != 'sell')
+    results: List[Optional[Dict[str, Any]]] = [None] * len(legs)
+    with account_lock(account_name):
+        with database.transaction():
+            account = database.get_account(account_name)
+            if not account:
+                raise OrderError(f'Account not found: {account_name}')
+            positions = database.get_positions(account_name)
+            cash = account['cash']
+            rng_seed = account.get('rng_seed')
+            if rng_seed is None:
+                rng_seed = simulation.account_seed(account_name)
+            rng_seq = account.get('rng_seq') or 0
+            exec_prices: Dict[str, float] = {}
+            sims: Dict[int, Dict[str, Any]] = {}
+            chunk = _BASKET_SIM_CHUNK
+            for k, i in enumerate(order):
+                leg = legs[i]
+                symbol, side, qty, price = leg['symbol'], leg['side'], leg['qty'], leg['price']
+                seed = simulation.derive_seed(rng_seed, rng_seq)
+                if i not in sims:
+                    if sims:  # 上一批全部用完 (没有被拒绝的腿)
+                        chunk = min(_BASKET_SIM_CHUNK, chunk * 2)
+                    sims = _simulate_legs(legs, order[k:k + chunk], rng_seed, rng_seq)
+                try:
+                    fill = _simulate_fill(symbol, side, qty, price, seed, cash, positions.get(symbol), clamp_sell,
+                                          sim_result=sims[i])
+                except OrderError as e:
+                    # 拒绝的腿不消耗种子 (与单笔下单一致): 之后的腿按新的种子重新批量模拟
+                    sims = {}
+                    chunk = max(1, chunk // 2)
+                    results[i] = {'index': i, 'status': 'rejected', 'error': str(e), 'symbol': symbol, 'side': side,
+                                  'requested_qty': qty, 'requested_price': price}
+                    continue
+                rng_seq += 1
+                cash = fill['new_cash']
+                if fill['new_qty'] > 0:
+                    positions[symbol] = {'qty': fill['new_qty'], 'avg_price': fill['new_avg_price']}
+                else:
+                    positions.pop(symbol, None)
+                order_id = _write_fill(account_name, symbol, side, fill, source, order_time, seed)
+                exec_prices[symbol] = fill['exec_price']
+                results[i] = {'index': i, 'status': fill['status'],
+                              'order': _order_view(order_id, symbol, side, qty, price, fill, order_time, seed),
+                              'simulation': _simulation_view(fill)}
+            rejected = sum(1 for r in results if r['status'] == 'rejected')
+            if rejected and all_or_none:
+                for i, r in enumerate(results):
+                    if r['status'] != 'rejected':
+                        results[i] = {'index': i, 'status': 'cancelled', 'symbol': legs[i]['symbol'],
+                                      'side': legs[i]['side'], 'requested_qty': legs[i]['qty'],
+                                      'requested_price': legs[i]['price']}
+                raise BasketError(f'Basket rejected: {rejected} of {len(legs)} legs do not fit (all_or_none)', results)
+            database.update_account_cash(account_name, cash)
+            database.set_account_rng(account_name, rng_seed, rng_seq)
+            if not is_sim_mode():
+                database.update_equity_history(account_name, as_of_date=order_time.date() if order_time else None)
+        holdings.apply_fill(account_name, cash, {sym: positions.get(sym) for sym in exec_prices}, exec_prices)
+    _logger.info("execute_basket: account=%s legs=%s rejected=%s source=%s", account_name, len(legs), rejected, source)
+    return {'legs': results, 'filled': len(legs) - rejected, 'rejected': rejected, 'account': account_name,
+            'cash': round(cash, 2)}
+
+
+# ============================================================
+# Deferred fills (latency simulation)
+# ============================================================
+
+class _FillExecutor:
+    """Single background thread applying queued fills when due (heap of (due_at, order_id))."""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._heap: List[tuple] = []
+        self._thread: Optional[threading.Thread] = None
+        self._last_due: Dict[str, float] = {}
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self._stats = {'queued': 0, 'filled': 0, 'rejected': 0, 'lag_ms_max': 0.0}
+
+    def next_due(self, account_name: str, delay: float) -> float:
+        """Wall-clock due time, never earlier than the account's previous one (fills stay in arrival order)."""
+        with self._cond:
+            due = max(time.time() + delay, self._last_due.get(account_name, 0.0))
+            self._last_due[account_name] = due
+            return due
+
+    def schedule(self, due_at: float, order_id: int):
+        with self._cond:
+            heapq.heappush(self._heap, (due_at, order_id))
+            self._stats['queued'] += 1
+            self._ensure_thread()
+            self._cond.notify()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='fill-executor', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.time():
+                    self._cond.wait(None if not self._heap else max(0.0, self._heap[0][0] - time.time()))
+                due_at, order_id = heapq.heappop(self._heap)
+            lag_ms = (time.time() - due_at) * 1000
+            try:
+                event = _apply_deferred(order_id)
+            except Exception:
+                _logger.exception("deferred fill: order_id=%s failed", order_id)
+                continue
+            if event is None:
+                continue
+            with self._cond:
+                self._stats['filled' if event['order']['status'] != 'rejected' else 'rejected'] += 1
+                self._stats['lag_ms_max'] = max(self._stats['lag_ms_max'], lag_ms)
+            self.notify(event)
+
+    def notify(self, event: Dict[str, Any]):
+        with self._cond:
+            listeners = list(self._listeners)
+        for fn in listeners:
+            try:
+                fn(event)
+            except Exception:
+                _logger.exception("fill listener failed for order_id=%s", event['order'].get('id'))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self._stats)
+            stats['waiting'] = len(self._heap)
+        stats['lag_ms_max'] = round(stats['lag_ms_max'], 3)
+        stats['mode'] = ORDER_LATENCY_MODE
+        return stats
+
+
+_executor = _FillExecutor()
+
+
+def add_fill_listener(fn: Callable[[Dict[str, Any]], None]):
+    """Register fn(event) called after each deferred fill; event = execute_order result (+ order.source) or rejection."""
+    with _executor._cond:
+        _executor._listeners.append(fn)
+
+
+def notify_fill(event: Dict[str, Any]):
+    """Deliver a background fill / rejection event to the fill listeners (used by core.order_book)."""
+    _executor.notify(event)
+
+
+def get_fill_queue_stats() -> Dict[str, Any]:
+    return _executor.stats()
+
+
+def start_fill_executor() -> int:
+    """Re-queue fills left pending by a previous process (overdue ones run immediately). Returns count."""
+    pending = database.list_pending_fills()
+    for row in pending:
+        _executor.schedule(row['due_at'], row['order_id'])
+    if pending:
+        _logger.info("deferred fill: recovered %s pending fills", len(pending))
+    return len(pending)
+
+
+def _accept_deferred(account_name: str, symbol: str, side: str, qty: int, price: float, source: str,
+                     order_time: Optional[datetime], clamp_sell: bool) -> Dict[str, Any]:
+    """Write the order as 'pending' and queue its fill after the simulated latency; returns immediately."""
+    with account_lock(account_name):
+        with database.transaction():
+            account = database.get_account(account_name)
+            if not account:
+                raise OrderError(f'Account not found: {account_name}')
+            seed = _next_order_seed(account)
+            delay = simulation.sample_latency(simulation.order_rng(seed, 'latency'))
+            fill_time = order_time + timedelta(seconds=delay) if order_time else None
+            due_at = _executor.next_due(account_name, delay)
+            order_id = database.add_order(account_name, symbol, side, qty, price, 'pending', source,
+                                          order_time=order_time, seed=seed)
+            database.add_pending_fill(order_id, account_name, symbol, side, qty, price, source, clamp_sell,
+                                      fill_time.isoformat() if fill_time else None, due_at)
+    _executor.schedule(due_at, order_id)
+    _logger.info("execute_order: accepted deferred order_id=%s account=%s symbol=%s side=%s qty=%s due_in_ms=%.1f",
+                 order_id, account_name, symbol, side, qty, (due_at - time.time()) * 1000)
+
+    return {
+        'pending': True,
+        'order': {
+            'id': order_id,
+            'symbol': symbol,
+            'side': side,
+            'requested_qty': qty,
+            'filled_qty': 0,
+            'requested_price': price,
+            'exec_price': None,
+            'value': 0,
+            'time': order_time.isoformat() if order_time else get_current_datetime_iso(),
+            'status': 'pending',
+            'seed': seed,
+        },
+        'due_in_ms': round(max(0.0, due_at - time.time()) * 1000, 1),
+        'account': account_name,
+        'cash': round(account['cash'], 2),
+    }
+
+
+def _apply_deferred(order_id: int) -> Optional[Dict[str, Any]]:
+    """Fill (or reject) one queued order under its account lock; None if it is no longer pending."""
+    row = database.get_pending_fill(order_id)
+    if not row or row['status'] != 'pending':
+        return None
+    account_name = row['account_name']
+    fill_time = datetime.fromisoformat(row['fill_time']) if row['fill_time'] else None
+    if fill_time is not None:
+        ctrl.set_time_iso(row['fill_time'])  # executor thread has no request tick context
+    with account_lock(account_name):
+        try:
+            result = _execute_order_locked(account_name, row['symbol'], row['side'], row['qty'], row['price'],
+                                           row['source'], fill_time, bool(row['clamp_sell']), order_id=order_id)
+        except OrderError as e:
+            database.complete_pending_fill(order_id, 'rejected', str(e))
+            _logger.info("deferred fill: order_id=%s rejected: %s", order_id, e)
+            return {'order': {'id': order_id, 'symbol': row['symbol'], 'side': row['side'],
+                              'requested_qty': row['qty'], 'requested_price': row['price'], 'status': 'rejected',
+                              'error': str(e), 'source': row['source']},
+                    'account': account_name}
+    result['order']['source'] = row['source']
+    return result
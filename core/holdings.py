@@ -0,0 +1,239 @@
+"""
+PPT holdings index: in-memory symbol -> holders (account, qty) index with per-account marks, for push-based
+mark-to-market.
+
+Used for: live P&L. core.utils quotes (get_quote / get_quotes_batch) revalue only the accounts holding the quoted
+symbols and push the change to Socket.IO ('pnl'); core.execution keeps the index in sync after every committed fill.
+
+Functions:
+    start() -> int                 Load accounts / positions / watchlist marks from the DB, listen to core.utils
+                                   quotes (app startup); returns number of positions
+    apply_fill(account_name, cash, positions, prices)
+        After a committed fill (caller holds the account lock): cash, {symbol: {'qty', 'avg_price'} | None} of the
+        touched symbols, {symbol: exec_price}
+    refresh_account(account_name)  Re-read one account from the DB (create / deposit / withdraw / reset / delete)
+    on_quotes(prices) -> int       {symbol: price}: revalue the holders of changed symbols; returns accounts revalued
+    holders(symbol) -> Dict[str, int]          {account: qty} of one symbol
+    get_account_value(account_name) -> Optional[Dict]   Current marked equity / pnl of one account
+    add_pnl_listener(fn)           fn(event) per revalued account (app: Socket.IO 'pnl')
+    get_holdings_stats() -> Dict   Accounts / symbols / holders / quote updates / revaluations (for /api/health)
+
+Features:
+    - A quote costs O(holders of the changed symbols): position value moves by qty * (price - previous mark) per
+      holder; unchanged prices and symbols nobody holds cost one dict lookup
+    - pnl event: {'account', 'reason': 'quote' | 'fill', 'equity', 'pnl', 'pnl_pct', 'cash', 'position_value',
+      'delta' (equity change), 'changes': {symbol: {'price', 'prev_price', 'qty', 'delta'}}}
+    - Marks: last valid quote of the symbol; before any quote the watchlist last_price (start), the exec price of a
+      fill, then cost price, the same fallback order as the equity pass (core.equity)
+    - A fill recomputes that account's position value from its marks (bounds float drift of the incremental updates)
+    - Inactive until start(): replay / sweep / benches without the app pay nothing
+"""
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from . import db as database
+from .utils import add_quote_listener
+
+_logger = logging.getLogger(__name__)
+
+
+class _Account:
+    __slots__ = ('cash', 'initial_capital', 'positions', 'position_value')
+
+    def __init__(self, cash: float, initial_capital: float):
+        self.cash = cash
+        self.initial_capital = initial_capital
+        self.positions: Dict[str, Dict[str, float]] = {}
+        self.position_value = 0.0
+
+
+_lock = threading.Lock()
+_holders: Dict[str, Dict[str, int]] = {}
+_accounts: Dict[str, _Account] = {}
+_marks: Dict[str, float] = {}
+_listeners: List[Callable[[Dict[str, Any]], None]] = []
+_loaded = False
+_listening = False
+_stats = {'quote_updates': 0, 'symbols_changed': 0, 'revaluations': 0, 'fills': 0, 'refreshes': 0}
+
+
+def _mark(symbol: str, pos: Dict[str, float]) -> float:
+    mark = _marks.get(symbol)
+    return mark if mark is not None else pos['avg_price']
+
+
+def _revalue_locked(book: _Account):
+    book.position_value = sum(pos['qty'] * _mark(sym, pos) for sym, pos in book.positions.items())
+
+
+def _set_position_locked(account_name: str, book: _Account, symbol: str, pos: Optional[Dict[str, Any]]):
+    holders = _holders.get(symbol)
+    if pos and pos['qty'] > 0:
+        book.positions[symbol] = {'qty': pos['qty'], 'avg_price': pos['avg_price']}
+        _holders.setdefault(symbol, {})[account_name] = pos['qty']
+    else:
+        book.positions.pop(symbol, None)
+        if holders is not None:
+            holders.pop(account_name, None)
+            if not holders:
+                del _holders[symbol]
+
+
+def _drop_account_locked(account_name: str):
+    book = _accounts.pop(account_name, None)
+    if book is None:
+        return
+    for symbol in list(book.positions):
+        _set_position_locked(account_name, book, symbol, None)
+
+
+def _event(account_name: str, book: _Account, reason: str, delta: float,
+           changes: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    equity = book.cash + book.position_value
+    pnl = equity - book.initial_capital
+    return {
+        'account': account_name,
+        'reason': reason,
+        'equity': round(equity, 2),
+        'pnl': round(pnl, 2),
+        'pnl_pct': round(pnl / book.initial_capital * 100, 4) if book.initial_capital > 0 else 0,
+        'cash': round(book.cash, 2),
+        'position_value': round(book.position_value, 2),
+        'delta': round(delta, 2),
+        'changes': changes,
+    }
+
+
+def _notify(events: List[Dict[str, Any]]):
+    if not events:
+        return
+    with _lock:
+        listeners = list(_listeners)
+    for event in events:
+        for fn in listeners:
+            try:
+                fn(event)
+            except Exception:
+                _logger.exception("pnl listener failed for account=%s", event['account'])
+
+
+def start() -> int:
+    """Build the index from the DB and subscribe to core.utils quotes. Returns number of positions."""
+    global _loaded, _listening
+    accounts = database.get_all_accounts()
+    positions = database.get_all_positions()
+    watchlist = database.get_watchlist()
+    with _lock:
+        _holders.clear()
+        _accounts.clear()
+        for w in watchlist:
+            if (w.get('last_price') or 0) > 0 and w['symbol'] not in _marks:
+                _marks[w['symbol']] = float(w['last_price'])
+        for acc in accounts:
+            book = _accounts[acc['name']] = _Account(acc['cash'], acc['initial_capital'])
+            for symbol, pos in positions.get(acc['name'], {}).items():
+                _set_position_locked(acc['name'], book, symbol, pos)
+            _revalue_locked(book)
+        count = sum(len(h) for h in _holders.values())
+        _loaded = True
+    if not _listening:
+        add_quote_listener(on_quotes)
+        _listening = True
+    _logger.info("holdings index: loaded %s accounts, %s positions, %s symbols", len(accounts), count, len(_holders))
+    return count
+
+
+def apply_fill(account_name: str, cash: float, positions: Dict[str, Optional[Dict[str, Any]]],
+               prices: Dict[str, float]):
+    """Apply a committed fill: new cash and the new position (None = closed) of each touched symbol."""
+    if not _loaded:
+        return
+    with _lock:
+        book = _accounts.get(account_name)
+        if book is None:
+            return  # 账户在 start() 之后由其它路径创建: refresh_account 负责
+        before = book.cash + book.position_value
+        book.cash = cash
+        for symbol, pos in positions.items():
+            if symbol not in _marks and prices.get(symbol, 0) > 0:
+                _marks[symbol] = prices[symbol]
+            _set_position_locked(account_name, book, symbol, pos)
+        _revalue_locked(book)
+        changes = {sym: {'price': _marks.get(sym), 'qty': book.positions.get(sym, {}).get('qty', 0)}
+                   for sym in positions}
+        event = _event(account_name, book, 'fill', book.cash + book.position_value - before, changes)
+        _stats['fills'] += 1
+    _notify([event])
+
+
+def refresh_account(account_name: str):
+    """Re-read one account (cash, capital, positions) from the DB; a deleted account is dropped."""
+    if not _loaded:
+        return
+    with _lock:
+        # 在锁内读库: 并发成交的 apply_fill 要么已体现在读到的行里, 要么排在之后 (写入的是绝对值, 重复应用无害)
+        account = database.get_account(account_name)
+        positions = database.get_positions(account_name) if account else {}
+        _drop_account_locked(account_name)
+        _stats['refreshes'] += 1
+        if account is None:
+            return
+        book = _accounts[account_name] = _Account(account['cash'], account['initial_capital'])
+        for symbol, pos in positions.items():
+            _set_position_locked(account_name, book, symbol, pos)
+        _revalue_locked(book)
+
+
+def on_quotes(prices: Dict[str, float]) -> int:
+    """Move the marks of {symbol: price}; holders of changed symbols are revalued and notified. Returns count."""
+    if not _loaded:
+        return 0
+    touched: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    deltas: Dict[str, float] = {}
+    with _lock:
+        _stats['quote_updates'] += 1
+        for symbol, price in prices.items():
+            prev = _marks.get(symbol)
+            _marks[symbol] = price
+            holders = _holders.get(symbol)
+            if not holders or prev == price:
+                continue
+            _stats['symbols_changed'] += 1
+            for account_name, qty in holders.items():
+                book = _accounts[account_name]
+                base = prev if prev is not None else book.positions[symbol]['avg_price']
+                delta = qty * (price - base)
+                book.position_value += delta
+                deltas[account_name] = deltas.get(account_name, 0.0) + delta
+                touched.setdefault(account_name, {})[symbol] = {'price': price, 'prev_price': base, 'qty': qty,
+                                                                'delta': round(delta, 2)}
+        events = [_event(name, _accounts[name], 'quote', deltas[name], changes) for name, changes in touched.items()]
+        _stats['revaluations'] += len(events)
+    _notify(events)
+    return len(events)
+
+
+def holders(symbol: str) -> Dict[str, int]:
+    with _lock:
+        return dict(_holders.get(symbol, {}))
+
+
+def get_account_value(account_name: str) -> Optional[Dict[str, Any]]:
+    with _lock:
+        book = _accounts.get(account_name)
+        return _event(account_name, book, 'snapshot', 0.0, {}) if book is not None else None
+
+
+def add_pnl_listener(fn: Callable[[Dict[str, Any]], None]):
+    """Register fn(event) called for each account revalued by a quote or a fill."""
+    with _lock:
+        _listeners.append(fn)
+
+
+def get_holdings_stats() -> Dict[str, Any]:
+    with _lock:
+        stats = dict(_stats)
+        stats.update({'loaded': _loaded, 'accounts': len(_accounts), 'symbols': len(_holders),
+                      'holders': sum(len(h) for h in _holders.values()), 'marks': len(_marks)})
+    return stats
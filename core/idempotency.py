@@ -0,0 +1,163 @@
+"""
+PPT idempotency keys: store the response of a keyed request so a retry gets it back without running again.
+
+Used for: POST /api/webhook (Idempotency-Key header or idempotency_key payload field); senders that retry on
+timeouts no longer turn every retry into another fill.
+
+Classes:
+    IdempotencyStore   Thread-safe TTL LRU of completed responses in front of the idempotency_keys table
+
+Functions:
+    start() -> int                    Release claims left 'processing' by a previous process (app startup)
+    get_store() -> IdempotencyStore   Process-wide store (configured from env)
+    fingerprint(payload) -> str       sha256 of the canonical JSON payload (same key + different payload -> MISMATCH)
+    get_idempotency_stats() -> dict   Hits / misses / replays / conflicts / evictions (for /api/health)
+
+Features:
+    - begin(key, fp) -> (NEW | REPLAY | IN_PROGRESS | MISMATCH, (body, http_status) for REPLAY):
+      a retry of a completed request is one in-memory lookup; a miss (e.g. after a restart or LRU eviction) falls
+      back to one SQLite statement, which also claims new keys atomically (INSERT OR IGNORE), so two concurrent
+      requests with one key never both execute
+    - finish(key, fp, body, http_status) stores the response (memory + SQLite); abandon(key) releases a claim
+      when the outcome is not final (exception, 5xx, quote unavailable), so the next retry runs
+    - A claim whose request never finished (crash, hang) blocks retries (409) for at most IDEMPOTENCY_LEASE_SEC
+      (default 60), then the next retry takes it over; start() releases all claims of a previous process. The
+      interrupted request may have committed its fill before it died, so that retry can fill again
+    - Keys expire after IDEMPOTENCY_TTL_SEC (default 86400) in memory and in SQLite (pruned every
+      IDEMPOTENCY_PRUNE_EVERY new keys); IDEMPOTENCY_CACHE_SIZE (default 10000) bounds memory (LRU)
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from . import db as database
+
+_logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL_SEC = float(os.getenv('IDEMPOTENCY_TTL_SEC', '86400'))
+IDEMPOTENCY_CACHE_SIZE = max(1, int(os.getenv('IDEMPOTENCY_CACHE_SIZE', '10000')))
+IDEMPOTENCY_PRUNE_EVERY = max(1, int(os.getenv('IDEMPOTENCY_PRUNE_EVERY', '1000')))
+IDEMPOTENCY_LEASE_SEC = float(os.getenv('IDEMPOTENCY_LEASE_SEC', '60'))
+MAX_KEY_LENGTH = 255
+
+# begin() states
+NEW, REPLAY, IN_PROGRESS, MISMATCH = 'new', 'replay', 'in_progress', 'mismatch'
+
+
+def fingerprint(payload: Any) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False,
+                                     default=str).encode('utf-8')).hexdigest()
+
+
+class IdempotencyStore:
+    """LRU of completed responses; key -> (fingerprint, body, http_status, created_at epoch)."""
+
+    def __init__(self, max_size: int = IDEMPOTENCY_CACHE_SIZE, ttl: float = IDEMPOTENCY_TTL_SEC,
+                 prune_every: int = IDEMPOTENCY_PRUNE_EVERY, lease: float = IDEMPOTENCY_LEASE_SEC):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lease = lease
+        self.prune_every = prune_every
+        self._data: "OrderedDict[str, Tuple[str, Dict[str, Any], int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._since_prune = 0
+        self._stats = {'hits': 0, 'misses': 0, 'replays': 0, 'in_progress': 0, 'mismatches': 0, 'stores': 0,
+                       'evictions': 0, 'abandoned': 0, 'pruned': 0}
+
+    def _remember(self, key: str, fp: str, body: Dict[str, Any], http_status: int, created_at: float):
+        with self._lock:
+            self._data[key] = (fp, body, http_status, created_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def begin(self, key: str, fp: str) -> Tuple[str, Optional[Tuple[Dict[str, Any], int]]]:
+        """Claim key for a new request, or return the stored response of an earlier one."""
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and now - entry[3] > self.ttl:
+                del self._data[key]
+                entry = None
+            if entry is not None:
+                self._data.move_to_end(key)
+                self._stats['hits'] += 1
+                if entry[0] != fp:
+                    self._stats['mismatches'] += 1
+                    return MISMATCH, None
+                self._stats['replays'] += 1
+                return REPLAY, (entry[1], entry[2])
+            self._stats['misses'] += 1
+
+        row = database.reserve_idempotency_key(key, fp, now, self.ttl, self.lease)
+        if row is None:
+            self._maybe_prune(now)
+            return NEW, None
+        with self._lock:
+            if row['fingerprint'] != fp:
+                self._stats['mismatches'] += 1
+                return MISMATCH, None
+            if row['status'] != 'done':
+                self._stats['in_progress'] += 1
+                return IN_PROGRESS, None
+            self._stats['replays'] += 1
+        body = json.loads(row['response']) if row['response'] else {}
+        self._remember(key, fp, body, row['http_status'], row['created_at'])
+        return REPLAY, (body, row['http_status'])
+
+    def finish(self, key: str, fp: str, body: Dict[str, Any], http_status: int):
+        """Store the response of a claimed key."""
+        database.complete_idempotency_key(key, http_status, json.dumps(body, ensure_ascii=False, default=str))
+        self._remember(key, fp, body, http_status, time.time())
+        with self._lock:
+            self._stats['stores'] += 1
+
+    def abandon(self, key: str):
+        """Release a claimed key without a stored response (the request failed); a retry runs again."""
+        database.delete_idempotency_key(key)
+        with self._lock:
+            self._stats['abandoned'] += 1
+
+    def _maybe_prune(self, now: float):
+        with self._lock:
+            self._since_prune += 1
+            if self._since_prune < self.prune_every:
+                return
+            self._since_prune = 0
+        pruned = database.prune_idempotency_keys(now - self.ttl)
+        with self._lock:
+            self._stats['pruned'] += pruned
+        if pruned:
+            _logger.info("idempotency: pruned %s expired keys", pruned)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._data)
+        stats.update({'max_size': self.max_size, 'ttl_sec': self.ttl, 'lease_sec': self.lease})
+        return stats
+
+
+_store = IdempotencyStore()
+
+
+def start() -> int:
+    """Release 'processing' claims of a previous process (its requests can no longer store a response)."""
+    released = database.clear_idempotency_claims()
+    if released:
+        _logger.info("idempotency: released %s claims interrupted by a restart", released)
+    return released
+
+
+def get_store() -> IdempotencyStore:
+    return _store
+
+
+def get_idempotency_stats() -> Dict[str, Any]:
+    return _store.stats()
@@ -0,0 +1,261 @@
+"""
+PPT webhook netting window: coalesce an account's market signals that arrive within WEBHOOK_NETTING_MS and fill
+the net quantity per symbol as one basket.
+
+Used for: synchronous POST /api/webhook during signal storms (e.g. close + re-open of one symbol within
+milliseconds): one fill batch (execution.execute_basket, one transaction) instead of one full fill per signal.
+
+Functions:
+    is_enabled() -> bool
+    submit(account_name, symbol, side, qty, price, order_time=None) -> (result, http status)
+        Join the account's open window (or open one) and block until it is filled; result has the shape of the
+        synchronous webhook response plus 'netting' (window id, net qty of the symbol, signals in the window)
+    get_netting_stats() -> Dict   Windows / signals / net fills / fully netted signals / fills saved
+
+Features:
+    - Fixed window per account: opened by its first signal, flushed WEBHOOK_NETTING_MS later, so a signal waits at
+      most the window (+ the fill). Flushes run on WEBHOOK_NETTING_WORKERS threads (default 4, account -> shard by
+      crc32 like core.signal_queue): a slow fill only delays the windows of accounts on the same shard
+    - Sells are replayed in arrival order against the held qty first (under the account lock, webhook clamp
+      semantics): a sell beyond the running position is clamped, a sell with nothing held is rejected with the
+      error execute_order would give ('No position: ...', 400), so e.g. sell 100 then buy 100 on a flat account
+      ends long 100 as it would one by one. Buys are assumed to fill (cash is checked once, on the net leg)
+    - Per symbol: net = sum(buy qty) - sum(sell qty) of the replayed quantities, priced at the latest signal of the
+      symbol; net 0 -> no fill. Opposite signals offset each other in arrival order ('netted_qty'); the net fill is
+      allocated to the remaining signals of the net side in arrival order ('filled_qty', same exec_price). A signal
+      fully offset returns status 'netted' (200) without an order id
+    - A rejected net leg (e.g. insufficient cash) is the error (400) of every signal with a share in it. Latency
+      simulation does not apply (basket fills are immediate)
+    - A signal whose window has not started to flush within WEBHOOK_NETTING_MS + 30 s is taken out of the window
+      and answered 503 (not executed, safe to retry); once the flush has started the answer waits for its fills
+    - Fills are pushed through execution.notify_fill (Socket.IO 'trade' with netting_id)
+"""
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import db as database
+from . import execution
+
+_logger = logging.getLogger(__name__)
+
+WEBHOOK_NETTING_MS = max(0.0, float(os.getenv('WEBHOOK_NETTING_MS', '0') or 0))
+WEBHOOK_NETTING_WORKERS = max(1, int(os.getenv('WEBHOOK_NETTING_WORKERS', '4') or 4))
+# 窗口未开始成交的最长等待: 超时的信号移出窗口并返回 503 (未执行, 可安全重试)
+_RESULT_TIMEOUT_SEC = 30.0
+
+_ids = itertools.count(1)
+_stats_lock = threading.Lock()
+_stats = {'windows': 0, 'signals': 0, 'net_fills': 0, 'netted_signals': 0, 'fills_saved': 0, 'rejected': 0,
+          'timed_out': 0, 'errors': 0}
+
+
+class _Window:
+    def __init__(self, account_name: str):
+        self.id = next(_ids)
+        self.account = account_name
+        self.signals: List[Dict[str, Any]] = []
+        self.order_time: Optional[datetime] = None
+        self.flushing = False
+        self.done = threading.Event()
+
+
+class _Shard:
+    """Open windows of the accounts mapped to this shard, flushed in due order by one thread."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.cond = threading.Condition(threading.Lock())
+        self.open: Dict[str, _Window] = {}
+        self.heap: List[tuple] = []
+        self.thread: Optional[threading.Thread] = None
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.heap or self.heap[0][0] > time.monotonic():
+                    self.cond.wait(None if not self.heap else max(0.0, self.heap[0][0] - time.monotonic()))
+                _, _, window = heapq.heappop(self.heap)
+                if self.open.get(window.account) is window:
+                    del self.open[window.account]  # 之后到达的信号进入新窗口
+                window.flushing = True
+            try:
+                _flush(window)
+            except Exception as e:
+                _logger.exception("netting: window %s account=%s failed", window.id, window.account)
+                _count('errors')
+                for signal in window.signals:
+                    if signal['result'] is None:
+                        signal['result'] = ({'error': f'{type(e).__name__}: {e}'}, 500)
+            finally:
+                window.done.set()
+
+
+_shards = [_Shard(i) for i in range(WEBHOOK_NETTING_WORKERS)]
+
+
+def _count(key: str, n: int = 1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+def is_enabled() -> bool:
+    return WEBHOOK_NETTING_MS > 0
+
+
+def submit(account_name: str, symbol: str, side: str, qty: int, price: float,
+           order_time: Optional[datetime] = None) -> Tuple[Dict[str, Any], int]:
+    """Add one market signal to the account's window and wait for its own result."""
+    signal = {'symbol': symbol, 'side': side, 'qty': qty, 'price': price, 'result': None}
+    shard = _shards[zlib.crc32(account_name.encode('utf-8')) % WEBHOOK_NETTING_WORKERS]
+    with shard.cond:
+        window = shard.open.get(account_name)
+        if window is None:
+            window = shard.open[account_name] = _Window(account_name)
+            heapq.heappush(shard.heap, (time.monotonic() + WEBHOOK_NETTING_MS / 1000, window.id, window))
+            _count('windows')
+            if shard.thread is None or not shard.thread.is_alive():
+                shard.thread = threading.Thread(target=shard.run, name=f'webhook-netting-{shard.index}',
+                                                daemon=True)
+                shard.thread.start()
+            shard.cond.notify()
+        window.signals.append(signal)
+        if order_time is not None:
+            window.order_time = order_time  # 窗口按最后一个信号的时间成交
+    _count('signals')
+    if not window.done.wait(WEBHOOK_NETTING_MS / 1000 + _RESULT_TIMEOUT_SEC):
+        with shard.cond:
+            if not window.flushing:
+                # 尚未开始成交: 移出窗口后再应答, 之后不会再成交
+                window.signals = [s for s in window.signals if s is not signal]
+                _count('timed_out')
+                return {'error': f'Netting window {window.id} not flushed within '
+                                 f'{WEBHOOK_NETTING_MS / 1000 + _RESULT_TIMEOUT_SEC:.1f}s; signal not executed'}, 503
+        window.done.wait()  # 成交已开始: 应答必须反映其结果
+    return signal['result']
+
+
+def _replay_sells(window: '_Window', by_symbol: Dict[str, List[Dict[str, Any]]], netting_info: Dict[str, Any]):
+    """Per-signal qty as one-by-one execution would fill it: sells clamped to the running held qty."""
+    if not database.get_account(window.account):
+        for signal in window.signals:
+            signal['fill_qty'] = 0
+            signal['result'] = ({'error': f'Account not found: {window.account}', 'netting': {**netting_info}}, 400)
+        return
+    held = database.get_positions(window.account)
+    for symbol, signals in by_symbol.items():
+        running = (held.get(symbol) or {}).get('qty', 0)
+        for s in signals:
+            if s['side'] == 'buy':
+                s['fill_qty'] = s['qty']
+                running += s['qty']
+            elif running <= 0:
+                s['fill_qty'] = 0
+                s['result'] = ({'error': f'No position: {symbol}', 'netting': {**netting_info}}, 400)
+            else:
+                s['fill_qty'] = min(s['qty'], running)
+                running -= s['fill_qty']
+
+
+def _flush(window: '_Window'):
+    # 账户锁贯穿 读持仓 -> 轧差 -> 成交 (execute_basket 在同一线程内重入)
+    with execution.account_lock(window.account):
+        _flush_locked(window)
+
+
+def _flush_locked(window: '_Window'):
+    by_symbol: Dict[str, List[Dict[str, Any]]] = {}
+    for signal in window.signals:
+        by_symbol.setdefault(signal['symbol'], []).append(signal)
+    netting_info = {'id': window.id, 'signals': len(window.signals)}
+    _replay_sells(window, by_symbol, netting_info)
+
+    legs, leg_signals, nets = [], [], {}
+    for symbol, signals in by_symbol.items():
+        bought = sum(s['fill_qty'] for s in signals if s['side'] == 'buy')
+        sold = sum(s['fill_qty'] for s in signals if s['side'] == 'sell')
+        nets[symbol] = bought - sold
+        # 反向信号按到达顺序相互抵消 (双方各抵消 min(买, 卖))
+        offset = {'buy': min(bought, sold), 'sell': min(bought, sold)}
+        for s in signals:
+            s['netted_qty'] = min(s['fill_qty'], offset[s['side']])
+            offset[s['side']] -= s['netted_qty']
+        if bought != sold:
+            legs.append({'symbol': symbol, 'side': 'buy' if bought > sold else 'sell', 'qty': abs(bought - sold),
+                         'price': signals[-1]['price']})
+            leg_signals.append([s for s in signals if s['fill_qty'] > s['netted_qty']])
+
+    legs_out: List[Dict[str, Any]] = []
+    cash = None
+    if legs:
+        try:
+            basket = execution.execute_basket(window.account, legs, source='webhook', order_time=window.order_time,
+                                              clamp_sell=True)
+            legs_out, cash = basket['legs'], basket['cash']
+        except execution.OrderError as e:
+            legs_out = [{'status': 'rejected', 'error': str(e)} for _ in legs]
+
+    for leg, out, signals in zip(legs, legs_out, leg_signals):
+        if 'order' in out:
+            order = {**out['order'], 'source': 'webhook', 'netting_id': window.id}
+            execution.notify_fill({'order': order, 'simulation': out['simulation'], 'account': window.account})
+            remaining = order['filled_qty']
+            for s in signals:
+                share = min(s['fill_qty'] - s['netted_qty'], remaining)
+                remaining -= share
+                s['result'] = ({
+                    'status': 'ok',
+                    'order': {**order, 'requested_qty': s['qty'], 'requested_price': s['price'], 'side': s['side'],
+                              'filled_qty': share, 'netted_qty': s['netted_qty'],
+                              'value': round(share * order['exec_price'], 2)},
+                    'simulation': out['simulation'],
+                    'netting': {**netting_info, 'net_qty': nets[leg['symbol']]},
+                    'account': window.account,
+                    'cash': cash,
+                }, 200)
+        else:
+            for s in signals:
+                s['result'] = ({'error': out.get('error', 'rejected'),
+                                'netting': {**netting_info, 'net_qty': nets[leg['symbol']]}}, 400)
+
+    netted = rejected = 0
+    for signal in window.signals:
+        if signal['result'] is None:
+            netted += 1
+            signal['result'] = ({
+                'status': 'netted',
+                'order': {'id': None, 'symbol': signal['symbol'], 'side': signal['side'],
+                          'requested_qty': signal['qty'], 'requested_price': signal['price'], 'filled_qty': 0,
+                          'netted_qty': signal['netted_qty'], 'exec_price': None, 'source': 'webhook',
+                          'netting_id': window.id},
+                'netting': {**netting_info, 'net_qty': nets[signal['symbol']]},
+                'account': window.account,
+                'cash': cash,
+            }, 200)
+        elif signal['result'][1] >= 400:
+            rejected += 1
+            signal['result'][0]['netting'].setdefault('net_qty', nets[signal['symbol']])
+    fills = sum(1 for out in legs_out if 'order' in out)
+    _count('net_fills', fills)
+    _count('netted_signals', netted)
+    _count('rejected', rejected)
+    _count('fills_saved', max(0, len(window.signals) - rejected - fills))
+    _logger.info("netting: window %s account=%s signals=%s net_legs=%s fills=%s rejected=%s", window.id,
+                 window.account, len(window.signals), len(legs), fills, rejected)
+
+
+def get_netting_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        stats = dict(_stats)
+    open_windows = 0
+    for shard in _shards:
+        with shard.cond:
+            open_windows += len(shard.open)
+    stats.update({'open_windows': open_windows, 'window_ms': WEBHOOK_NETTING_MS, 'workers': WEBHOOK_NETTING_WORKERS})
+    return stats
@@ -0,0 +1,402 @@
+"""
+PPT order book: resting limit / stop / stop-limit orders (GTC or DAY) per symbol, triggered by quotes and sim ticks.
+
+Used for: POST /api/orders and POST /api/webhook with type limit | stop | stop_limit; quotes seen by core.utils
+(get_quote / get_quotes_batch) and POST /api/scheduler/tick evaluate the books.
+
+Functions:
+    place(account_name, symbol, side, qty, order_type, limit_price=None, stop_price=None, tif='GTC', source='web',
+          order_time=None, clamp_sell=False) -> Dict        Rest an order (working_orders row); raises OrderError
+    cancel(order_id) -> Optional[Dict]     Cancel a working order (None if unknown); raises OrderError if not working
+    on_quotes(prices, now_iso=None) -> int  {symbol: price}: expire DAY orders, queue the orders each price crosses
+    on_tick(now_iso=None) -> Dict          Sim tick: expire, fetch quotes for symbols with working orders, wait for fills
+    drain()                                Block until queued fills are applied
+    start() -> int                         Load working orders from the DB, listen to core.utils quotes (app startup)
+    forget_account(account_name)           Drop an account's orders from memory (account reset / delete)
+    symbols() -> List[str]                 Symbols with working orders
+    get_book_stats() -> Dict               Working / triggered / filled / expired counters (for /api/health)
+
+Features:
+    - Two heaps per symbol: 'up' (min-heap, fires when price >= key: sell limit, buy stop) and 'down' (max-heap, fires
+      when price <= key: buy limit, sell stop); a quote pops only the orders it crosses, O(k log n) for k fills,
+      O(1) when nothing crosses, independent of the number of resting orders
+    - stop_limit: rests on its stop; when the stop is hit it moves to the limit side in the same pass
+    - Fills run on one worker thread through core.execution (account lock, one transaction with the working order
+      update); base price is the quote, limit orders never fill worse than the limit (slippage is capped)
+    - Partial fills (core.simulation partial_fill): the remainder keeps working with its original time priority
+    - Lazy cancel: a cancelled entry is flagged and dropped when it reaches a heap top; a book is rebuilt once more than
+      half of it is dead
+    - DAY orders expire at the first quote / tick dated after the placement date (sim date in sim mode, UTC otherwise);
+      expiry pops a heap ordered by session date, so it never scans live orders
+    - Background fills / rejections go to core.execution fill listeners (Socket.IO 'trade')
+"""
+import heapq
+import logging
+import queue
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+from . import ctrl
+from . import db as database
+from . import execution
+from .execution import OrderError
+from .utils import add_quote_listener, get_current_datetime_iso, get_quote, get_quotes_batch, is_sim_mode
+
+_logger = logging.getLogger(__name__)
+
+ORDER_TYPES = ('limit', 'stop', 'stop_limit')
+TIME_IN_FORCE = ('GTC', 'DAY')
+
+# 死条目超过此数且超过一半时重建堆
+_COMPACT_MIN_DEAD = 64
+
+
+class _Entry:
+    __slots__ = ('id', 'account', 'symbol', 'side', 'order_type', 'remaining', 'limit_price', 'stop_price', 'tif',
+                 'session_date', 'triggered', 'source', 'clamp_sell', 'active', 'in_book', 'in_day_heap')
+
+    def __init__(self, row: Dict[str, Any]):
+        self.id = row['id']
+        self.account = row['account_name']
+        self.symbol = row['symbol']
+        self.side = row['side']
+        self.order_type = row['order_type']
+        self.remaining = row['remaining_qty']
+        self.limit_price = row['limit_price']
+        self.stop_price = row['stop_price']
+        self.tif = row['tif']
+        self.session_date = row['session_date']
+        self.triggered = bool(row['triggered'])
+        self.source = row['source']
+        self.clamp_sell = bool(row['clamp_sell'])
+        self.active = True
+        self.in_book = False
+        self.in_day_heap = False
+
+    def resting_on_limit(self) -> bool:
+        return self.order_type == 'limit' or (self.order_type == 'stop_limit' and self.triggered)
+
+
+class _SymbolBook:
+    """Heaps of (key, id, entry); 'down' stores -key. id breaks ties (time priority) so entries are never compared."""
+
+    __slots__ = ('up', 'down', 'dead', 'last_price')
+
+    def __init__(self):
+        self.up: List[tuple] = []
+        self.down: List[tuple] = []
+        self.dead = 0
+        self.last_price: Optional[float] = None
+
+    def __len__(self):
+        return len(self.up) + len(self.down) - self.dead
+
+    def push(self, e: _Entry):
+        if e.resting_on_limit():
+            key, rising = e.limit_price, e.side == 'sell'
+        else:
+            key, rising = e.stop_price, e.side == 'buy'
+        if rising:
+            heapq.heappush(self.up, (key, e.id, e))
+        else:
+            heapq.heappush(self.down, (-key, e.id, e))
+        e.in_book = True
+
+    def pop_crossed(self, price: float) -> Tuple[List[_Entry], List[_Entry]]:
+        """Remove the entries price crosses. Returns (to fill, stop-limits whose stop was just hit)."""
+        fills, triggered = [], []
+        moved = True
+        while moved:
+            moved = False
+            up, down = self.up, self.down
+            while up and (up[0][0] <= price or not up[0][2].active):
+                moved |= self._take(heapq.heappop(up)[2], fills, triggered)
+            while down and (-down[0][0] >= price or not down[0][2].active):
+                moved |= self._take(heapq.heappop(down)[2], fills, triggered)
+        return fills, triggered
+
+    def _take(self, e: _Entry, fills: List[_Entry], triggered: List[_Entry]) -> bool:
+        """Popped entry: skip if dead; a stop-limit whose stop is hit moves to its limit heap (True = check again)."""
+        if not e.active:
+            self.dead -= 1
+            return False
+        e.in_book = False
+        if e.order_type == 'stop_limit' and not e.triggered:
+            e.triggered = True
+            triggered.append(e)
+            self.push(e)
+            return True
+        fills.append(e)
+        return False
+
+    def compact(self):
+        if self.dead > _COMPACT_MIN_DEAD and self.dead * 2 > len(self.up) + len(self.down):
+            self.up = [item for item in self.up if item[2].active]
+            self.down = [item for item in self.down if item[2].active]
+            heapq.heapify(self.up)
+            heapq.heapify(self.down)
+            self.dead = 0
+
+
+_lock = threading.Lock()
+_books: Dict[str, _SymbolBook] = {}
+_entries: Dict[int, _Entry] = {}
+_day_heap: List[tuple] = []  # (session_date, id, entry) of DAY orders in a book
+_queue: "queue.Queue[tuple]" = queue.Queue()
+_worker: Optional[threading.Thread] = None
+_listening = False
+_stats = {'placed': 0, 'cancelled': 0, 'expired': 0, 'stops_triggered': 0, 'fills': 0, 'rejected': 0,
+          'evaluations': 0, 'compactions': 0}
+
+
+def _push_locked(e: _Entry):
+    book = _books.get(e.symbol)
+    if book is None:
+        book = _books[e.symbol] = _SymbolBook()
+    book.push(e)
+    if e.tif == 'DAY' and not e.in_day_heap:
+        heapq.heappush(_day_heap, (e.session_date, e.id, e))
+        e.in_day_heap = True
+
+
+def _deactivate_locked(e: _Entry):
+    e.active = False
+    _entries.pop(e.id, None)
+    if e.in_book:
+        book = _books[e.symbol]
+        book.dead += 1
+        before = book.dead
+        book.compact()
+        if book.dead < before:
+            _stats['compactions'] += 1
+        if not len(book):
+            del _books[e.symbol]  # 只剩死条目
+
+
+def _expire_locked(today: str) -> List[_Entry]:
+    """Deactivate resting DAY orders placed before today; in-flight ones are re-added when their remainder rests."""
+    expired = []
+    while _day_heap and _day_heap[0][0] < today:
+        e = heapq.heappop(_day_heap)[2]
+        e.in_day_heap = False
+        if e.active and e.in_book:
+            _deactivate_locked(e)
+            expired.append(e)
+    _stats['expired'] += len(expired)
+    return expired
+
+
+def _today(now_iso: str) -> str:
+    return now_iso[:10]
+
+
+def place(account_name: str, symbol: str, side: str, qty: int, order_type: str, limit_price: Optional[float] = None,
+          stop_price: Optional[float] = None, tif: str = 'GTC', source: str = 'web',
+          order_time: Optional[datetime] = None, clamp_sell: bool = False) -> Dict[str, Any]:
+    """Validate and rest an order; it is checked against the current quote right away. Returns the working order row."""
+    order_type = (order_type or '').lower()
+    tif = (tif or 'GTC').upper()
+    if order_type not in ORDER_TYPES:
+        raise OrderError(f'Invalid order type: {order_type}, need {"/".join(ORDER_TYPES)}')
+    if tif not in TIME_IN_FORCE:
+        raise OrderError(f'Invalid tif: {tif}, need GTC/DAY')
+    if side not in ('buy', 'sell') or qty <= 0:
+        raise OrderError('Invalid: side(buy/sell), qty')
+    if order_type in ('limit', 'stop_limit') and not (limit_price or 0) > 0:
+        raise OrderError(f'{order_type} order requires limit_price > 0')
+    if order_type in ('stop', 'stop_limit') and not (stop_price or 0) > 0:
+        raise OrderError(f'{order_type} order requires stop_price > 0')
+    if not database.get_account(account_name):
+        raise OrderError(f'Account not found: {account_name}')
+
+    session_date = _today(order_time.isoformat() if order_time else get_current_datetime_iso())
+    with execution.account_lock(account_name):
+        order_id = database.add_working_order(account_name, symbol, side, order_type, qty,
+                                              limit_price if order_type != 'stop' else None,
+                                              stop_price if order_type != 'limit' else None,
+                                              tif, session_date, source, clamp_sell, order_time)
+        row = database.get_working_order(order_id)
+        with _lock:
+            e = _Entry(row)
+            _entries[e.id] = e
+            _push_locked(e)
+            _stats['placed'] += 1
+    _logger.info("order book: placed id=%s account=%s symbol=%s side=%s type=%s qty=%s limit=%s stop=%s tif=%s",
+                 order_id, account_name, symbol, side, order_type, qty, limit_price, stop_price, tif)
+
+    # 立即检查是否已可成交: 行情经 quote listener 进入 on_quotes
+    if _listening:
+        get_quote(symbol)
+    return row
+
+
+def cancel(order_id: int) -> Optional[Dict[str, Any]]:
+    """Cancel a working order (the in-memory entry is dropped lazily). None if the order does not exist."""
+    row = database.get_working_order(order_id)
+    if not row:
+        return None
+    with execution.account_lock(row['account_name']):
+        row = database.get_working_order(order_id)
+        if row['status'] != 'working':
+            raise OrderError(f'Order {order_id} is {row["status"]}')
+        with _lock:
+            e = _entries.get(order_id)
+            if e is not None:
+                _deactivate_locked(e)
+            _stats['cancelled'] += 1
+        database.update_working_order(order_id, status='cancelled')
+    _logger.info("order book: cancelled id=%s account=%s", order_id, row['account_name'])
+    return database.get_working_order(order_id)
+
+
+def forget_account(account_name: str) -> int:
+    """Drop an account's orders from memory (its working_orders rows are deleted with the account). Returns count."""
+    with _lock:
+        entries = [e for e in _entries.values() if e.account == account_name]
+        for e in entries:
+            _deactivate_locked(e)
+    return len(entries)
+
+
+def on_quotes(prices: Dict[str, float], now_iso: Optional[str] = None) -> int:
+    """Evaluate books against {symbol: price}; crossed orders are queued for the fill worker. Returns number queued."""
+    if not _entries:
+        return 0
+    now_iso = now_iso or get_current_datetime_iso()
+    fills, triggered = [], []
+    with _lock:
+        expired = _expire_locked(_today(now_iso))
+        for symbol, price in prices.items():
+            book = _books.get(symbol)
+            if book is None:
+                continue
+            book.last_price = price
+            crossed, stops = book.pop_crossed(price)
+            fills.extend((e, price) for e in crossed)
+            triggered.extend(stops)
+        _stats['evaluations'] += 1
+        _stats['stops_triggered'] += len(triggered)
+    for e in expired:
+        database.update_working_order(e.id, status='expired')
+    for e in triggered:
+        database.update_working_order(e.id, triggered=True)
+    for e, price in fills:
+        _enqueue(e, price, now_iso)
+    return len(fills)
+
+
+def on_tick(now_iso: Optional[str] = None) -> Dict[str, Any]:
+    """Sim tick: expire DAY orders, evaluate books at the tick's quotes and wait until triggered fills are applied."""
+    now_iso = now_iso or get_current_datetime_iso()
+    with _lock:
+        before = (_stats['fills'], _stats['rejected'], _stats['expired'])
+    on_quotes({}, now_iso)
+    book_symbols = symbols()
+    if book_symbols:
+        # 已订阅时 quote listener 先处理; 再调用一次只是空检查 (已成交的条目已出堆)
+        quotes = get_quotes_batch(book_symbols)
+        on_quotes({s: float(q['price']) for s, q in quotes.items() if q.get('valid') and (q.get('price') or 0) > 0},
+                  now_iso)
+    drain()
+    with _lock:
+        return {'symbols': len(book_symbols), 'filled': _stats['fills'] - before[0],
+                'rejected': _stats['rejected'] - before[1], 'expired': _stats['expired'] - before[2],
+                'working': len(_entries)}
+
+
+def _enqueue(e: _Entry, price: float, now_iso: str):
+    global _worker
+    _queue.put((e, price, now_iso))
+    with _lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name='order-book', daemon=True)
+            _worker.start()
+
+
+def drain():
+    _queue.join()
+
+
+def _run():
+    while True:
+        e, price, now_iso = _queue.get()
+        try:
+            event = _fill(e, price, now_iso)
+            if event is not None:
+                execution.notify_fill(event)
+        except Exception:
+            _logger.exception("order book: fill failed for id=%s", e.id)
+        finally:
+            _queue.task_done()
+
+
+def _fill(e: _Entry, price: float, now_iso: str) -> Optional[Dict[str, Any]]:
+    """Apply one triggered order under its account lock; the remainder of a partial fill rests again."""
+    order_time = None
+    if is_sim_mode() and now_iso:
+        ctrl.set_time_iso(now_iso)  # worker thread has no request tick context
+        order_time = datetime.fromisoformat(now_iso.replace('Z', '+00:00'))
+    with execution.account_lock(e.account):
+        if not e.active:
+            return None
+        limit_price = e.limit_price if e.order_type != 'stop' else None
+        try:
+            result = execution.execute_working_fill(e.account, e.symbol, e.side, e.remaining, price, e.source,
+                                                    order_time, e.clamp_sell, limit_price, e.id)
+        except OrderError as err:
+            database.update_working_order(e.id, status='rejected', error=str(err))
+            with _lock:
+                e.active = False
+                _entries.pop(e.id, None)
+                _stats['rejected'] += 1
+            _logger.info("order book: id=%s rejected: %s", e.id, err)
+            return {'order': {'id': None, 'working_order_id': e.id, 'symbol': e.symbol, 'side': e.side,
+                              'requested_qty': e.remaining, 'requested_price': price, 'status': 'rejected',
+                              'error': str(err), 'source': e.source},
+                    'account': e.account}
+        with _lock:
+            _stats['fills'] += 1
+            e.remaining = result['order']['remaining_qty']
+            if e.remaining > 0:
+                _push_locked(e)
+            else:
+                e.active = False
+                _entries.pop(e.id, None)
+    result['order']['source'] = e.source
+    return result
+
+
+def start() -> int:
+    """Load working orders into the books and subscribe to core.utils quotes. Returns number of working orders."""
+    global _listening
+    rows = database.list_working_orders()
+    with _lock:
+        _books.clear()
+        _entries.clear()
+        _day_heap.clear()
+        for row in rows:
+            e = _Entry(row)
+            _entries[e.id] = e
+            _push_locked(e)
+    if not _listening:
+        add_quote_listener(on_quotes)
+        _listening = True
+    if rows:
+        _logger.info("order book: loaded %s working orders", len(rows))
+    return len(rows)
+
+
+def symbols() -> List[str]:
+    with _lock:
+        return [s for s, book in _books.items() if len(book)]
+
+
+def get_book_stats() -> Dict[str, Any]:
+    with _lock:
+        stats = dict(_stats)
+        stats['working'] = len(_entries)
+        stats['symbols'] = sum(1 for book in _books.values() if len(book))
+        stats['dead'] = sum(book.dead for book in _books.values())
+    stats['queued'] = _queue.qsize()
+    return stats
@@ -0,0 +1,169 @@
+"""
+PPT in-process quote cache: size-bounded LRU keyed by (symbol, interval, as_of bucket), TTL + stale-while-revalidate.
+
+Used for: core.utils.get_quote / get_quotes_batch, so account/positions/analytics pages and equity jobs that ask for
+the same symbols within seconds share one DMS fetch.
+
+Classes:
+    QuoteCache   Thread-safe LRU; lookup(), store(), schedule_refresh(), stats()
+
+Functions:
+    get_cache() -> QuoteCache        Process-wide cache (configured from env)
+    as_of_bucket(as_of_iso) -> str   Key part for as_of: 'live' in real mode, as_of floored to QUOTE_CACHE_SIM_BUCKET_SEC in sim
+    get_cache_stats() -> dict        Hit/miss/stale/refresh/eviction counters (for /api/health)
+
+Features:
+    - Real mode ('live' bucket): entry is fresh for QUOTE_CACHE_TTL_SEC, then served stale for up to QUOTE_CACHE_STALE_SEC
+      more while one background refresh per key runs; older entries are a miss (synchronous fetch)
+    - Sim mode: the price at a given as_of never changes, so bucketed entries never expire (LRU eviction only)
+    - Only valid quotes (valid=True, price > 0) are cached; errors always go back to DMS on the next call
+    - QUOTE_CACHE_MAX_SIZE bounds memory (LRU); QUOTE_CACHE_ENABLED=0 disables caching
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+_logger = logging.getLogger(__name__)
+
+LIVE_BUCKET = 'live'
+
+QUOTE_CACHE_ENABLED = os.getenv('QUOTE_CACHE_ENABLED', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+QUOTE_CACHE_TTL_SEC = float(os.getenv('QUOTE_CACHE_TTL_SEC', '5'))
+QUOTE_CACHE_STALE_SEC = float(os.getenv('QUOTE_CACHE_STALE_SEC', '60'))
+QUOTE_CACHE_MAX_SIZE = max(1, int(os.getenv('QUOTE_CACHE_MAX_SIZE', '4096')))
+QUOTE_CACHE_SIM_BUCKET_SEC = max(1, int(os.getenv('QUOTE_CACHE_SIM_BUCKET_SEC', '60')))
+
+# lookup() states
+FRESH, STALE, MISS = 'fresh', 'stale', 'miss'
+
+
+def as_of_bucket(as_of_iso: Optional[str]) -> str:
+    """Cache key part for as_of: real mode (None) -> 'live'; sim -> as_of floored to the bucket size (UTC ISO)."""
+    if not as_of_iso:
+        return LIVE_BUCKET
+    try:
+        dt = datetime.fromisoformat(as_of_iso.replace('Z', '+00:00'))
+    except ValueError:
+        return as_of_iso
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    ts = int(dt.timestamp()) // QUOTE_CACHE_SIM_BUCKET_SEC * QUOTE_CACHE_SIM_BUCKET_SEC
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+
+def is_cacheable(quote: dict) -> bool:
+    return bool(quote) and quote.get('valid', False) and (quote.get('price') or 0) > 0
+
+
+class QuoteCache:
+    """LRU of quote dicts; key = (symbol, interval, bucket). Values are (quote, stored_at monotonic)."""
+
+    def __init__(self, max_size: int = QUOTE_CACHE_MAX_SIZE, ttl: float = QUOTE_CACHE_TTL_SEC,
+                 stale: float = QUOTE_CACHE_STALE_SEC, enabled: bool = QUOTE_CACHE_ENABLED):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale = stale
+        self.enabled = enabled
+        self._data: "OrderedDict[Tuple[str, str, str], Tuple[dict, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing: set = set()
+        self._stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0,
+                       'refreshes': 0, 'refresh_errors': 0}
+
+    def lookup(self, symbol: str, interval: str, bucket: str) -> Tuple[Optional[dict], str]:
+        """Returns (quote copy or None, FRESH | STALE | MISS); counts the hit/miss."""
+        if not self.enabled:
+            return None, MISS
+        key = (symbol, interval, bucket)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None, MISS
+            quote, stored_at = entry
+            if bucket == LIVE_BUCKET:
+                age = time.monotonic() - stored_at
+                if age > self.ttl + self.stale:
+                    del self._data[key]
+                    self._stats['misses'] += 1
+                    return None, MISS
+                if age > self.ttl:
+                    self._data.move_to_end(key)
+                    self._stats['stale_hits'] += 1
+                    return dict(quote), STALE
+            self._data.move_to_end(key)
+            self._stats['hits'] += 1
+            return dict(quote), FRESH
+
+    def store(self, symbol: str, interval: str, bucket: str, quote: dict) -> bool:
+        """Cache a valid quote (invalid ones are ignored). Returns True if stored."""
+        if not self.enabled or not is_cacheable(quote):
+            return False
+        key = (symbol, interval, bucket)
+        with self._lock:
+            self._data[key] = (dict(quote), time.monotonic())
+            self._data.move_to_end(key)
+            self._stats['stores'] += 1
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self._stats['evictions'] += 1
+        return True
+
+    def schedule_refresh(self, symbols: Iterable[str], interval: str, bucket: str,
+                         fetch: Callable[[List[str]], Dict[str, dict]]) -> bool:
+        """
+        Refresh stale keys in a background thread (one in flight per key); fetch(symbols) -> {symbol: quote}.
+        Returns True if a refresh was started.
+        """
+        with self._lock:
+            todo = [s for s in symbols if (s, interval, bucket) not in self._refreshing]
+            self._refreshing.update((s, interval, bucket) for s in todo)
+        if not todo:
+            return False
+
+        def _run():
+            try:
+                quotes = fetch(todo)
+                for s in todo:
+                    self.store(s, interval, bucket, quotes.get(s))
+                with self._lock:
+                    self._stats['refreshes'] += 1
+            except Exception as e:
+                _logger.info("quote cache: refresh symbols=%s error=%s", todo, e)
+                with self._lock:
+                    self._stats['refresh_errors'] += 1
+            finally:
+                with self._lock:
+                    self._refreshing.difference_update((s, interval, bucket) for s in todo)
+
+        threading.Thread(target=_run, name='quote-cache-refresh', daemon=True).start()
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._data)
+            stats['refreshing'] = len(self._refreshing)
+        lookups = stats['hits'] + stats['stale_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits'] + stats['stale_hits']) / lookups, 4) if lookups else 0.0
+        stats.update(enabled=self.enabled, max_size=self.max_size, ttl_sec=self.ttl, stale_sec=self.stale)
+        return stats
+
+
+_cache = QuoteCache()
+
+
+def get_cache() -> QuoteCache:
+    return _cache
+
+
+def get_cache_stats() -> dict:
+    return _cache.stats()
@@ -0,0 +1,310 @@
+"""
+PPT offline replay: run a signal file through order execution, the order book and the equity update in-process.
+
+Used for: backtesting a strategy at CPU speed instead of one POST /api/webhook per signal and one
+POST /api/scheduler/tick per day (each fetching sim time from stime and quotes from DMS); parameter sweeps call
+run_replay() directly.
+
+Usage:
+    python -m core.replay SIGNALS [--db PATH] [--account NAME] [--capital N] [--preset NAME] [--seed N]
+                          [--no-analytics] [--json] [-v]
+
+Functions:
+    load_signals(path) -> List[Dict]     CSV (header row) or NDJSON (.ndjson / .jsonl / .json, one object per line)
+    run_replay(signals, db_path=None, account='replay', capital=DEFAULT_CAPITAL, config=None, seed=None,
+               analytics=True) -> Dict
+        Replay into a fresh database; returns counts, elapsed seconds, signals_per_sec and per-account cash / equity /
+        cost totals (plus core.analytics.get_full_analytics when analytics=True)
+
+Features:
+    - Signal fields as POST /api/webhook: symbol|ticker, side|action, qty|contracts|quantity, price, type
+      (market | limit | stop | stop_limit), limit_price, stop_price, tif, account; plus time (ISO 8601, naive = UTC).
+      Signals are replayed in time order (stable: same time keeps file order)
+    - Clock: SIMULATION_MODE on and the core.ctrl tick context set to each signal's time (no stime calls); order time
+      is the signal time
+    - Day close: when the date changes (and after the last signal) the day is closed at 23:59:59 UTC like
+      POST /api/scheduler/tick: order book tick, then core.equity.update_all_accounts_equity(); weekdays without
+      signals in between are closed too
+    - Prices: market signals fill at their price; without a price they are priced like the webhook (core.utils quote).
+      A market signal's price is first shown to the order book as a quote, so earlier resting orders fill first.
+      Valuation goes through core.utils quotes -> core.bar_cache (local bars; DMS only for uncovered ranges, optional),
+      falling back to the last fill price
+    - Database: a fresh SQLite file (temp dir unless db_path) via the DB_FILE switch; the server's database is untouched
+    - Latency simulation is off (fills happen at signal time); slippage / commission / partial fill come from the
+      active config or a YAML preset
+    - Seeded: with a seed (or SIMULATION_SEED) every account's fill stream is derived from (seed, account), each
+      order's seed is stored in orders.seed; the same file and seed give identical fills in any process
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from . import analytics as core_analytics
+from . import ctrl
+from . import db as database
+from . import execution
+from . import order_book
+from . import simulation
+from .equity import update_all_accounts_equity
+from .execution import OrderError
+from .utils import get_quote, normalize_symbol
+
+_logger = logging.getLogger(__name__)
+
+DAY_CLOSE_TIME = '23:59:59+00:00'
+MAX_ERRORS = 20
+
+_SIDES = {'long': 'buy', 'buy_to_open': 'buy', 'buy': 'buy',
+          'short': 'sell', 'sell_to_close': 'sell', 'sell': 'sell', 'close': 'sell'}
+
+
+def load_signals(path: str) -> List[Dict[str, Any]]:
+    """Read raw signal dicts from a CSV file (header row) or an NDJSON file (by extension)."""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if path.lower().endswith(('.ndjson', '.jsonl', '.json')):
+            return [json.loads(line) for line in f if line.strip()]
+        return [dict(row) for row in csv.DictReader(f)]
+
+
+def _normalize(raw: Dict[str, Any], account: str) -> Dict[str, Any]:
+    """Webhook field aliases -> one signal dict; raises ValueError on a bad signal."""
+    when = ctrl.parse_sim_time_iso(str(raw.get('time') or raw.get('timestamp') or ''))
+    if when is None:
+        raise ValueError(f"invalid time: {raw.get('time') or raw.get('timestamp')!r}")
+    symbol = normalize_symbol(str(raw.get('symbol') or raw.get('ticker') or '').strip())
+    if not symbol:
+        raise ValueError('symbol required')
+    side = _SIDES.get(str(raw.get('side') or raw.get('action') or '').strip().lower())
+    if side is None:
+        raise ValueError(f"Invalid side: {raw.get('side') or raw.get('action')}, need buy/sell")
+    order_type = str(raw.get('type') or raw.get('order_type') or 'market').strip().lower()
+    price = float(raw.get('price') or 0)
+    return {
+        'time': when,
+        'account': str(raw.get('account') or account),
+        'symbol': symbol,
+        'side': side,
+        'qty': int(float(raw.get('qty') or raw.get('contracts') or raw.get('quantity') or 100)),
+        'price': price,
+        'type': order_type,
+        'limit_price': float(raw.get('limit_price') or price or 0) or None,
+        'stop_price': float(raw.get('stop_price') or 0) or None,
+        'tif': str(raw.get('tif') or 'GTC'),
+    }
+
+
+def _submit(sig: Dict[str, Any], now_iso: str) -> str:
+    """Apply one signal at the current tick time; returns 'filled' | 'working'. Raises OrderError when rejected."""
+    if sig['type'] != 'market':
+        order_book.place(sig['account'], sig['symbol'], sig['side'], sig['qty'], sig['type'],
+                         limit_price=sig['limit_price'], stop_price=sig['stop_price'], tif=sig['tif'],
+                         source='replay', order_time=sig['time'], clamp_sell=True)
+        order_book.drain()
+        return 'working'
+    price = sig['price']
+    if price > 0:
+        order_book.on_quotes({sig['symbol']: price}, now_iso)
+    else:
+        # 与 webhook 相同: 无价格的市价单按行情定价 (quote listener 同时检查挂单)
+        quote = get_quote(sig['symbol'], allow_stale=False)
+        if not quote.get('valid', False) or (quote.get('price') or 0) <= 0:
+            raise OrderError(f'Market order requires quote; {quote.get("error", "no price")}')
+        price = float(quote['price'])
+    order_book.drain()
+    execution.execute_order(sig['account'], sig['symbol'], sig['side'], sig['qty'], price, source='replay',
+                            order_time=sig['time'], clamp_sell=True)
+    return 'filled'
+
+
+def _close_day(day: date):
+    """Same steps as POST /api/scheduler/tick at the end of day."""
+    now_iso = f"{day.isoformat()}T{DAY_CLOSE_TIME}"
+    ctrl.set_time_iso(now_iso)
+    order_book.on_tick(now_iso)
+    update_all_accounts_equity()
+
+
+def _account_report(name: str, analytics: bool) -> Dict[str, Any]:
+    account = database.get_account(name) or {}
+    history = database.get_equity_history(name)
+    cash = account.get('cash') or 0
+    if history and database.get_positions(name):
+        equity, pnl, pnl_pct = history[-1]['equity'], history[-1]['pnl'], history[-1]['pnl_pct']
+    else:
+        # 无持仓的日子不写净值 (core.equity 跳过), 平仓后净值即现金
+        capital = account.get('initial_capital') or 0
+        equity, pnl = cash, cash - capital
+        pnl_pct = pnl / capital * 100 if capital else 0
+    out = {
+        'cash': round(cash, 2),
+        'equity': round(equity, 2),
+        'pnl': round(pnl, 2),
+        'pnl_pct': round(pnl_pct, 2),
+        'days': len(history),
+        'costs': database.get_account_cost_stats(name),
+    }
+    if analytics:
+        out['analytics'] = core_analytics.get_full_analytics(name)
+    return out
+
+
+def run_replay(signals: Iterable[Dict[str, Any]], db_path: Optional[str] = None, account: str = 'replay',
+               capital: float = database.DEFAULT_CAPITAL, config: Optional[Dict[str, Any]] = None,
+               seed: Optional[int] = None, analytics: bool = True) -> Dict[str, Any]:
+    """
+    Replay raw signal dicts (see load_signals) into a fresh database at db_path (default: new temp dir).
+    account: default account for signals without one; every account is created with capital on the first signal date.
+    config: simulation config dict (e.g. simulation.preset_config(name)); default the active one. Latency is disabled.
+    Process-wide state (DB_FILE, SIMULATION_MODE, simulation config, tick time) is restored afterwards.
+    """
+    parsed, errors, invalid = [], [], 0
+    for i, raw in enumerate(signals):
+        try:
+            parsed.append(_normalize(raw, account))
+        except (TypeError, ValueError) as e:
+            invalid += 1
+            if len(errors) < MAX_ERRORS:
+                errors.append({'signal': i, 'error': str(e)})
+    parsed.sort(key=lambda s: s['time'])
+
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='ppt_replay_'), 'replay.db')
+    elif os.path.exists(db_path):
+        raise FileExistsError(f"{db_path} exists; replay writes to a fresh database")
+
+    prev_db, prev_sync, prev_sim = database.DB_FILE, database.DB_SYNCHRONOUS, os.environ.get('SIMULATION_MODE')
+    prev_config, prev_override = simulation.get_config(), simulation.config_overridden()
+    sim_config = dict(config or prev_config)
+    sim_config['latency'] = {**sim_config.get('latency', {}), 'enabled': False}
+
+    os.environ['SIMULATION_MODE'] = '1'
+    simulation.set_config(sim_config)
+    prev_seed = simulation.set_seed(seed) if seed is not None else simulation.get_seed()
+    database.close_all_connections()
+    database.DB_FILE = db_path
+    database.DB_SYNCHRONOUS = 'OFF'  # throwaway file: no fsync per commit
+    counts = {'filled': 0, 'working': 0, 'rejected': 0}
+    days = 0
+    try:
+        first_time = parsed[0]['time'] if parsed else datetime.now(timezone.utc)
+        ctrl.set_time_iso(first_time.isoformat())  # init_db / create_account stamp rows with sim time
+        database.init_db()
+        first_date = first_time.date()
+        names = list(dict.fromkeys(s['account'] for s in parsed))
+        for name in names:
+            database.create_account(name, capital, as_of_date=first_date)
+        order_book.start()
+        book_before = order_book.get_book_stats()
+
+        start = time.perf_counter()
+        day = None
+        for sig in parsed:
+            sig_day = sig['time'].date()
+            if day is not None and sig_day != day:
+                _close_day(day)
+                days += 1
+                gap = day + timedelta(days=1)
+                while gap < sig_day:
+                    if gap.weekday() < 5:
+                        _close_day(gap)
+                        days += 1
+                    gap += timedelta(days=1)
+            day = sig_day
+            now_iso = sig['time'].isoformat()
+            ctrl.set_time_iso(now_iso)
+            try:
+                counts[_submit(sig, now_iso)] += 1
+            except OrderError as e:
+                counts['rejected'] += 1
+                if len(errors) < MAX_ERRORS:
+                    errors.append({'time': now_iso, 'symbol': sig['symbol'], 'side': sig['side'], 'error': str(e)})
+        if day is not None:
+            _close_day(day)
+            days += 1
+        seconds = time.perf_counter() - start
+        book_after = order_book.get_book_stats()
+        book = {k: book_after[k] - book_before[k] for k in ('fills', 'rejected', 'expired', 'cancelled')}
+
+        report = {
+            'signals': len(parsed),
+            'invalid': invalid,
+            **counts,
+            'book': book,
+            'days': days,
+            'seconds': round(seconds, 3),
+            'signals_per_sec': round(len(parsed) / seconds, 1) if seconds > 0 else None,
+            'preset': sim_config.get('_preset'),
+            'seed': seed if seed is not None else prev_seed,
+            'db': db_path,
+            'accounts': {name: _account_report(name, analytics) for name in names},
+            'errors': errors,
+        }
+    finally:
+        ctrl.clear_tick_sim_time()
+        database.close_all_connections()
+        database.DB_FILE, database.DB_SYNCHRONOUS = prev_db, prev_sync
+        if prev_sim is None:
+            os.environ.pop('SIMULATION_MODE', None)
+        else:
+            os.environ['SIMULATION_MODE'] = prev_sim
+        simulation.set_config(prev_config, override=prev_override)
+        simulation.set_seed(prev_seed)
+    _logger.info("replay: %s signals in %.3fs (%s/s) db=%s", report['signals'], report['seconds'],
+                 report['signals_per_sec'], db_path)
+    return report
+
+
+def _print_report(report: Dict[str, Any]):
+    print(f"signals={report['signals']} invalid={report['invalid']} filled={report['filled']} "
+          f"working={report['working']} rejected={report['rejected']} days={report['days']} preset={report['preset']}")
+    print(f"resting orders: fills={report['book']['fills']} rejected={report['book']['rejected']} "
+          f"expired={report['book']['expired']}")
+    print(f"elapsed={report['seconds']}s  {report['signals_per_sec']} signals/s  db={report['db']}")
+    for name, acc in report['accounts'].items():
+        line = f"  {name}: equity={acc['equity']} cash={acc['cash']} pnl={acc['pnl']} ({acc['pnl_pct']}%)"
+        stats = acc.get('analytics')
+        if stats:
+            line += (f" sharpe={stats['sharpe'].get('sharpe_ratio')} max_dd={stats['drawdown'].get('max_drawdown')}%"
+                     f" trades={stats['trade_stats'].get('total_trades')}")
+        print(line)
+    for err in report['errors']:
+        print('  error:', err)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m core.replay', description='Replay a signal file offline.')
+    parser.add_argument('signals', help='CSV (header row) or NDJSON signal file')
+    parser.add_argument('--db', help='SQLite file to create (default: new temp dir)')
+    parser.add_argument('--account', default='replay', help='account for signals without one')
+    parser.add_argument('--capital', type=float, default=database.DEFAULT_CAPITAL)
+    parser.add_argument('--preset', help='config/simulation.yaml preset (default: active config)')
+    parser.add_argument('--seed', type=int, help='run seed of the account fill streams (default SIMULATION_SEED)')
+    parser.add_argument('--no-analytics', action='store_true', help='skip get_full_analytics per account')
+    parser.add_argument('--json', action='store_true', help='print the full report as JSON')
+    parser.add_argument('-v', '--verbose', action='store_true', help='INFO logging')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    try:
+        config = simulation.preset_config(args.preset) if args.preset else None
+    except KeyError as e:
+        parser.error(str(e.args[0]))
+    report = run_replay(load_signals(args.signals), db_path=args.db, account=args.account, capital=args.capital,
+                        config=config, seed=args.seed, analytics=not args.no_analytics)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2, default=str))
+    else:
+        _print_report(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""
+PPT webhook signal queue: durable ingestion queue behind POST /api/webhook (async mode).
+
+Used for: answering webhook senders (TradingView, zuilow) with 202 + signal id right after token / payload
+validation; execution, DB writes, equity and the Socket.IO emit run in background workers.
+Status: GET /api/webhook/<id>; queue metrics in /api/health ('webhook_queue').
+
+Functions:
+    set_handler(fn)         fn(payload, account_name, order_time) -> (result dict, http status); set by api.webhook
+    enqueue(account_name, payload, order_time=None) -> int
+        Commit the signal to webhook_signals (status 'queued') and hand it to its account's worker; returns the id
+    get_signal(signal_id) -> Optional[Dict]   Status row with payload / result decoded
+    start() -> int          Re-queue signals left 'queued' by a previous process (app startup); returns count
+    drain()                 Block until every queued signal is processed
+    get_queue_stats() -> Dict   Depth (total / busiest shard), in flight, done / rejected / failed, wait ms
+
+Features:
+    - Status: queued -> processing -> done (handler status < 400) | rejected (handler 4xx, e.g. insufficient cash)
+      | failed (exception, or interrupted by a restart); result holds the same body the synchronous webhook returns
+    - Per-account order: an account always maps to the same shard (crc32 % WEBHOOK_WORKERS, default 4); each shard
+      is one worker thread with a FIFO queue. Different accounts run in parallel (execution's account locks still
+      apply, so async and synchronous orders of one account never interleave inside a fill)
+    - Durable: the row is committed before the 202 is sent; 'queued' rows run again after a restart in id order.
+      A signal interrupted while 'processing' is marked failed and not re-run (its fill may already be committed)
+    - order_time is fixed at ingestion (X-Simulation-Time header or sim clock), so queueing delay does not move the
+      fill in sim time
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import ctrl
+from . import db as database
+from .utils import is_sim_mode
+
+_logger = logging.getLogger(__name__)
+
+WEBHOOK_WORKERS = max(1, int(os.getenv('WEBHOOK_WORKERS', '4') or 4))
+
+_handler: Optional[Callable[[Any, str, Optional[datetime]], Tuple[Dict[str, Any], int]]] = None
+_shards: List[queue.Queue] = [queue.Queue() for _ in range(WEBHOOK_WORKERS)]
+_workers: List[Optional[threading.Thread]] = [None] * WEBHOOK_WORKERS
+_lock = threading.Lock()
+_stats = {'enqueued': 0, 'done': 0, 'rejected': 0, 'failed': 0, 'recovered': 0, 'wait_ms_max': 0.0,
+          'wait_ms_last': 0.0}
+
+
+def set_handler(fn: Callable[[Any, str, Optional[datetime]], Tuple[Dict[str, Any], int]]):
+    """Register the signal processor: fn(payload, account_name, order_time) -> (response body, http status)."""
+    global _handler
+    _handler = fn
+
+
+def _shard(account_name: str) -> int:
+    return zlib.crc32(account_name.encode('utf-8')) % WEBHOOK_WORKERS
+
+
+def _put(signal_id: int, account_name: str):
+    i = _shard(account_name)
+    _shards[i].put((signal_id, time.monotonic()))
+    with _lock:
+        if _workers[i] is None or not _workers[i].is_alive():
+            _workers[i] = threading.Thread(target=_run, args=(_shards[i],), name=f'webhook-worker-{i}', daemon=True)
+            _workers[i].start()
+
+
+def enqueue(account_name: str, payload: Any, order_time: Optional[datetime] = None) -> int:
+    """Store a validated signal and queue it; returns the signal id (status 'queued')."""
+    signal_id = database.add_webhook_signal(account_name, json.dumps(payload, ensure_ascii=False),
+                                            order_time.isoformat() if order_time else None)
+    with _lock:
+        _stats['enqueued'] += 1
+    _put(signal_id, account_name)
+    _logger.info("webhook queue: queued id=%s account=%s shard=%s", signal_id, account_name, _shard(account_name))
+    return signal_id
+
+
+def _run(q: queue.Queue):
+    while True:
+        signal_id, queued_at = q.get()
+        try:
+            _process(signal_id, (time.monotonic() - queued_at) * 1000)
+        except Exception:
+            _logger.exception("webhook queue: id=%s failed", signal_id)
+        finally:
+            q.task_done()
+
+
+def _process(signal_id: int, wait_ms: float):
+    row = database.get_webhook_signal(signal_id)
+    if row is None or row['status'] != 'queued':
+        return
+    database.update_webhook_signal(signal_id, 'processing')
+    order_time = None
+    if row['order_time']:
+        order_time = datetime.fromisoformat(row['order_time'])
+        if is_sim_mode():
+            ctrl.set_time_iso(row['order_time'])  # worker thread has no request tick context
+    try:
+        if _handler is None:
+            raise RuntimeError('no webhook handler registered')
+        body, http_status = _handler(json.loads(row['payload']), row['account_name'], order_time)
+    except Exception as e:
+        _logger.exception("webhook queue: id=%s handler error", signal_id)
+        database.update_webhook_signal(signal_id, 'failed', http_status=500, error=f'{type(e).__name__}: {e}')
+        status = 'failed'
+    else:
+        status = 'done' if http_status < 400 else 'rejected'
+        database.update_webhook_signal(signal_id, status, http_status=http_status,
+                                       result=json.dumps(body, ensure_ascii=False, default=str),
+                                       error=body.get('error') if status == 'rejected' else None)
+    with _lock:
+        _stats[status] += 1
+        _stats['wait_ms_last'] = wait_ms
+        _stats['wait_ms_max'] = max(_stats['wait_ms_max'], wait_ms)
+
+
+def get_signal(signal_id: int) -> Optional[Dict[str, Any]]:
+    """Signal status row; payload / result decoded from JSON."""
+    row = database.get_webhook_signal(signal_id)
+    if row is None:
+        return None
+    row['payload'] = json.loads(row['payload'])
+    row['result'] = json.loads(row['result']) if row['result'] else None
+    return row
+
+
+def start() -> int:
+    """Re-queue 'queued' signals of a previous process; interrupted 'processing' ones are marked failed."""
+    for row in database.list_webhook_signals(['processing']):
+        database.update_webhook_signal(row['id'], 'failed', http_status=500,
+                                       error='interrupted by restart while processing; not re-run')
+    queued = database.list_webhook_signals(['queued'])
+    for row in queued:
+        _put(row['id'], row['account_name'])
+    if queued:
+        with _lock:
+            _stats['recovered'] += len(queued)
+        _logger.info("webhook queue: recovered %s queued signals", len(queued))
+    return len(queued)
+
+
+def drain():
+    for q in _shards:
+        q.join()
+
+
+def get_queue_stats() -> Dict[str, Any]:
+    depths = [q.qsize() for q in _shards]
+    with _lock:
+        stats = dict(_stats)
+    # unfinished_tasks 包含正在处理的那一条
+    in_flight = sum(q.unfinished_tasks for q in _shards) - sum(depths)
+    stats.update({
+        'workers': WEBHOOK_WORKERS,
+        'depth': sum(depths),
+        'depth_max_shard': max(depths),
+        'in_flight': max(0, in_flight),
+        'wait_ms_max': round(stats['wait_ms_max'], 3),
+        'wait_ms_last': round(stats['wait_ms_last'], 3),
+    })
+    return stats
@@ -3,19 +3,57 @@ PPT simulation: slippage, commission, partial fill, latency; config from config/
 
 Used for: order execution in webhook and trade API; apply slippage/commission to price/qty, optional partial fill.
 
+Classes:
+    SimulationModel (SlippageModel, CommissionModel, PartialFillModel, LatencyModel)   Compiled, immutable config
+
 Functions:
-    load_config() -> Dict                    Load from config/simulation.yaml; merge presets
+    load_config() -> Dict                    Load from config/simulation.yaml; merge presets; compile the model
+    get_config() -> Dict                     Source dict of the active model (read-only; use set_config to change)
+    set_config(config, override=True) -> SimulationModel
+        Compile and install a config dict (tests, benchmarks, replay / sweeps); pauses hot reload until load_config()
+    config_overridden() -> bool              True while a set_config override is installed
+    start_watcher()                          Start the config file watcher (app startup only)
+    preset_config(name) -> Dict              Config dict of a YAML preset (not installed); KeyError if unknown
+    get_model() -> SimulationModel           Active compiled model (replaced when the YAML file's mtime changes)
+    compile_config(config) -> SimulationModel
     get_simulation_status() -> Dict          Current config and presets for API
     apply_slippage(price, side, ...) -> float   Apply slippage to price
     apply_commission(qty, price, ...) -> float   Apply commission
-    execute_order(account, symbol, side, qty, price=None, ...) -> Dict   Simulate fill; update position/order/trade/equity
+    simulate_execution(symbol, side, qty, price, rng=None, latency=True) -> Dict   Simulated fill (qty, exec price, commission, total cost)
+    sample_latency(rng=None) -> float        Draw one latency (seconds) without sleeping; 0 when disabled
+    derive_seed(*parts) -> int               Stable 63-bit seed from parts (blake2b), same on every process / platform
+    set_seed(seed) / get_seed()              Run seed of the account streams (SIMULATION_SEED env; None = random)
+    account_seed(account_name) -> int        Base seed of an account's stream: derive_seed(run seed, account)
+    order_rng(order_seed, stream='fill') -> random.Random   Generator of one order ('latency': separate stream)
+    simulate_execution_batch(symbols, sides, qtys, prices, rng=None, seeds=None, latency=True) -> Dict[str, ndarray]
+        Vectorized fills (NumPy, one pass); same values as calling simulate_execution per order with the shared rng,
+        or with order_rng(seed) of each order (seeds: the fills core.execution makes, e.g. execute_basket)
+    batch_to_records(batch) -> list          Batch arrays -> list of simulate_execution-style dicts
 
 Features:
-    - Config: slippage, commission, partial_fill, latency; presets in YAML; execute_order updates db (position, order, trade, equity)
+    - Config: slippage, commission, partial_fill, latency; presets in YAML; fills are applied to db by core.execution
+    - File: SIMULATION_CONFIG env, default <repo>/config/simulation.yaml
+    - load_config compiles the chosen preset once into frozen model objects (defaults resolved, tiered commission as
+      cumulative tables -> bisect); per-order functions read attributes instead of walking dicts
+    - Hot reload: a daemon thread checks the file's mtime every SIMULATION_CONFIG_CHECK_SEC (default 1s, <= 0 off);
+      a changed file is recompiled and swapped in as one object, a broken file keeps the previous model. Only the app
+      starts the watcher (replay / sweep / bench processes never reload behind their config), and it skips reloads
+      while a set_config override is installed; an explicit load_config() (POST /api/simulation/reload) ends the
+      override and reads the file
+    - Random draws (random slippage, partial fill, latency) take an rng; core.execution passes a per-order generator
+      seeded from the account's stream (seed n of account A = derive_seed(account seed, n), stored on the order), so
+      fills do not depend on other accounts, threads or processes and any order can be re-drawn from its seed.
+      Without rng the global random module is used (benchmarks)
 """
+import bisect
+import hashlib
 import os
 import random
+import threading
 import time
+from dataclasses import dataclass
+
+import numpy as np
 from pathlib import Path
 from typing import Dict, Any, Tuple, Optional
 
@@ -46,19 +84,154 @@ DEFAULT_CONFIG = {
     }
 }
 
-# 全局配置
+SIMULATION_CONFIG_CHECK_SEC = float(os.getenv('SIMULATION_CONFIG_CHECK_SEC', '1'))
+SIMULATION_SEED = os.getenv('SIMULATION_SEED', '').strip()
+
+_seed: Optional[int] = int(SIMULATION_SEED) if SIMULATION_SEED else None
+
+
+def _config_path() -> Path:
+    return Path(os.getenv('SIMULATION_CONFIG') or Path(__file__).resolve().parent.parent / "config" / "simulation.yaml")
+
+
+# ============================================================
+# 编译后的模型 (不可变)
+# ============================================================
+
+@dataclass(frozen=True)
+class SlippageModel:
+    enabled: bool
+    mode: str
+    value: float
+
+
+@dataclass(frozen=True)
+class CommissionModel:
+    enabled: bool
+    mode: str
+    rate: float
+    minimum: float
+    per_trade: float
+    # tiered: 第 k 档覆盖 (tier_lows[k], tier_bounds[k]]，tier_bases[k] = 前面各档的累计手续费
+    tier_bounds: Tuple[float, ...] = ()
+    tier_lows: Tuple[float, ...] = ()
+    tier_bases: Tuple[float, ...] = ()
+    tier_rates: Tuple[float, ...] = ()
+
+    def tiered(self, order_value: float) -> float:
+        """阶梯手续费: bisect 定位所在档, 累计值 + 档内金额 × 费率"""
+        if order_value <= 0 or not self.tier_bounds:
+            return 0.0
+        k = bisect.bisect_left(self.tier_bounds, order_value)
+        if k == len(self.tier_bounds):
+            k -= 1
+            return self.tier_bases[k] + (self.tier_bounds[k] - self.tier_lows[k]) * self.tier_rates[k]
+        return self.tier_bases[k] + (order_value - self.tier_lows[k]) * self.tier_rates[k]
+
+
+@dataclass(frozen=True)
+class PartialFillModel:
+    enabled: bool
+    threshold: float
+    min_rate: float
+    max_rate: float
+
+
+@dataclass(frozen=True)
+class LatencyModel:
+    enabled: bool
+    min_ms: float
+    max_ms: float
+
+
+@dataclass(frozen=True)
+class SimulationModel:
+    slippage: SlippageModel
+    commission: CommissionModel
+    partial_fill: PartialFillModel
+    latency: LatencyModel
+    preset: Optional[str]
+
+
+def _compile_tiers(tiers) -> Dict[str, Tuple[float, ...]]:
+    """Tier list -> cumulative tables; tiers that do not raise the upper bound are never charged and are dropped."""
+    bounds, lows, bases, rates = [], [], [], []
+    prev_max, base = 0.0, 0.0
+    for tier in tiers or []:
+        tier_max = tier.get('max_value') or float('inf')
+        if tier_max <= prev_max:
+            continue
+        rate = tier.get('rate', 0.001)
+        bounds.append(tier_max)
+        lows.append(prev_max)
+        bases.append(base)
+        rates.append(rate)
+        base += (tier_max - prev_max) * rate
+        prev_max = tier_max
+    return {'tier_bounds': tuple(bounds), 'tier_lows': tuple(lows), 'tier_bases': tuple(bases),
+            'tier_rates': tuple(rates)}
+
+
+def compile_config(config: Dict[str, Any]) -> SimulationModel:
+    """Resolve defaults once and build the immutable model used per order."""
+    slip = config.get('slippage', {}) or {}
+    comm = config.get('commission', {}) or {}
+    pf = config.get('partial_fill', {}) or {}
+    lat = config.get('latency', {}) or {}
+    return SimulationModel(
+        slippage=SlippageModel(
+            enabled=bool(slip.get('enabled', False)),
+            mode=slip.get('mode', 'percentage'),
+            value=slip.get('value', 0.05),
+        ),
+        commission=CommissionModel(
+            enabled=bool(comm.get('enabled', False)),
+            mode=comm.get('mode', 'percentage'),
+            rate=comm.get('rate', 0.001),
+            minimum=comm.get('minimum', 1.0),
+            per_trade=comm.get('per_trade', 5.0),
+            **_compile_tiers(comm.get('tiers', [])),
+        ),
+        partial_fill=PartialFillModel(
+            enabled=bool(pf.get('enabled', False)),
+            threshold=pf.get('threshold', 10000),
+            min_rate=pf.get('min_fill_rate', 0.3),
+            max_rate=pf.get('max_fill_rate', 1.0),
+        ),
+        latency=LatencyModel(
+            enabled=bool(lat.get('enabled', False)),
+            min_ms=lat.get('min_ms', 50),
+            max_ms=lat.get('max_ms', 200),
+        ),
+        preset=config.get('_preset'),
+    )
+
+
+# 全局配置 (源 dict) 与编译后的模型; 两者一起替换
 _config: Dict[str, Any] = {}
+_model: Optional[SimulationModel] = None
+_loaded_mtime: Optional[int] = None  # mtime of the last file version read (a broken one too: not retried until it changes)
+_watcher: Optional[threading.Thread] = None
+_watch_lock = threading.Lock()
+_override = False  # set_config 安装的配置生效中: 文件监视不覆盖
+
+
+def _install(config: Dict[str, Any], override: bool = False) -> Dict[str, Any]:
+    global _config, _model, _override
+    model = compile_config(config)
+    _config, _model, _override = config, model, override
+    return config
 
 
 def load_config() -> Dict[str, Any]:
-    """Load simulation config from config/simulation.yaml; merge presets."""
-    global _config
-    
-    config_path = Path(__file__).parent / "config" / "simulation.yaml"
+    """Load simulation config from config/simulation.yaml; merge presets; compile and install the model."""
+    global _loaded_mtime
+    config_path = _config_path()
     
     if config_path.exists():
         try:
             import yaml
+            _loaded_mtime = config_path.stat().st_mtime_ns
             with open(config_path, 'r', encoding='utf-8') as f:
                 data = yaml.safe_load(f)
                 simulation = data.get('simulation', {})
@@ -69,7 +242,7 @@ def load_config() -> Dict[str, Any]:
                 if use_preset and use_preset in presets:
                     # 使用预设配置
                     preset = presets[use_preset]
-                    _config = {
+                    config = {
                         'slippage': preset.get('slippage', DEFAULT_CONFIG['slippage']),
                         'commission': preset.get('commission', DEFAULT_CONFIG['commission']),
                         'partial_fill': preset.get('partial_fill', DEFAULT_CONFIG['partial_fill']),
@@ -79,7 +252,7 @@ def load_config() -> Dict[str, Any]:
                     print(f"[Simulation] 使用预设: {use_preset}")
                 else:
                     # 使用自定义配置
-                    _config = {
+                    config = {
                         'slippage': simulation.get('slippage', DEFAULT_CONFIG['slippage']),
                         'commission': simulation.get('commission', DEFAULT_CONFIG['commission']),
                         'partial_fill': simulation.get('partial_fill', DEFAULT_CONFIG['partial_fill']),
@@ -89,40 +262,140 @@ def load_config() -> Dict[str, Any]:
                     if use_preset:
                         print(f"[Simulation] 预设 '{use_preset}' 不存在，使用自定义配置")
                 
-                return _config
+                return _install(config)
         except Exception as e:
+            if _model is not None:
+                print(f"[Simulation] 加载配置失败: {e}, 保留当前配置")
+                return _config
             print(f"[Simulation] 加载配置失败: {e}, 使用默认配置")
     
-    _config = DEFAULT_CONFIG.copy()
-    return _config
+    return _install(DEFAULT_CONFIG.copy())
 
 
-def get_config() -> Dict[str, Any]:
-    """获取当前配置"""
-    if not _config:
+def _check_reload():
+    """Recompile when the config file's mtime changed since the installed model was loaded (not while overridden)."""
+    if _override:
+        return  # mtime 不更新: 覆盖解除 (load_config) 时读取最新文件
+    try:
+        mtime = _config_path().stat().st_mtime_ns
+    except OSError:
+        return
+    if _loaded_mtime is not None and mtime != _loaded_mtime:
+        print("[Simulation] 配置文件已修改, 重新加载")
         load_config()
+
+
+def _watch_loop():
+    while True:
+        time.sleep(SIMULATION_CONFIG_CHECK_SEC)
+        try:
+            _check_reload()
+        except Exception as e:
+            print(f"[Simulation] 配置检查失败: {e}")
+
+
+def start_watcher():
+    """后台线程按 mtime 监视配置文件 (仅 app 启动时调用; SIMULATION_CONFIG_CHECK_SEC <= 0 关闭)"""
+    global _watcher
+    if SIMULATION_CONFIG_CHECK_SEC <= 0:
+        return
+    with _watch_lock:
+        if _watcher is None:
+            _watcher = threading.Thread(target=_watch_loop, name='simulation-config-watch', daemon=True)
+            _watcher.start()
+
+
+def get_model() -> SimulationModel:
+    """当前编译后的模型 (配置文件修改后由后台线程重新加载并整体替换)"""
+    if _model is None:
+        load_config()
+    return _model
+
+
+def get_config() -> Dict[str, Any]:
+    """获取当前配置 (源 dict, 只读; 修改请用 set_config)"""
+    get_model()
     return _config
 
 
-def apply_slippage(price: float, side: str) -> Tuple[float, float]:
+def set_config(config: Dict[str, Any], override: bool = True) -> SimulationModel:
+    """
+    用 dict 替换当前配置并编译 (测试 / 基准 / 回放 / 参数扫描)。override=True 时文件监视暂停重新加载,
+    直到 load_config(); override=False 用于恢复之前由文件加载的配置 (监视照常)
+    """
+    _install(config, override)
+    return _model
+
+
+def config_overridden() -> bool:
+    return _override
+
+
+def preset_config(name: str) -> Dict[str, Any]:
+    """配置文件中预设 name 的配置 dict (不安装; 用于 set_config / 回放 / 参数扫描); 预设不存在时 KeyError"""
+    import yaml
+    with open(_config_path(), 'r', encoding='utf-8') as f:
+        presets = (yaml.safe_load(f) or {}).get('presets', {})
+    if name not in presets:
+        raise KeyError(f"unknown preset {name!r} (have: {', '.join(presets)})")
+    preset = presets[name]
+    config = {k: preset.get(k, DEFAULT_CONFIG[k]) for k in ('slippage', 'commission', 'partial_fill', 'latency')}
+    config['_preset'] = name
+    return config
+
+
+# ============================================================
+# 随机数流 (按账户 / 运行播种, 可复现)
+# ============================================================
+
+def derive_seed(*parts) -> int:
+    """由 parts 导出稳定的 63 位种子 (blake2b; 不受 PYTHONHASHSEED / 进程 / 平台影响, 可存入 SQLite INTEGER)"""
+    digest = hashlib.blake2b(':'.join(str(p) for p in parts).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') & (2 ** 63 - 1)
+
+
+def set_seed(seed: Optional[int]) -> Optional[int]:
+    """设置运行种子 (之后新建的账户流由它导出; None = 随机); 返回之前的值"""
+    global _seed
+    previous, _seed = _seed, seed
+    return previous
+
+
+def get_seed() -> Optional[int]:
+    return _seed
+
+
+def account_seed(account_name: str) -> int:
+    """账户流的基础种子: 设置了运行种子时为 derive_seed(运行种子, 账户), 否则随机 (仍会保存, 事后可复现)"""
+    if _seed is None:
+        return random.SystemRandom().getrandbits(63)
+    return derive_seed(_seed, account_name)
+
+
+def order_rng(order_seed: int, stream: str = 'fill') -> random.Random:
+    """一笔订单的随机数发生器; stream='latency' 为独立的延迟流 (受理时抽取, 不影响成交的抽取)"""
+    return random.Random(order_seed if stream == 'fill' else derive_seed(order_seed, stream))
+
+
+def apply_slippage(price: float, side: str, rng=None) -> Tuple[float, float]:
     """
     应用滑点
     
     Args:
         price: 基准价格
         side: 'buy' 或 'sell'
+        rng: random.Random (默认全局 random)
     
     Returns:
         (执行价格, 滑点金额)
     """
-    config = get_config()
-    slip_config = config.get('slippage', {})
+    slip = (_model or get_model()).slippage
     
-    if not slip_config.get('enabled', False):
+    if not slip.enabled:
         return price, 0.0
     
-    mode = slip_config.get('mode', 'percentage')
-    value = slip_config.get('value', 0.05)
+    mode = slip.mode
+    value = slip.value
     
     if mode == 'percentage':
         # 百分比滑点
@@ -132,7 +405,7 @@ def apply_slippage(price: float, side: str) -> Tuple[float, float]:
         slip_amount = value
     elif mode == 'random':
         # 随机滑点 (0 ~ value%)
-        slip_amount = price * value / 100 * random.random()
+        slip_amount = price * value / 100 * (rng or random).random()
     else:
         slip_amount = 0.0
     
@@ -157,100 +430,88 @@ def calc_commission(qty: int, price: float, order_value: float) -> float:
     Returns:
         手续费金额
     """
-    config = get_config()
-    comm_config = config.get('commission', {})
+    comm = (_model or get_model()).commission
     
-    if not comm_config.get('enabled', False):
+    if not comm.enabled:
         return 0.0
     
-    mode = comm_config.get('mode', 'percentage')
+    mode = comm.mode
     
     if mode == 'percentage':
-        rate = comm_config.get('rate', 0.001)
-        minimum = comm_config.get('minimum', 1.0)
-        commission = max(minimum, order_value * rate)
+        commission = max(comm.minimum, order_value * comm.rate)
     
     elif mode == 'fixed':
-        commission = comm_config.get('per_trade', 5.0)
+        commission = comm.per_trade
     
     elif mode == 'tiered':
-        # 阶梯费率
-        tiers = comm_config.get('tiers', [])
-        commission = 0.0
-        remaining = order_value
-        prev_max = 0
-        
-        for tier in tiers:
-            tier_max = tier.get('max_value') or float('inf')
-            tier_rate = tier.get('rate', 0.001)
-            tier_amount = min(remaining, tier_max - prev_max)
-            
-            if tier_amount > 0:
-                commission += tier_amount * tier_rate
-                remaining -= tier_amount
-                prev_max = tier_max
-            
-            if remaining <= 0:
-                break
+        # 阶梯费率 (编译后的累计表, bisect 查档)
+        commission = comm.tiered(order_value)
     else:
         commission = 0.0
     
     return round(commission, 2)
 
 
-def calc_partial_fill(order_value: float, qty: int) -> Tuple[int, float]:
+def calc_partial_fill(order_value: float, qty: int, rng=None) -> Tuple[int, float]:
     """
     计算部分成交
     
     Args:
         order_value: 订单金额
         qty: 订单数量
+        rng: random.Random (默认全局 random)
     
     Returns:
         (成交数量, 成交比例)
     """
-    config = get_config()
-    pf_config = config.get('partial_fill', {})
+    pf = (_model or get_model()).partial_fill
     
-    if not pf_config.get('enabled', False):
+    if not pf.enabled:
         return qty, 1.0
     
-    threshold = pf_config.get('threshold', 10000)
-    
     # 小于阈值的订单全部成交
-    if order_value < threshold:
+    if order_value < pf.threshold:
         return qty, 1.0
     
-    min_rate = pf_config.get('min_fill_rate', 0.3)
-    max_rate = pf_config.get('max_fill_rate', 1.0)
+    min_rate = pf.min_rate
+    max_rate = pf.max_rate
     
     # 随机成交比例
-    fill_rate = random.uniform(min_rate, max_rate)
+    fill_rate = (rng or random).uniform(min_rate, max_rate)
     filled_qty = max(1, int(qty * fill_rate))
     
     return filled_qty, round(fill_rate, 2)
 
 
-def apply_latency():
-    """应用延迟模拟"""
-    config = get_config()
-    lat_config = config.get('latency', {})
-    
-    if not lat_config.get('enabled', False):
-        return
+def latency_enabled() -> bool:
+    """延迟模拟是否开启"""
+    return (_model or get_model()).latency.enabled
+
+
+def sample_latency(rng=None) -> float:
+    """抽取一次延迟 (秒), 不 sleep; 未开启时为 0 (不消耗随机数)"""
+    lat = (_model or get_model()).latency
     
-    min_ms = lat_config.get('min_ms', 50)
-    max_ms = lat_config.get('max_ms', 200)
+    if not lat.enabled:
+        return 0.0
     
-    delay = random.uniform(min_ms, max_ms) / 1000
-    time.sleep(delay)
+    return (rng or random).uniform(lat.min_ms, lat.max_ms) / 1000
+
+
+def apply_latency(rng=None):
+    """应用延迟模拟 (阻塞 sleep; core.execution 默认改为延迟成交队列, 见 ORDER_LATENCY_MODE)"""
+    delay = sample_latency(rng)
+    if delay > 0:
+        time.sleep(delay)
 
 
 def simulate_execution(
     symbol: str,
     side: str,
     qty: int,
-    price: float
+    price: float,
+    rng=None,
+    latency: bool = True
 ) -> Dict[str, Any]:
     """
     模拟订单执行
@@ -260,20 +521,23 @@ def simulate_execution(
         side: 买卖方向
         qty: 数量
         price: 价格
+        rng: random.Random (默认全局 random); 随机数顺序: 延迟, 部分成交, 随机滑点
+        latency: False = 不模拟延迟 (延迟已在受理时用 sample_latency 抽取, 由成交队列处理)
     
     Returns:
         执行结果字典
     """
     # 应用延迟
-    apply_latency()
+    if latency:
+        apply_latency(rng)
     
     order_value = qty * price
     
     # 部分成交
-    filled_qty, fill_rate = calc_partial_fill(order_value, qty)
+    filled_qty, fill_rate = calc_partial_fill(order_value, qty, rng)
     
     # 滑点
-    exec_price, slippage = apply_slippage(price, side)
+    exec_price, slippage = apply_slippage(price, side, rng)
     
     # 实际成交金额
     filled_value = filled_qty * exec_price
@@ -303,12 +567,189 @@ def simulate_execution(
     }
 
 
+# ============================================================
+# 批量成交 (NumPy)
+# ============================================================
+
+def _round_like_python(values: np.ndarray, ndigits: int) -> np.ndarray:
+    """
+    np.round, with elements whose scaled value sits next to .5 re-rounded by Python round(),
+    so results equal round(float(x), ndigits) element by element.
+    """
+    out = np.round(values, ndigits)
+    scaled = values * (10.0 ** ndigits)
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) <= np.maximum(1e-6, np.abs(scaled) * 1e-12)
+    for i in np.flatnonzero(near_half):
+        out[i] = round(float(values[i]), ndigits)
+    return out
+
+
+def _batch_commission(filled_value: np.ndarray, comm: CommissionModel) -> np.ndarray:
+    """Vectorized calc_commission (same operation order, so same floats)."""
+    if not comm.enabled:
+        return np.zeros_like(filled_value)
+    mode = comm.mode
+    if mode == 'percentage':
+        commission = np.maximum(comm.minimum, filled_value * comm.rate)
+    elif mode == 'fixed':
+        commission = np.full_like(filled_value, comm.per_trade)
+    elif mode == 'tiered' and comm.tier_bounds:
+        # CommissionModel.tiered 的向量化版本: searchsorted(side='left') == bisect_left
+        bounds = np.asarray(comm.tier_bounds)
+        lows, bases, rates = np.asarray(comm.tier_lows), np.asarray(comm.tier_bases), np.asarray(comm.tier_rates)
+        k = np.searchsorted(bounds, filled_value, side='left')
+        capped = k == len(bounds)
+        k = np.minimum(k, len(bounds) - 1)
+        value = np.where(capped, bounds[k], filled_value)
+        commission = np.where(filled_value > 0, bases[k] + (value - lows[k]) * rates[k], 0.0)
+    else:
+        commission = np.zeros_like(filled_value)
+    return _round_like_python(commission.astype(float), 2)
+
+
+def simulate_execution_batch(symbols, sides, qtys, prices, rng=None, config=None, seeds=None,
+                             latency: bool = True) -> Dict[str, np.ndarray]:
+    """
+    批量模拟成交: simulate_execution 的向量化版本 (不 sleep; 延迟作为 latency_ms 返回, 由调用方决定是否等待)
+
+    Args:
+        symbols / sides / qtys / prices: 等长序列
+        rng: random.Random (默认全局 random); 与逐笔调用 simulate_execution(..., rng) 消耗相同的随机数,
+             结束后 rng 状态与逐笔调用后一致
+        config: SimulationModel 或配置 dict (编译一次); 默认 get_model()
+        seeds: 每笔订单的种子 (等长序列); 给出时第 i 笔用 order_rng(seeds[i]) 抽取 (忽略 rng),
+               与 core.execution 逐笔成交 (simulate_execution(..., rng=order_rng(seed))) 结果相同
+        latency: False = 不抽取延迟 (同 simulate_execution(latency=False)), latency_ms 全为 0
+
+    Returns:
+        数组字典, 键同 simulate_execution (symbol, side, requested_qty, filled_qty, fill_rate, requested_price,
+        exec_price, slippage, filled_value, commission, total_cost, partial_fill) + latency_ms
+    """
+    if config is None:
+        model = get_model()
+    elif isinstance(config, SimulationModel):
+        model = config
+    else:
+        model = compile_config(config)
+    rng = rng or random
+    symbols = np.asarray(symbols, dtype=object)
+    sides = np.asarray(sides, dtype=object)
+    qtys = np.asarray(qtys, dtype=np.int64)
+    prices = np.asarray(prices, dtype=float)
+    n = len(qtys)
+    is_buy = sides == 'buy'
+
+    lat, pf, slip = model.latency, model.partial_fill, model.slippage
+    slip_mode = slip.mode
+
+    order_value = qtys * prices
+    use_latency = lat.enabled and latency
+    use_pf = np.zeros(n, dtype=bool)
+    if pf.enabled:
+        use_pf = ~(order_value < pf.threshold)
+    use_slip_rand = slip.enabled and slip_mode == 'random'
+
+    # 随机数: 每笔按 (延迟, 部分成交, 随机滑点) 的顺序取, 与逐笔路径一致
+    draws = int(use_latency) + use_pf.astype(np.int64) + int(use_slip_rand)
+    offsets = np.concatenate(([0], np.cumsum(draws)[:-1])) if n else np.zeros(0, dtype=np.int64)
+    if seeds is None:
+        uniforms = _draw_uniforms(rng, int(draws.sum()))
+    else:
+        uniforms = _seeded_uniforms(seeds, draws)
+
+    cursor = offsets.copy()
+    latency_ms = np.zeros(n)
+    if use_latency:
+        min_ms, max_ms = lat.min_ms, lat.max_ms
+        latency_ms = min_ms + (max_ms - min_ms) * uniforms[cursor]
+        cursor = cursor + 1
+
+    filled_qty = qtys.copy()
+    fill_rate = np.ones(n)
+    if use_pf.any():
+        min_rate, max_rate = pf.min_rate, pf.max_rate
+        idx = np.flatnonzero(use_pf)
+        raw_rate = min_rate + (max_rate - min_rate) * uniforms[cursor[idx]]
+        filled_qty[idx] = np.maximum(1, np.trunc(qtys[idx] * raw_rate)).astype(np.int64)
+        fill_rate[idx] = _round_like_python(raw_rate, 2)
+        cursor[idx] += 1
+
+    if not slip.enabled:
+        exec_price, slippage = prices.copy(), np.zeros(n)
+    else:
+        value = slip.value
+        if slip_mode == 'percentage':
+            slip_amount = prices * value / 100
+        elif slip_mode == 'fixed':
+            slip_amount = np.full(n, float(value))
+        elif slip_mode == 'random':
+            slip_amount = prices * value / 100 * uniforms[cursor]
+        else:
+            slip_amount = np.zeros(n)
+        exec_price = _round_like_python(np.where(is_buy, prices + slip_amount, prices - slip_amount), 4)
+        slippage = _round_like_python(slip_amount.astype(float), 4)
+
+    filled_value = filled_qty * exec_price
+    commission = _batch_commission(filled_value, model.commission)
+    total_cost = np.where(is_buy, filled_value + commission, filled_value - commission)
+
+    return {
+        'symbol': symbols,
+        'side': sides,
+        'requested_qty': qtys,
+        'filled_qty': filled_qty,
+        'fill_rate': fill_rate,
+        'requested_price': prices,
+        'exec_price': exec_price,
+        'slippage': slippage,
+        'filled_value': _round_like_python(filled_value, 2),
+        'commission': commission,
+        'total_cost': _round_like_python(total_cost, 2),
+        'partial_fill': filled_qty < qtys,
+        'latency_ms': latency_ms,
+    }
+
+
+def _draw_uniforms(rng, count: int) -> np.ndarray:
+    """
+    count 个 [0, 1) 随机数, 与 rng.random() 连续调用 count 次的序列相同, 并推进 rng 状态。
+    random.Random 与 numpy RandomState 同为 MT19937 且 53 位浮点构造相同, 直接搬运状态即可。
+    """
+    if count == 0:
+        return np.zeros(0)
+    state = rng.getstate()
+    rs = np.random.RandomState()
+    rs.set_state(('MT19937', np.array(state[1][:-1], dtype=np.uint32), state[1][-1]))
+    values = rs.random_sample(count)
+    _, keys, pos = rs.get_state()[:3]
+    rng.setstate((state[0], tuple(int(k) for k in keys) + (int(pos),), state[2]))
+    return values
+
+
+def _seeded_uniforms(seeds, draws: np.ndarray) -> np.ndarray:
+    """每笔订单从自己的 order_rng(seed) 取 draws[i] 个 [0, 1) 随机数, 按订单顺序拼接 (布局同 _draw_uniforms)"""
+    out = []
+    for seed, count in zip(seeds, draws.tolist()):
+        if count:
+            order = order_rng(int(seed))
+            out.extend(order.random() for _ in range(count))
+    return np.asarray(out, dtype=float)
+
+
+def batch_to_records(batch: Dict[str, np.ndarray]) -> list:
+    """simulate_execution_batch 结果转为 simulate_execution 同格式的 dict 列表 (Python 标量类型)"""
+    keys = [k for k in batch if k != 'latency_ms']
+    columns = {k: batch[k].tolist() for k in keys}
+    return [{k: columns[k][i] for k in keys} for i in range(len(batch['requested_qty']))]
+
+
 def get_simulation_status() -> Dict[str, Any]:
     """获取模拟配置状态"""
     config = get_config()
     
     return {
         'preset': config.get('_preset'),  # 当前使用的预设名 (None = 自定义)
+        'overridden': _override,  # set_config 覆盖中 (文件修改暂不生效)
         'slippage': {
             'enabled': config.get('slippage', {}).get('enabled', False),
             'mode': config.get('slippage', {}).get('mode', 'percentage'),
@@ -0,0 +1,181 @@
+"""
+PPT parameter sweep: replay one signal file under several simulation configs in parallel and compare the results.
+
+Used for: evaluating a strategy under the YAML presets (ideal, us_retail, hk_stock, volatile, ...) and custom
+slippage / commission grids in one command, instead of one full sim run per config after another.
+
+Usage:
+    python -m core.sweep SIGNALS [--presets ideal,us_retail,hk_stock,volatile] [--slippage 0.01,0.05,0.1]
+                         [--commission 0.0005,0.001] [--base PRESET] [--workers N] [--seed N] [--out DIR] [--json]
+
+Functions:
+    build_runs(presets=(), slippage=(), commission=(), base=None) -> List[Tuple[str, Dict]]
+        (label, simulation config) per run: each preset as defined, then the slippage x commission grid on the base
+    run_sweep(signals_path, runs, workers=None, seed=0, out_dir=None, account='replay', capital=DEFAULT_CAPITAL)
+        -> List[Dict]    One core.replay.run_replay per run in a process pool; rows in run order
+    format_table(rows) -> str     Comparison table: equity, PnL, Sharpe, return / volatility, drawdown, trades, costs
+
+Features:
+    - Process pool (spawn start method), default one worker per CPU; each run is a separate replay with its own
+      SQLite file under out_dir (default: new temp dir), runs share only the signal file and the bar / DMS disk caches
+    - Grid: slippage values are percentage-mode values (0.05 = 0.05%), commission values percentage-mode rates
+      (0.001 = 0.1%, the base minimum is kept); an empty axis keeps the base setting
+    - Every run uses the same seed (core.simulation account streams), so configs are compared on the same fill draws
+      and a run reproduces exactly in any worker
+    - Rows carry the replay report with get_full_analytics per account (--json prints everything); a failed run is
+      a row with 'error' and does not stop the others
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from . import db as database
+from . import simulation
+from .replay import load_signals, run_replay
+
+DEFAULT_PRESETS = ('ideal', 'us_retail', 'hk_stock', 'volatile')
+
+
+def build_runs(presets: Iterable[str] = (), slippage: Iterable[float] = (), commission: Iterable[float] = (),
+               base: Optional[str] = None) -> List[Tuple[str, Dict[str, Any]]]:
+    """Run list: presets (KeyError if unknown), then every slippage x commission combination on base (preset name or
+    None = active config)."""
+    runs = [(name, simulation.preset_config(name)) for name in presets]
+    slippage, commission = list(slippage), list(commission)
+    if slippage or commission:
+        base_config = simulation.preset_config(base) if base else dict(simulation.get_config())
+        base_label = base or base_config.get('_preset') or 'custom'
+        for slip, rate in itertools.product(slippage or [None], commission or [None]):
+            config = dict(base_config, _preset=None)
+            parts = []
+            if slip is not None:
+                config['slippage'] = {'enabled': slip > 0, 'mode': 'percentage', 'value': slip}
+                parts.append(f'slip={slip}%')
+            if rate is not None:
+                minimum = base_config.get('commission', {}).get('minimum', 0)
+                config['commission'] = {'enabled': rate > 0, 'mode': 'percentage', 'rate': rate, 'minimum': minimum}
+                parts.append(f'comm={rate * 100:g}%')
+            runs.append((f"{base_label}:{','.join(parts)}", config))
+    return runs
+
+
+def _run_one(job: Tuple) -> Dict[str, Any]:
+    """Pool worker: one replay into its own database."""
+    label, config, signals_path, db_path, seed, account, capital = job
+    report = run_replay(load_signals(signals_path), db_path=db_path, account=account, capital=capital,
+                        config=config, seed=seed)
+    return {'run': label, 'config': config, **report}
+
+
+def run_sweep(signals_path: str, runs: List[Tuple[str, Dict[str, Any]]], workers: Optional[int] = None,
+              seed: Optional[int] = 0, out_dir: Optional[str] = None, account: str = 'replay',
+              capital: float = database.DEFAULT_CAPITAL) -> List[Dict[str, Any]]:
+    """Replay signals_path once per (label, config) in a process pool (workers default: CPU count, at most one per run)."""
+    if not runs:
+        return []
+    out_dir = out_dir or tempfile.mkdtemp(prefix='ppt_sweep_')
+    os.makedirs(out_dir, exist_ok=True)
+    signals_path = os.path.abspath(signals_path)
+    jobs = []
+    for i, (label, config) in enumerate(runs):
+        slug = re.sub(r'[^A-Za-z0-9_.=-]+', '_', label).strip('_')
+        jobs.append((label, config, signals_path, os.path.join(out_dir, f'{i:02d}_{slug}.db'), seed, account, capital))
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+    # spawn: workers start clean (no inherited DB connections, locks or background threads of this process)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [pool.submit(_run_one, job) for job in jobs]
+        rows = []
+        for job, future in zip(jobs, futures):
+            try:
+                rows.append(future.result())
+            except Exception as e:
+                rows.append({'run': job[0], 'config': job[1], 'db': job[3], 'error': f'{type(e).__name__}: {e}'})
+    return rows
+
+
+def _fmt(value, spec: str = '') -> str:
+    if value is None:
+        return '-'
+    if isinstance(value, float) and value == float('inf'):
+        return 'inf'
+    return format(value, spec)
+
+
+def format_table(rows: List[Dict[str, Any]]) -> str:
+    """One line per (run, account)."""
+    header = ('run', 'account', 'equity', 'pnl%', 'sharpe', 'ann.ret%', 'vol%', 'max_dd%', 'trades', 'win%', 'pf',
+              'commission', 'slippage', 'sig/s')
+    lines = []
+    for row in rows:
+        if 'error' in row:
+            lines.append((row['run'], '-', f"error: {row['error']}") + ('',) * (len(header) - 3))
+            continue
+        for name, acc in row['accounts'].items():
+            stats = acc.get('analytics') or {}
+            sharpe, dd, trades = stats.get('sharpe', {}), stats.get('drawdown', {}), stats.get('trade_stats', {})
+            costs = acc.get('costs') or {}
+            lines.append((row['run'], name, _fmt(acc['equity'], ',.2f'), _fmt(acc['pnl_pct'], '.2f'),
+                          _fmt(sharpe.get('sharpe_ratio'), '.2f'), _fmt(sharpe.get('annual_return'), '.2f'),
+                          _fmt(sharpe.get('volatility'), '.2f'), _fmt(dd.get('max_drawdown'), '.2f'),
+                          _fmt(trades.get('total_trades')), _fmt(trades.get('win_rate'), '.1f'),
+                          _fmt(trades.get('profit_factor'), '.2f'), _fmt(costs.get('total_commission'), ',.2f'),
+                          _fmt(costs.get('total_slippage'), ',.2f'), _fmt(row['signals_per_sec'], '.0f')))
+    widths = [max(len(str(r[i])) for r in [header] + lines) for i in range(len(header))]
+    out = ['  '.join(str(v).ljust(w) if i < 2 else str(v).rjust(w) for i, (v, w) in enumerate(zip(r, widths)))
+           for r in [header] + lines]
+    out.insert(1, '  '.join('-' * w for w in widths))
+    return '\n'.join(out)
+
+
+def _floats(text: str) -> List[float]:
+    return [float(x) for x in (text or '').split(',') if x.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m core.sweep',
+                                     description='Replay a signal file under several simulation configs in parallel.')
+    parser.add_argument('signals', help='CSV (header row) or NDJSON signal file (see core.replay)')
+    parser.add_argument('--presets', default=','.join(DEFAULT_PRESETS),
+                        help='comma-separated config/simulation.yaml presets ("" for none)')
+    parser.add_argument('--slippage', default='', help='grid: slippage values in percent, e.g. 0.01,0.05,0.1')
+    parser.add_argument('--commission', default='', help='grid: commission rates, e.g. 0.0005,0.001')
+    parser.add_argument('--base', help='preset the grid starts from (default: active config)')
+    parser.add_argument('--workers', type=int, help='processes (default: CPU count)')
+    parser.add_argument('--seed', type=int, default=0, help='fill RNG seed, same for every run')
+    parser.add_argument('--out', help='directory for the per-run databases (default: new temp dir)')
+    parser.add_argument('--account', default='replay', help='account for signals without one')
+    parser.add_argument('--capital', type=float, default=database.DEFAULT_CAPITAL)
+    parser.add_argument('--json', action='store_true', help='print all rows (with full analytics) as JSON')
+    args = parser.parse_args(argv)
+
+    try:
+        runs = build_runs([p.strip() for p in args.presets.split(',') if p.strip()], _floats(args.slippage),
+                          _floats(args.commission), base=args.base)
+    except KeyError as e:
+        parser.error(str(e.args[0]))
+    if not runs:
+        parser.error('nothing to run: give --presets and/or --slippage / --commission')
+    start = time.perf_counter()
+    rows = run_sweep(args.signals, runs, workers=args.workers, seed=args.seed, out_dir=args.out,
+                     account=args.account, capital=args.capital)
+    wall = time.perf_counter() - start
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2, default=str))
+        return 0
+    print(format_table(rows))
+    busy = sum(row.get('seconds') or 0 for row in rows)
+    workers = max(1, min(args.workers or os.cpu_count() or 1, len(runs)))
+    print(f"\nruns={len(rows)} workers={workers} wall={wall:.2f}s (replay time summed over runs {busy:.2f}s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,27 +5,41 @@ Used for: all PPT API and simulation; current time/sim delegated to core.ctrl (s
 
 Functions:
     normalize_symbol(symbol) -> str                     Normalize to ZuiLow/Futu format (e.g. 0700.HK -> HK.00700)
-    get_quote(symbol) -> dict                           Get quote from DMS (last bar Close); uses sync time (sim/real); dict with price, valid, error
-    get_quotes_batch(symbols, max_workers=5) -> dict    Batch quotes from DMS (one read/batch); returns {symbol: quote_dict}
+    get_quote(symbol, allow_stale=True) -> dict         Get quote from DMS (last bar Close); uses sync time (sim/real); dict with price, valid, error
+    get_quotes_batch(symbols, max_workers=5, allow_stale=True) -> dict   Batch quotes from DMS (chunked, concurrent); returns {symbol: quote_dict}
     get_current_datetime_iso() -> str                   Current time (via ctrl); sim: tick or stime; real: now() UTC; ISO str
     get_equity_date() -> date                           Current date (via ctrl.get_current_dt().date())
     is_sim_mode() -> bool                               True if simulation mode (via ctrl)
     set_sim_now_iso(iso) -> None                        Set sim-time in ctrl (tick context); called when X-Simulation-Time arrives
+    apply_quote_fallback(quotes, symbols, positions=None) -> dict   Invalid quotes -> watchlist last_price, then cost
+    get_single_flight_stats() -> dict                   Quote fetches vs duplicate requests collapsed onto an in-flight fetch
+    add_quote_listener(fn)                              fn({symbol: price}) for the valid quotes of every get_quote /
+                                                        get_quotes_batch call (core.order_book trigger evaluation)
 
 Features:
     - Quotes from DMS only (POST /api/dms/read/batch, last bar Close); set DMS_BASE_URL. Sim: pass as_of for price date.
+    - HTTP via core.dms_client (pooled keep-alive session, retry/backoff, chunked concurrent read/batch).
+    - Concurrent requests for the same (symbol, as_of) share one in-flight DMS fetch (single-flight); batch callers
+      fetch only the symbols no one else is fetching.
+    - DMS calls run under a latency budget and circuit breaker (core.dms_client); valuation callers then use
+      apply_quote_fallback, and fallback quotes say so ('fallback': 'watchlist' | 'cost').
+    - Sim (as_of set): quotes come from core.bar_cache (prefetched OHLCV, bisect by as_of); only uncovered ranges hit DMS.
+    - Quotes go through core.quote_cache (TTL, stale-while-revalidate, sim as_of buckets); only cache misses hit DMS.
 """
 import os
+import threading
 import time
 import logging
 from datetime import datetime, timedelta, timezone
 
 _logger = logging.getLogger(__name__)
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import date
 from typing import Optional, Union
 
+from . import bar_cache
 from . import ctrl
+from . import dms_client
+from . import quote_cache
 
 # Re-export time/sim from ctrl so callers keep using core.utils
 def is_sim_mode() -> bool:
@@ -108,104 +122,230 @@ def _dms_base_and_headers():
     return base, headers
 
 
+def _quote_window(as_of_iso: Optional[str]):
+    """(start_date, end_date) ISO strings for the last-close lookup: 7 days up to as_of (or now)."""
+    end_dt = datetime.fromisoformat(as_of_iso.replace("Z", "+00:00")) if as_of_iso else datetime.now(timezone.utc)
+    return (end_dt - timedelta(days=7)).isoformat(), end_dt.isoformat()
+
+
+def _parse_last_close(symbol: str, raw: Optional[dict]) -> dict:
+    """Quote dict from one symbol's read/batch entry (last bar Close)."""
+    if not raw or not raw.get("data"):
+        _logger.info("quote dms: symbol=%s -> no data", symbol)
+        return {"symbol": symbol, "price": 0, "error": "no data", "valid": False}
+    records = raw["data"]
+    last = records[-1] if isinstance(records[-1], dict) else {}
+    price = last.get("Close") or last.get("close")
+    if price is None:
+        _logger.info("quote dms: symbol=%s -> no Close in last bar", symbol)
+        return {"symbol": symbol, "price": 0, "error": "no Close", "valid": False}
+    p = float(price)
+    if p <= 0:
+        _logger.info("quote dms: symbol=%s -> invalid price=%s", symbol, p)
+        return {"symbol": symbol, "price": 0, "error": "invalid price", "valid": False}
+    _logger.info("quote dms: symbol=%s -> price=%s", symbol, p)
+    return {"symbol": symbol, "price": p, "change": 0, "change_pct": 0, "name": symbol, "currency": "USD", "valid": True}
+
+
 def _quote_from_dms(symbol: str, dms_base: str, as_of_iso: Optional[str], headers: dict) -> dict:
     """
     Fetch quote from DMS: POST read/batch for one symbol, use last bar Close.
     as_of_iso: in sim mode pass current sim time so DMS caps data; real mode None.
     """
     try:
-        import requests
-        end_dt = datetime.fromisoformat(as_of_iso.replace("Z", "+00:00")) if as_of_iso else datetime.now(timezone.utc)
-        start_dt = end_dt - timedelta(days=7)
-        url = f"{dms_base}/api/dms/read/batch"
-        payload = {
-            "symbols": [symbol],
-            "start_date": start_dt.isoformat(),
-            "end_date": end_dt.isoformat(),
-            "interval": "1d",
-        }
-        if as_of_iso:
-            payload["as_of"] = as_of_iso
-        r = requests.post(url, json=payload, timeout=10, headers={**headers, "Content-Type": "application/json"})
-        if r.status_code != 200:
-            _logger.info("quote dms: symbol=%s -> HTTP %s", symbol, r.status_code)
-            return {"symbol": symbol, "price": 0, "error": f"HTTP {r.status_code}", "valid": False}
-        data = r.json()
-        raw = data.get(symbol)
-        if not raw or not raw.get("data"):
-            _logger.info("quote dms: symbol=%s -> no data", symbol)
-            return {"symbol": symbol, "price": 0, "error": "no data", "valid": False}
-        records = raw["data"]
-        last = records[-1] if isinstance(records[-1], dict) else {}
-        price = last.get("Close") or last.get("close")
-        if price is None:
-            _logger.info("quote dms: symbol=%s -> no Close in last bar", symbol)
-            return {"symbol": symbol, "price": 0, "error": "no Close", "valid": False}
-        p = float(price)
-        if p <= 0:
-            _logger.info("quote dms: symbol=%s -> invalid price=%s", symbol, p)
-            return {"symbol": symbol, "price": 0, "error": "invalid price", "valid": False}
-        _logger.info("quote dms: symbol=%s -> price=%s", symbol, p)
-        return {
-            "symbol": symbol,
-            "price": p,
-            "change": 0,
-            "change_pct": 0,
-            "name": symbol,
-            "currency": "USD",
-            "valid": True,
-        }
+        start_date, end_date = _quote_window(as_of_iso)
+        data = dms_client.read_batch(dms_base, headers, [symbol], start_date, end_date, "1d", as_of_iso, timeout=10)
+        return _parse_last_close(symbol, data.get(symbol))
     except Exception as e:
         _logger.info("quote dms: symbol=%s -> error=%s", symbol, e)
         return {"symbol": symbol, "price": 0, "error": str(e), "valid": False}
 
 
-def _quotes_batch_from_dms(symbols: list, dms_base: str, as_of_iso: Optional[str], headers: dict) -> dict:
-    """One POST read/batch for all symbols; parse last bar Close per symbol. Returns {symbol: quote_dict}."""
+def _quotes_batch_from_dms(symbols: list, dms_base: str, as_of_iso: Optional[str], headers: dict,
+                           max_workers: Optional[int] = None) -> dict:
+    """
+    POST read/batch in DMS_BATCH_CHUNK_SIZE chunks (at most max_workers concurrent); parse last bar Close per symbol.
+    Returns {symbol: quote_dict}; symbols of a failed chunk get that chunk's error.
+    """
     if not symbols:
         return {}
     try:
-        import requests
-        end_dt = datetime.fromisoformat(as_of_iso.replace("Z", "+00:00")) if as_of_iso else datetime.now(timezone.utc)
-        start_dt = end_dt - timedelta(days=7)
-        url = f"{dms_base}/api/dms/read/batch"
-        payload = {
-            "symbols": symbols,
-            "start_date": start_dt.isoformat(),
-            "end_date": end_dt.isoformat(),
-            "interval": "1d",
-        }
-        if as_of_iso:
-            payload["as_of"] = as_of_iso
-        r = requests.post(url, json=payload, timeout=15, headers={**headers, "Content-Type": "application/json"})
-        if r.status_code != 200:
-            _logger.info("quotes_batch dms: HTTP %s", r.status_code)
-            return {s: {"symbol": s, "price": 0, "error": f"HTTP {r.status_code}", "valid": False} for s in symbols}
-        data = r.json()
-        result = {}
-        for s in symbols:
-            raw = data.get(s)
-            if not raw or not raw.get("data"):
-                result[s] = {"symbol": s, "price": 0, "error": "no data", "valid": False}
-                continue
-            records = raw["data"]
-            last = records[-1] if isinstance(records[-1], dict) else {}
-            price = last.get("Close") or last.get("close")
-            if price is not None and float(price) > 0:
-                p = float(price)
-                result[s] = {"symbol": s, "price": p, "change": 0, "change_pct": 0, "name": s, "currency": "USD", "valid": True}
-                _logger.info("quote dms: symbol=%s -> price=%s", s, p)
-            else:
-                result[s] = {"symbol": s, "price": 0, "error": "no Close", "valid": False}
-        return result
+        start_date, end_date = _quote_window(as_of_iso)
+        data, errors = dms_client.read_batch_chunked(dms_base, headers, symbols, start_date, end_date, "1d", as_of_iso,
+                                                     timeout=15, max_workers=max_workers)
     except Exception as e:
         _logger.info("quotes_batch dms: error=%s", e)
         return {s: {"symbol": s, "price": 0, "error": str(e), "valid": False} for s in symbols}
+    result = {}
+    for s in symbols:
+        if s in errors:
+            result[s] = {"symbol": s, "price": 0, "error": errors[s], "valid": False}
+        else:
+            result[s] = _parse_last_close(s, data.get(s))
+    return result
+
+
+_QUOTE_INTERVAL = "1d"
+
+
+def _fetch_quotes(symbols: list, dms_base: str, as_of_iso: Optional[str], headers: dict,
+                  max_workers: Optional[int] = None) -> dict:
+    result = {}
+    if as_of_iso:
+        # sim: answer from the local bar cache (prefetching missing ranges); the rest goes to DMS as before
+        result = bar_cache.quotes_as_of(
+            symbols, as_of_iso,
+            lambda syms, start, end, budget: dms_client.read_batch_chunked(
+                dms_base, headers, syms, start, end, "1d", end, max_workers=max_workers,
+                deadline=time.monotonic() + budget if budget is not None else None))
+        symbols = [s for s in symbols if s not in result]
+        if not symbols:
+            return result
+    if len(symbols) == 1:
+        result[symbols[0]] = _quote_from_dms(symbols[0], dms_base, as_of_iso, headers)
+    else:
+        result.update(_quotes_batch_from_dms(symbols, dms_base, as_of_iso, headers, max_workers))
+    return result
+
 
+class _SingleFlight:
+    """
+    Collapse concurrent fetches of the same key: the first caller (leader) fetches, later callers wait on its result.
+    claim(keys) -> (owned, waiting); the owner must call complete(owned, results) (also on error).
+    """
 
-def get_quote(symbol: str) -> dict:
+    class _Call:
+        __slots__ = ('event', 'result')
+
+        def __init__(self):
+            self.event = threading.Event()
+            self.result = None
+
+    def __init__(self, wait_timeout: float = 30.0):
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._stats = {'fetched_keys': 0, 'collapsed': 0, 'wait_timeouts': 0}
+
+    def claim(self, keys):
+        owned, waiting = [], {}
+        with self._lock:
+            for key in keys:
+                call = self._inflight.get(key)
+                if call is None:
+                    self._inflight[key] = self._Call()
+                    owned.append(key)
+                else:
+                    waiting[key] = call
+            self._stats['fetched_keys'] += len(owned)
+            self._stats['collapsed'] += len(waiting)
+        return owned, waiting
+
+    def complete(self, owned, results: dict):
+        with self._lock:
+            calls = [(key, self._inflight.pop(key, None)) for key in owned]
+        for key, call in calls:
+            if call is not None:
+                call.result = results.get(key)
+                call.event.set()
+
+    def wait(self, call) -> Optional[dict]:
+        if not call.event.wait(self.wait_timeout):
+            with self._lock:
+                self._stats['wait_timeouts'] += 1
+            return None
+        return call.result
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._inflight)
+        return stats
+
+
+_quote_flight = _SingleFlight(wait_timeout=dms_client.DMS_LATENCY_BUDGET_SEC + 1)
+
+
+def get_single_flight_stats() -> dict:
+    """Quote single-flight counters: fetched_keys, collapsed (duplicate requests served by another caller's fetch)."""
+    return _quote_flight.stats()
+
+
+def _fetch_quotes_shared(symbols: list, dms_base: str, as_of_iso: Optional[str], headers: dict,
+                         max_workers: Optional[int] = None) -> dict:
+    """
+    _fetch_quotes through the single-flight layer keyed by (symbol, as_of): fetch only symbols nobody else is
+    fetching, then wait for the rest.
+    """
+    owned, waiting = _quote_flight.claim([(s, as_of_iso) for s in symbols])
+    result = {}
+    if owned:
+        fetched = {}
+        try:
+            fetched = _fetch_quotes([s for s, _ in owned], dms_base, as_of_iso, headers, max_workers)
+        finally:
+            _quote_flight.complete(owned, {(s, as_of_iso): fetched.get(s) for s, _ in owned})
+        result.update(fetched)
+    for (s, _), call in waiting.items():
+        q = _quote_flight.wait(call)
+        result[s] = q or {"symbol": s, "price": 0, "error": "in-flight fetch failed", "valid": False}
+    return result
+
+
+def _cached_quotes(symbols: list, dms_base: str, as_of_iso: Optional[str], headers: dict, allow_stale: bool,
+                   max_workers: Optional[int] = None) -> dict:
+    """
+    Serve from quote_cache; fetch misses from DMS in one call (single-flight) and cache valid results.
+    Stale hits are returned as-is (allow_stale) with a background refresh, else treated as misses.
+    """
+    cache = quote_cache.get_cache()
+    bucket = quote_cache.as_of_bucket(as_of_iso)
+    result, missing, stale = {}, [], []
+    for s in symbols:
+        quote, state = cache.lookup(s, _QUOTE_INTERVAL, bucket)
+        if state == quote_cache.FRESH or (state == quote_cache.STALE and allow_stale):
+            result[s] = quote
+            if state == quote_cache.STALE:
+                stale.append(s)
+        else:
+            missing.append(s)
+    if stale:
+        cache.schedule_refresh(stale, _QUOTE_INTERVAL, bucket,
+                               lambda syms: _fetch_quotes_shared(syms, dms_base, as_of_iso, headers, max_workers))
+    if missing:
+        fetched = _fetch_quotes_shared(missing, dms_base, as_of_iso, headers, max_workers)
+        for s in missing:
+            q = fetched.get(s) or {"symbol": s, "price": 0, "error": "no data", "valid": False}
+            cache.store(s, _QUOTE_INTERVAL, bucket, q)
+            result[s] = q
+    return result
+
+
+_quote_listeners = []
+
+
+def add_quote_listener(fn) -> None:
+    """Register fn({symbol: price}); called with the valid quotes each get_quote / get_quotes_batch returns."""
+    _quote_listeners.append(fn)
+
+
+def _notify_quotes(quotes: dict) -> None:
+    if not _quote_listeners:
+        return
+    prices = {s: float(q['price']) for s, q in quotes.items() if q and q.get('valid') and (q.get('price') or 0) > 0}
+    if not prices:
+        return
+    for fn in list(_quote_listeners):
+        try:
+            fn(prices)
+        except Exception:
+            _logger.exception("quote listener failed")
+
+
+def get_quote(symbol: str, allow_stale: bool = True) -> dict:
     """
     Get quote for one symbol from DMS (last bar Close). Uses sync time: sim mode passes as_of, real mode uses now.
+    Served from the quote cache when possible; allow_stale=False (order pricing) never returns a stale entry.
     Returns invalid quote when DMS_BASE_URL is not set.
     """
     symbol = normalize_symbol(symbol)
@@ -213,12 +353,15 @@ def get_quote(symbol: str) -> dict:
     if not dms_base:
         return {"symbol": symbol, "price": 0, "error": "DMS_BASE_URL not set", "valid": False}
     as_of_iso = get_current_datetime_iso() if is_sim_mode() else None
-    return _quote_from_dms(symbol, dms_base, as_of_iso, headers)
+    quotes = _cached_quotes([symbol], dms_base, as_of_iso, headers, allow_stale)
+    _notify_quotes(quotes)
+    return quotes[symbol]
 
 
-def get_quotes_batch(symbols: list, max_workers: int = 5) -> dict:
+def get_quotes_batch(symbols: list, max_workers: int = 5, allow_stale: bool = True) -> dict:
     """
-    Get quotes for multiple symbols from DMS (one read/batch). Uses sync time: sim passes as_of, real uses now.
+    Get quotes for multiple symbols from DMS (cache misses only; chunked read/batch, max_workers chunks in flight).
+    Uses sync time: sim passes as_of, real uses now.
     When DMS_BASE_URL is not set, each symbol returns invalid.
     """
     if not symbols:
@@ -227,6 +370,33 @@ def get_quotes_batch(symbols: list, max_workers: int = 5) -> dict:
     if not dms_base:
         return {s: {"symbol": s, "price": 0, "error": "DMS_BASE_URL not set", "valid": False} for s in symbols}
     as_of_iso = get_current_datetime_iso() if is_sim_mode() else None
-    if len(symbols) == 1:
-        return {symbols[0]: _quote_from_dms(symbols[0], dms_base, as_of_iso, headers)}
-    return _quotes_batch_from_dms(symbols, dms_base, as_of_iso, headers)
+    quotes = _cached_quotes(list(dict.fromkeys(symbols)), dms_base, as_of_iso, headers, allow_stale, max_workers)
+    _notify_quotes(quotes)
+    return quotes
+
+
+def apply_quote_fallback(quotes: dict, symbols, positions: Optional[dict] = None, watchlist: Optional[dict] = None) -> dict:
+    """
+    Replace missing/invalid quotes (DMS down, breaker open, budget exceeded, no data) in place:
+    watchlist last_price first, then position cost (avg_price) when positions are given.
+    Fallback quotes are valid=True and carry 'fallback': 'watchlist' | 'cost' plus the original 'error'.
+    Returns {symbol: 'watchlist' | 'cost'} for the symbols that used a fallback.
+    """
+    used = {}
+    for sym in symbols:
+        q = quotes.get(sym) or {}
+        if q.get('valid', True) and (q.get('price') or 0) > 0:
+            continue
+        if watchlist is None:
+            from . import db as database
+            watchlist = {w['symbol']: w for w in database.get_watchlist()}
+        error = q.get('error') or 'no quote'
+        last_price = (watchlist.get(sym) or {}).get('last_price') or 0
+        if last_price > 0:
+            quotes[sym] = {'symbol': sym, 'price': last_price, 'valid': True, 'fallback': 'watchlist', 'error': error}
+            used[sym] = 'watchlist'
+        elif positions and sym in positions and (positions[sym].get('avg_price') or 0) > 0:
+            quotes[sym] = {'symbol': sym, 'price': positions[sym]['avg_price'], 'valid': True, 'fallback': 'cost',
+                           'error': error}
+            used[sym] = 'cost'
+    return used
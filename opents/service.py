@@ -95,8 +95,9 @@ def collect_account_data(account_name: str, quotes: Dict = None) -> Dict[str, An
         return {}
     
     positions = database.get_positions(account_name)
-    orders = database.get_orders(account_name, limit=10000)
-    trades = database.get_trades(account_name, limit=10000)
+    # 全量记录 (keyset 分批读取，不再截断于 10000 条)
+    orders = list(database.iter_orders(account_name, descending=True))
+    trades = list(database.iter_trades(account_name, descending=True))
     equity_history = database.get_equity_history(account_name)
     
     # 获取绩效分析